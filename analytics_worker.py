@@ -0,0 +1,92 @@
+import argparse
+import logging
+import signal
+import threading
+import time
+
+from src.config import Config
+from src.kafka.connection import KafkaConnection
+from src.kafka.supervisor import WorkerReporter
+from src.logging_config import configure_logging
+from src.analytics.analytics_consumer import Analytics
+from src.analytics.product_table import ProductTable
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_TOPIC = 'analytics_events'
+
+
+def load_config(config_class=Config):
+    """The upper-case settings of a config class as a plain dict, the same keys Flask would load."""
+    return {key: getattr(config_class, key) for key in dir(config_class) if key.isupper()}
+
+
+def run_analytics_workers(num_workers, config, stop_event, shutdown_timeout=30):
+    """
+    Runs num_workers analytics consumers in the 'analytics' consumer group until
+    stop_event is set, then lets each worker finish its current batch and commit, within shutdown_timeout seconds in total.
+    The workers share one KafkaConnection and one product table.
+    """
+    kafka_conn = KafkaConnection()
+    if ANALYTICS_TOPIC not in (kafka_conn.list_topics() or []):
+        logger.info(f"Analytics worker: creating Kafka topic '{ANALYTICS_TOPIC}'...")
+        kafka_conn.create_topic(ANALYTICS_TOPIC, num_partitions=config['COMMAND_TOPIC_PARTITIONS'], replication_factor=1)
+
+    product_table = ProductTable(kafka_conn)
+    if not product_table.start():
+        logger.error("Analytics worker: failed to start the product table. Aborting.")
+        return False
+
+    status_table = {}
+    workers = []
+    for i in range(num_workers):
+        consumer = Analytics(kafka_conn=kafka_conn, config=config, product_table=product_table)
+        reporter = WorkerReporter(f"{ANALYTICS_TOPIC}-{i}", status_table, config['CONSUMER_LAG_REPORT_INTERVAL'])
+        thread = threading.Thread(
+            target=consumer.start_consuming,
+            kwargs={'topic_name': ANALYTICS_TOPIC, 'reporter': reporter},
+            name=reporter.worker_name,
+            daemon=True
+        )
+        thread.start()
+        workers.append((consumer, thread))
+    logger.info(f"Analytics worker: started {num_workers} consumers in group '{kafka_conn.get_group_id('analytics')}'.")
+
+    try:
+        while not stop_event.wait(1):
+            if not any(thread.is_alive() for _, thread in workers):
+                logger.error("Analytics worker: all consumers have exited.")
+                break
+    finally:
+        logger.info("Analytics worker: stopping consumers...")
+        for consumer, _ in workers:
+            consumer.stop()
+        deadline = time.monotonic() + shutdown_timeout
+        for consumer, thread in workers:
+            thread.join(max(deadline - time.monotonic(), 0))
+            if thread.is_alive():
+                logger.warning(f"Analytics worker: {thread.name} did not stop within {shutdown_timeout}s.")
+        product_table.stop()
+        logger.info(f"Analytics worker: final status {status_table}")
+    return True
+
+
+if __name__ == '__main__':
+    config = load_config()
+    configure_logging(config)
+
+    parser = argparse.ArgumentParser(description="Standalone analytics consumer, scaled independently of the command consumers.")
+    parser.add_argument('--workers', type=int, default=config['ANALYTICS_CONSUMER_WORKERS'],
+                        help="Number of consumers in the analytics group (default: ANALYTICS_CONSUMER_WORKERS)")
+    args = parser.parse_args()
+
+    stop_event = threading.Event()
+
+    def _request_stop(signum, frame):
+        logger.info(f"Analytics worker: received signal {signum}, shutting down.")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, _request_stop)
+    signal.signal(signal.SIGTERM, _request_stop)
+
+    run_analytics_workers(args.workers, config, stop_event, shutdown_timeout=config['CONSUMER_SHUTDOWN_TIMEOUT'])
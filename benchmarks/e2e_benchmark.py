@@ -0,0 +1,434 @@
+"""
+End-to-end benchmark of the command pipeline: HTTP request, view, Kafka, consumer, database commit,
+and on to the analytics aggregates in Redis. It drives the real ShopViews and OrderViews through the
+Flask test client and runs ProductConsumer and OrderConsumer pools under a ConsumerSupervisor, the
+OutboxRelay and the Analytics consumer in threads. Kafka is the in-process stand-in from
+benchmarks/fake_kafka.py, the database a SQLite file in a temporary directory, and Redis fakeredis.
+
+Phases:
+  seed - --products CreateProductCommands through POST /shop/products/create
+  load - --commands commands from --clients concurrent clients, each sending its next command once
+         the previous one was accepted: orders (POST /shop/product/create-order/...) and, with
+         probability --update-ratio, product updates (POST /shop/products/<id>/update), which reach
+         Kafka through the outbox
+
+Stages, measured per command:
+  http      - request sent -> response received
+  produce   - request sent -> command appended to its topic (for updates this includes the outbox relay)
+  queue     - appended -> received by a consumer
+  handle    - received -> marked applied, i.e. the handler including its DB commit
+  e2e       - request sent -> marked applied
+  analytics - the order's analytics event appended -> folded into the Redis aggregates
+
+Each stage is reported per command type as p50/p99/max in milliseconds; commands_per_second is the
+number of load commands applied divided by the time from the first load request to the last commit.
+fakeredis is much slower than a Redis server, so Redis-heavy stages (analytics above all) are only
+comparable between runs of this benchmark, not with production.
+--json saves the results, and --baseline compares this run against an earlier --json file and exits
+with status 1 if throughput or a p99 got worse by more than --tolerance. Run from the repository root:
+
+    python -m benchmarks.e2e_benchmark [--commands 2000] [--clients 8] [--products 50] [--json results.json]
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from src import create_app, db
+from src.analytics.analytics_consumer import Analytics
+from src.config import Config
+from src.kafka.supervisor import ConsumerSupervisor
+from src.metrics import DB_COMMIT_DURATION
+from src.redis.redis_connection import RedisConnection
+from src.Shop.command_status import APPLIED, FAILED, REJECTED, CommandStatusStore
+from src.Shop.model import Products
+from src.Shop.order_consumer import OrderConsumer
+from src.Shop.outbox import OutboxRelay
+from src.Shop.product_consumer import ProductConsumer
+from src.Shop.views import UPLOAD_FOLDER
+
+from benchmarks.fake_kafka import FakeBroker, FakeKafkaConnection
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+STAGES = ('http', 'produce', 'queue', 'handle', 'e2e', 'analytics')
+JSON_HEADERS = {'Accept': 'application/json'}
+
+# The smallest valid PNG, uploaded as every seeded product's image
+PNG_1X1 = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082'
+)
+
+
+class _TimedStatusStore(CommandStatusStore):
+    """Remembers when each command was first marked applied, rejected or failed, i.e. right after the consumer's commit."""
+    def __init__(self, redis_conn, ttl=3600):
+        super().__init__(redis_conn, ttl=ttl)
+        self._lock = threading.Lock()
+        self.finished = {}
+
+    def set_status(self, command_id, status, command_type=None, error=None, **details):
+        if status in (APPLIED, REJECTED, FAILED):
+            finished_at = time.perf_counter()
+            with self._lock:
+                self.finished.setdefault(command_id, (finished_at, status))
+        return super().set_status(command_id, status, command_type, error=error, **details)
+
+    def finished_count(self):
+        with self._lock:
+            return len(self.finished)
+
+
+class _TimedAnalytics(Analytics):
+    """Remembers when each analytics event was folded into the aggregates."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.folded = {}
+
+    def handle_analytics_batch(self, msgs):
+        super().handle_analytics_batch(msgs)
+        folded_at = time.perf_counter()
+        for msg in msgs:
+            self.folded[(msg.partition(), msg.offset())] = folded_at
+
+
+def _benchmark_config(database_path, args):
+    return type('BenchmarkConfig', (Config,), {
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + database_path,
+        'WTF_CSRF_ENABLED': False,
+        'LOG_LEVEL': args.log_level,
+        'LOG_ASYNC': True,
+        'ORDER_BATCH_SIZE': args.order_batch_size,
+        'COMMAND_TOPIC_PARTITIONS': args.partitions,
+        'CONSUMER_METRICS_PORT': 0,
+    })
+
+
+def _wait_until(condition, timeout, interval=0.01):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(interval)
+    return True
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+
+    def rank(q):
+        return round(values[min(int(q * len(values)), len(values) - 1)] * 1000, 3)
+    return {'p50': rank(0.50), 'p99': rank(0.99), 'max': round(values[-1] * 1000, 3)}
+
+
+class Pipeline:
+    """The web app, consumers, outbox relay and analytics consumer of one run, wired to a FakeBroker."""
+    def __init__(self, config_class, args):
+        self.args = args
+        self.broker = FakeBroker(default_partitions=args.partitions)
+        for topic in ('product_commands', 'order_commands'):
+            self.broker.create_topic(topic, args.partitions)
+        self.kafka_conn = FakeKafkaConnection(self.broker)
+
+        redis_server = fakeredis.FakeServer()
+        self.app = create_app(
+            config_class,
+            kafka_connection=self.kafka_conn,
+            redis_connection=RedisConnection(client=fakeredis.FakeStrictRedis(server=redis_server, decode_responses=True))
+        )
+        self.status_store = self.app.command_status = _TimedStatusStore(
+            self.app.redis_connection, ttl=self.app.config['COMMAND_STATUS_TTL']
+        )
+
+        self.supervisor = ConsumerSupervisor(self.app, mode='thread', lag_report_interval=3600)
+        self.supervisor.add_pool('product_commands', ProductConsumer, args.product_workers, args.partitions)
+        self.supervisor.add_pool('order_commands', OrderConsumer, args.order_workers, args.partitions)
+        self.outbox_relay = OutboxRelay(
+            self.app, self.kafka_conn,
+            batch_size=self.app.config['OUTBOX_BATCH_SIZE'],
+            poll_interval=args.outbox_poll_interval
+        )
+        self.analytics = _TimedAnalytics(
+            kafka_conn=self.kafka_conn,
+            config=self.app.config,
+            redis_conn=RedisConnection(client=fakeredis.FakeStrictRedis(server=redis_server, decode_responses=True))
+        )
+        self.analytics_thread = threading.Thread(target=self.analytics.start_consuming, name='analytics', daemon=True)
+
+    def start(self):
+        self.supervisor.start()
+        self.outbox_relay.start()
+        self.analytics_thread.start()
+
+    def stop(self):
+        self.outbox_relay.stop()
+        self.analytics.stop()
+        self.supervisor.shutdown(timeout=self.app.config['CONSUMER_SHUTDOWN_TIMEOUT'])
+        self.analytics_thread.join(self.app.config['CONSUMER_SHUTDOWN_TIMEOUT'])
+
+    def wait_for_commands(self, count, timeout):
+        return _wait_until(lambda: self.status_store.finished_count() >= count, timeout)
+
+    def wait_for_analytics(self, timeout):
+        return _wait_until(lambda: len(self.analytics.folded) >= len(self.broker.messages('analytics_events')), timeout)
+
+
+def seed_products(pipeline, count):
+    """Creates count products through the create endpoint. Returns {command_id: (command type, sent, received)}."""
+    client = pipeline.app.test_client()
+    requests = {}
+    for index in range(count):
+        sent = time.perf_counter()
+        response = client.post('/shop/products/create', headers=JSON_HEADERS, data={
+            'name': f"Benchmark product {index}",
+            'price': f"{5 + index % 95}.99",
+            'description': 'A product created by the end-to-end benchmark.',
+            'stock_quantity': 100000,
+            'image': (io.BytesIO(PNG_1X1), 'product.png'),
+        }, content_type='multipart/form-data')
+        received = time.perf_counter()
+        if response.status_code in (200, 202):
+            requests[response.get_json()['command_id']] = ('CreateProductCommand', sent, received)
+    return requests
+
+
+def run_load(pipeline, products, args):
+    """
+    Sends args.commands commands from args.clients threads. Returns (requests, updates, errors):
+    requests maps the command_id of every accepted order to (command type, sent, received); updates
+    maps the unique product name each update set to the same, since the update view does not return
+    its command_id.
+    """
+    requests = {}
+    updates = {}
+    errors = []
+    lock = threading.Lock()
+    remaining = [args.commands]
+
+    def client_loop(index):
+        client = pipeline.app.test_client()
+        rng = random.Random(args.seed + index)
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            product_id, price = rng.choice(products)
+            if rng.random() < args.update_ratio:
+                name = f"bench-{uuid.uuid4().hex}"
+                sent = time.perf_counter()
+                response = client.post(f"/shop/products/{product_id}/update", data={
+                    'name': name,
+                    'price': price,
+                    'description': 'A product updated by the end-to-end benchmark.',
+                    'stock_quantity': 100000,
+                })
+                received = time.perf_counter()
+                with lock:
+                    if response.status_code == 302:
+                        updates[name] = ('UpdateProductCommand', sent, received)
+                    else:
+                        errors.append(('UpdateProductCommand', response.status_code))
+            else:
+                sent = time.perf_counter()
+                response = client.post(f"/shop/product/create-order/{product_id}/{price}",
+                                       headers=JSON_HEADERS, data={'quantity': 1})
+                received = time.perf_counter()
+                with lock:
+                    if response.status_code in (200, 202):
+                        requests[response.get_json()['command_id']] = ('CreateOrderCommand', sent, received)
+                    else:
+                        errors.append(('CreateOrderCommand', response.status_code))
+
+    threads = [threading.Thread(target=client_loop, args=(i,), name=f"client-{i}") for i in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return requests, updates, errors
+
+
+def collect_timelines(pipeline, requests, updates):
+    """
+    Joins the client-side timestamps with the broker log and the consumers' records into one
+    {'type', 'status', stage: seconds} row per command.
+    """
+    commands = {}
+    order_commands = {}
+    for topic in ('product_commands', 'order_commands'):
+        for msg in pipeline.broker.messages(topic):
+            command = pipeline.kafka_conn.decode_message(msg)
+            command_id = command['command_id']
+            request = requests.get(command_id)
+            if request is None and command['command_type'] == 'UpdateProductCommand':
+                request = updates.get(command['payload'].get('name'))
+            if request is None or command_id in commands:
+                continue
+            command_type, sent, received = request
+            finished = pipeline.status_store.finished.get(command_id)
+            row = {'type': command_type, 'status': finished[1] if finished else None,
+                   'http': received - sent, 'produce': msg.appended_at - sent}
+            if msg.delivered_at is not None:
+                row['queue'] = msg.delivered_at - msg.appended_at
+                if finished:
+                    row['handle'] = finished[0] - msg.delivered_at
+            if finished:
+                row['e2e'] = finished[0] - sent
+            commands[command_id] = row
+            if command_type == 'CreateOrderCommand':
+                order_commands[command['payload']['order_id']] = row
+
+    for msg in pipeline.broker.messages('analytics_events'):
+        row = order_commands.get(pipeline.kafka_conn.decode_message(msg).get('order_id'))
+        folded_at = pipeline.analytics.folded.get((msg.partition(), msg.offset()))
+        if row is not None and folded_at is not None:
+            row['analytics'] = folded_at - msg.appended_at
+    return commands
+
+
+def summarize(commands):
+    summary = {}
+    for command_type in sorted({row['type'] for row in commands.values()}):
+        rows = [row for row in commands.values() if row['type'] == command_type]
+        summary[command_type] = {
+            'count': len(rows),
+            'applied': sum(row['status'] == APPLIED for row in rows),
+            'rejected': sum(row['status'] == REJECTED for row in rows),
+            'failed': sum(row['status'] == FAILED for row in rows),
+            'unfinished': sum(row['status'] is None for row in rows),
+            'stages_ms': {stage: _percentiles([row[stage] for row in rows if stage in row]) for stage in STAGES},
+        }
+    return summary
+
+
+def run(args):
+    # The create view stores the uploaded images here; anything the run adds is removed again
+    created_upload_folder = not os.path.isdir(UPLOAD_FOLDER)
+    with tempfile.TemporaryDirectory() as workdir:
+        pipeline = Pipeline(_benchmark_config(os.path.join(workdir, 'benchmark.db'), args), args)
+        pipeline.start()
+        try:
+            seed_requests = seed_products(pipeline, args.products)
+            if not pipeline.wait_for_commands(len(seed_requests), args.drain_timeout):
+                raise RuntimeError("Seeded products were not applied in time")
+            with pipeline.app.app_context():
+                products = [(p.id, p.price) for p in Products.query.with_entities(Products.id, Products.price)]
+                image_urls = [url for (url,) in Products.query.with_entities(Products.image_url)]
+                db.session.remove()
+
+            DB_COMMIT_DURATION.clear()
+            load_started = time.perf_counter()
+            requests, updates, errors = run_load(pipeline, products, args)
+            drained = pipeline.wait_for_commands(len(seed_requests) + len(requests) + len(updates), args.drain_timeout)
+            load_finished = max(finished_at for finished_at, _ in pipeline.status_store.finished.values())
+            analytics_drained = pipeline.wait_for_analytics(args.drain_timeout)
+        finally:
+            pipeline.stop()
+
+    for url in image_urls:
+        path = os.path.join(UPLOAD_FOLDER, os.path.basename(url or ''))
+        if url and os.path.exists(path):
+            os.remove(path)
+    if created_upload_folder and os.path.isdir(UPLOAD_FOLDER) and not os.listdir(UPLOAD_FOLDER):
+        os.removedirs(UPLOAD_FOLDER)
+
+    commands = collect_timelines(pipeline, dict(seed_requests, **requests), updates)
+    load_rows = [row for command_id, row in commands.items() if command_id not in seed_requests]
+    commit_samples = {name: value for name, _, value in DB_COMMIT_DURATION.collect()[3] if not name.endswith('_bucket')}
+    commits = commit_samples.get('db_commit_duration_seconds_count', 0)
+    return {
+        'commands': args.commands,
+        'clients': args.clients,
+        'products': args.products,
+        'update_ratio': args.update_ratio,
+        'partitions': args.partitions,
+        'product_workers': args.product_workers,
+        'order_workers': args.order_workers,
+        'order_batch_size': args.order_batch_size,
+        'drained': drained and analytics_drained,
+        'http_errors': len(errors),
+        'commands_per_second': round(sum(row['status'] == APPLIED for row in load_rows) / max(load_finished - load_started, 1e-6), 1),
+        'db_commit_ms_avg': round(commit_samples['db_commit_duration_seconds_sum'] / commits * 1000, 3) if commits else None,
+        'summary': summarize(commands),
+    }
+
+
+def compare(result, baseline, tolerance):
+    """Returns a line per regression: throughput down, or a p99 up, by more than tolerance (a fraction)."""
+    regressions = []
+    old, new = baseline.get('commands_per_second'), result['commands_per_second']
+    if old and new < old * (1 - tolerance):
+        regressions.append(f"commands_per_second {old} -> {new}")
+    for command_type, entry in result['summary'].items():
+        old_stages = baseline.get('summary', {}).get(command_type, {}).get('stages_ms', {})
+        for stage, stats in entry['stages_ms'].items():
+            old_stats = old_stages.get(stage)
+            if stats and old_stats and stats['p99'] > old_stats['p99'] * (1 + tolerance):
+                regressions.append(f"{command_type} {stage} p99 {old_stats['p99']} ms -> {stats['p99']} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--commands', type=int, default=2000)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--products', type=int, default=50)
+    parser.add_argument('--update-ratio', type=float, default=0.1)
+    parser.add_argument('--partitions', type=int, default=Config.COMMAND_TOPIC_PARTITIONS)
+    parser.add_argument('--product-workers', type=int, default=1)
+    parser.add_argument('--order-workers', type=int, default=2)
+    parser.add_argument('--order-batch-size', type=int, default=Config.ORDER_BATCH_SIZE)
+    parser.add_argument('--outbox-poll-interval', type=float, default=Config.OUTBOX_POLL_INTERVAL)
+    parser.add_argument('--drain-timeout', type=float, default=120, help='seconds to wait for the consumers to catch up')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--json', dest='json_path', help='also write the results to this file')
+    parser.add_argument('--baseline', help='results of an earlier run (--json) to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args()
+
+    if fakeredis is None:
+        parser.error("the end-to-end benchmark needs fakeredis (pip install fakeredis)")
+    # The periodic delivery and traffic summaries are noise here
+    os.environ.setdefault('KAFKA_DELIVERY_SUMMARY_INTERVAL', '0')
+    os.environ.setdefault('KAFKA_TRAFFIC_SUMMARY_INTERVAL', '0')
+
+    result = run(args)
+
+    print(f"commands/s: {result['commands_per_second']}  db commit avg: {result['db_commit_ms_avg']} ms  "
+          f"http errors: {result['http_errors']}  drained: {result['drained']}")
+    print(f"{'command':<21} {'stage':<10} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for command_type, entry in result['summary'].items():
+        for stage, stats in entry['stages_ms'].items():
+            if stats:
+                print(f"{command_type:<21} {stage:<10} {stats['p50']:>9} {stats['p99']:>9} {stats['max']:>9}")
+        print(f"{command_type:<21} {entry['count']} commands, {entry['applied']} applied, "
+              f"{entry['rejected']} rejected, {entry['failed']} failed, {entry['unfinished']} unfinished")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION: {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
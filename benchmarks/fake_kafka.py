@@ -0,0 +1,455 @@
+"""
+In-process stand-in for a Kafka cluster, so benchmarks can drive the real views and consumers without
+a broker. FakeKafkaConnection is a KafkaConnection whose producers and consumers talk to a FakeBroker:
+
+  - topics are in-memory partition logs; keyed messages are spread by a CRC32 of the key, unkeyed
+    ones round robin, and topics are created on first use with default_partitions
+  - every produced message is appended (and so acknowledged) at once; delivery callbacks are
+    served by poll() and flush() like librdkafka's
+  - consumer groups split each topic's partitions between their members and keep committed offsets;
+    rebalances run in the next poll() of every member, without a join barrier, so a partition can
+    briefly be read by two members while they move
+  - assign(), seek(), pause()/resume(), store_offsets(), auto-commit and partition EOF events behave
+    like the parts of confluent-kafka this code base uses, and nothing more
+
+Each message also records when it was appended and when a consumer first received it (appended_at,
+delivered_at, both time.perf_counter()), which is what the benchmarks measure queueing with.
+"""
+import collections
+import threading
+import time
+import zlib
+
+from confluent_kafka import KafkaError, KafkaException, OFFSET_BEGINNING, OFFSET_END, OFFSET_INVALID, TopicPartition
+
+from src.kafka.connection import KafkaConnection
+
+TIMESTAMP_CREATE_TIME = 1
+
+
+class FakeMessage:
+    """The parts of confluent_kafka.Message the code uses. EOF events carry an error and no value."""
+    def __init__(self, topic, partition, offset, key=None, value=None, headers=None, error=None):
+        self._topic = topic
+        self._partition = partition
+        self._offset = offset
+        self._key = key
+        self._value = value
+        self._headers = headers
+        self._error = error
+        self._timestamp_ms = int(time.time() * 1000)
+        self._latency = None
+        self.appended_at = time.perf_counter()
+        self.delivered_at = None
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+    def key(self):
+        return self._key
+
+    def value(self):
+        return self._value
+
+    def headers(self):
+        return list(self._headers) if self._headers else None
+
+    def error(self):
+        return self._error
+
+    def timestamp(self):
+        return TIMESTAMP_CREATE_TIME, self._timestamp_ms
+
+    def latency(self):
+        return self._latency
+
+
+class _TopicMetadata:
+    def __init__(self, name, num_partitions):
+        self.topic = name
+        self.partitions = {p: None for p in range(num_partitions)}
+        self.error = None
+
+
+class _ClusterMetadata:
+    def __init__(self, topics):
+        self.topics = topics
+
+
+def _encode(data):
+    return data.encode('utf-8') if isinstance(data, str) else data
+
+
+class FakeBroker:
+    """Partition logs, consumer groups and committed offsets, shared by every client of one benchmark."""
+    def __init__(self, default_partitions=3):
+        self.default_partitions = default_partitions
+        self._cond = threading.Condition()
+        # Bumped on every append and group change, so waiting consumers wake up
+        self._version = 0
+        self._topics = {}
+        self._round_robin = collections.Counter()
+        self._committed = {}
+        self._groups = {}
+
+    def create_topic(self, name, num_partitions=None):
+        with self._cond:
+            self._partitions(name, num_partitions)
+
+    def _partitions(self, topic, num_partitions=None):
+        logs = self._topics.get(topic)
+        if logs is None:
+            logs = self._topics[topic] = [[] for _ in range(num_partitions or self.default_partitions)]
+        return logs
+
+    def topic_names(self):
+        with self._cond:
+            return sorted(self._topics)
+
+    def metadata(self, topic=None):
+        with self._cond:
+            names = [topic] if topic else list(self._topics)
+            return _ClusterMetadata({
+                name: _TopicMetadata(name, len(self._topics[name])) for name in names if name in self._topics
+            })
+
+    def append(self, topic, partition, key, value, headers):
+        with self._cond:
+            logs = self._partitions(topic)
+            if partition is None or partition < 0:
+                if key is None:
+                    partition = self._round_robin[topic] % len(logs)
+                    self._round_robin[topic] += 1
+                else:
+                    partition = zlib.crc32(key) % len(logs)
+            log = logs[partition]
+            msg = FakeMessage(topic, partition, len(log), key, value, headers)
+            log.append(msg)
+            self._version += 1
+            self._cond.notify_all()
+            return msg
+
+    def messages(self, topic):
+        """Every message of topic, partition by partition, for analysing a run afterwards."""
+        with self._cond:
+            return [msg for log in self._topics.get(topic, []) for msg in log]
+
+    def read(self, topic, partition, offset, max_count):
+        with self._cond:
+            return self._topics[topic][partition][offset:offset + max_count]
+
+    def watermarks(self, topic, partition):
+        with self._cond:
+            logs = self._topics.get(topic)
+            if logs is None or partition >= len(logs):
+                raise KafkaException(KafkaError(KafkaError._UNKNOWN_PARTITION))
+            return 0, len(logs[partition])
+
+    def commit(self, group_id, offsets):
+        with self._cond:
+            for (topic, partition), offset in offsets.items():
+                self._committed[(group_id, topic, partition)] = offset
+
+    def committed(self, group_id, topic, partition):
+        with self._cond:
+            return self._committed.get((group_id, topic, partition), OFFSET_INVALID)
+
+    def join(self, group_id, member, topics):
+        with self._cond:
+            group = self._groups.setdefault(group_id, {'generation': 0, 'members': {}})
+            group['members'][member] = list(topics)
+            for topic in topics:
+                self._partitions(topic)
+            self._group_changed(group)
+
+    def leave(self, group_id, member):
+        with self._cond:
+            group = self._groups.get(group_id)
+            if group and group['members'].pop(member, None) is not None:
+                self._group_changed(group)
+
+    def _group_changed(self, group):
+        group['generation'] += 1
+        self._version += 1
+        self._cond.notify_all()
+
+    def assignment(self, group_id, member):
+        """Returns (generation, {(topic, partition)}): the members of each topic share its partitions by index."""
+        with self._cond:
+            group = self._groups[group_id]
+            assigned = set()
+            for topic in group['members'].get(member, []):
+                members = [m for m, topics in group['members'].items() if topic in topics]
+                index = members.index(member)
+                for partition in range(index, len(self._topics[topic]), len(members)):
+                    assigned.add((topic, partition))
+            return group['generation'], assigned
+
+    def generation(self, group_id):
+        with self._cond:
+            return self._groups[group_id]['generation']
+
+    def version(self):
+        with self._cond:
+            return self._version
+
+    def wait(self, version, timeout):
+        """Blocks until something changed since version, or timeout seconds have passed."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._version != version, timeout)
+
+
+class FakeProducer:
+    """Appends to the broker on produce(); delivery callbacks wait for poll() or flush()."""
+    def __init__(self, broker, config=None):
+        self._broker = broker
+        self.config = dict(config or {})
+        self._cond = threading.Condition()
+        self._pending = collections.deque()
+
+    def produce(self, topic, value=None, key=None, partition=-1, on_delivery=None, callback=None,
+                timestamp=0, headers=None):
+        produced_at = time.perf_counter()
+        if isinstance(headers, dict):
+            headers = list(headers.items())
+        headers = [(name, _encode(header)) for name, header in headers] if headers else None
+        msg = self._broker.append(topic, partition, _encode(key), _encode(value), headers)
+        msg._latency = time.perf_counter() - produced_at
+        callback = on_delivery or callback
+        with self._cond:
+            self._pending.append((callback, msg))
+            self._cond.notify_all()
+
+    def poll(self, timeout=None):
+        """Serves the queued delivery callbacks, waiting up to timeout seconds for one. Returns how many were served."""
+        with self._cond:
+            if not self._pending and timeout:
+                self._cond.wait(timeout if timeout > 0 else None)
+            pending, self._pending = self._pending, collections.deque()
+        for callback, msg in pending:
+            if callback:
+                callback(None, msg)
+        return len(pending)
+
+    def flush(self, timeout=None):
+        self.poll(0)
+        return len(self)
+
+    def list_topics(self, topic=None, timeout=-1):
+        return self._broker.metadata(topic)
+
+    def __len__(self):
+        with self._cond:
+            return len(self._pending)
+
+    def __bool__(self):
+        # Like confluent_kafka.Producer: a producer with nothing queued is still truthy
+        return True
+
+
+class FakeConsumer:
+    """A group member (subscribe) or a standalone reader (assign) of FakeBroker partitions."""
+    def __init__(self, broker, config=None):
+        config = dict(config or {})
+        self._broker = broker
+        self.group_id = config.get('group.id')
+        self._reset_to_end = config.get('auto.offset.reset') in ('latest', 'largest', 'end')
+        self._auto_commit = str(config.get('enable.auto.commit', True)).lower() in ('true', '1')
+        self._auto_commit_interval = int(config.get('auto.commit.interval.ms', 5000)) / 1000.0
+        self._partition_eof = str(config.get('enable.partition.eof', False)).lower() in ('true', '1')
+        self._subscription = None
+        self._callbacks = {}
+        self._generation = None
+        self._positions = {}
+        self._stored = {}
+        self._paused = set()
+        self._at_eof = set()
+        self._last_auto_commit = time.monotonic()
+        self._next_partition = 0
+        self._closed = False
+
+    def _check_open(self):
+        if self._closed:
+            raise RuntimeError("Consumer closed")
+
+    def subscribe(self, topics, on_assign=None, on_revoke=None, on_lost=None):
+        self._check_open()
+        self._subscription = list(topics)
+        self._callbacks = {'on_assign': on_assign, 'on_revoke': on_revoke, 'on_lost': on_lost}
+        self._generation = None
+        self._broker.join(self.group_id, self, self._subscription)
+
+    def unsubscribe(self):
+        if self._subscription is not None:
+            self._broker.leave(self.group_id, self)
+            self._subscription = None
+        self._positions.clear()
+
+    def assign(self, partitions):
+        self._check_open()
+        self._positions = {}
+        for tp in partitions:
+            self._start_at((tp.topic, tp.partition), tp.offset)
+
+    def _start_at(self, tp, offset):
+        low, high = self._broker.watermarks(*tp)
+        if offset == OFFSET_BEGINNING:
+            offset = low
+        elif offset == OFFSET_END:
+            offset = high
+        elif offset < 0:
+            committed = self._broker.committed(self.group_id, *tp)
+            offset = committed if committed >= 0 else (high if self._reset_to_end else low)
+        self._positions[tp] = offset
+        self._at_eof.discard(tp)
+
+    def _rebalance(self):
+        """Applies a new group generation: revokes partitions that moved away, then assigns the new ones."""
+        if self._subscription is None or self._broker.generation(self.group_id) == self._generation:
+            return
+        self._generation, assigned = self._broker.assignment(self.group_id, self)
+        revoked = [tp for tp in self._positions if tp not in assigned]
+        if revoked:
+            if self._callbacks.get('on_revoke'):
+                self._callbacks['on_revoke'](self, [TopicPartition(*tp) for tp in revoked])
+            for tp in revoked:
+                self._positions.pop(tp, None)
+                self._stored.pop(tp, None)
+                self._paused.discard(tp)
+        added = sorted(tp for tp in assigned if tp not in self._positions)
+        for tp in added:
+            self._start_at(tp, OFFSET_INVALID)
+        if added and self._callbacks.get('on_assign'):
+            self._callbacks['on_assign'](self, [TopicPartition(topic, partition, self._positions[(topic, partition)])
+                                                for topic, partition in added])
+
+    def _maybe_auto_commit(self):
+        if self._auto_commit and self._stored and time.monotonic() - self._last_auto_commit >= self._auto_commit_interval:
+            self._last_auto_commit = time.monotonic()
+            self._broker.commit(self.group_id, self._stored)
+            self._stored = {}
+
+    def _take(self, max_count):
+        """Reads up to max_count messages, visiting the readable partitions round robin."""
+        msgs = []
+        readable = [tp for tp in self._positions if tp not in self._paused]
+        for i in range(len(readable)):
+            if len(msgs) >= max_count:
+                break
+            tp = readable[(self._next_partition + i) % len(readable)]
+            batch = self._broker.read(tp[0], tp[1], self._positions[tp], max_count - len(msgs))
+            if batch:
+                self._positions[tp] += len(batch)
+                self._at_eof.discard(tp)
+                msgs.extend(batch)
+            elif self._partition_eof and tp not in self._at_eof:
+                self._at_eof.add(tp)
+                msgs.append(FakeMessage(tp[0], tp[1], self._positions[tp], error=KafkaError(KafkaError._PARTITION_EOF)))
+        self._next_partition += 1
+        return msgs
+
+    def _fetch(self, max_count, timeout, fill):
+        self._check_open()
+        deadline = time.monotonic() + (timeout if timeout is not None and timeout >= 0 else 3600)
+        msgs = []
+        while True:
+            version = self._broker.version()
+            self._rebalance()
+            self._maybe_auto_commit()
+            msgs.extend(self._take(max_count - len(msgs)))
+            remaining = deadline - time.monotonic()
+            if len(msgs) >= max_count or (msgs and not fill) or remaining <= 0:
+                break
+            self._broker.wait(version, remaining)
+        now = time.perf_counter()
+        for msg in msgs:
+            if msg.delivered_at is None:
+                msg.delivered_at = now
+        return msgs
+
+    def poll(self, timeout=None):
+        msgs = self._fetch(1, timeout, fill=False)
+        return msgs[0] if msgs else None
+
+    def consume(self, num_messages=1, timeout=-1):
+        """Waits until num_messages have arrived or timeout seconds have passed, like librdkafka's batch consume."""
+        return self._fetch(num_messages, timeout, fill=True)
+
+    def store_offsets(self, message=None, offsets=None):
+        if message is not None:
+            self._stored[(message.topic(), message.partition())] = message.offset() + 1
+        for tp in offsets or []:
+            self._stored[(tp.topic, tp.partition)] = tp.offset
+
+    def commit(self, message=None, offsets=None, asynchronous=True):
+        if message is not None:
+            to_commit = {(message.topic(), message.partition()): message.offset() + 1}
+        elif offsets is not None:
+            to_commit = {(tp.topic, tp.partition): tp.offset for tp in offsets}
+        else:
+            if not self._stored:
+                raise KafkaException(KafkaError(KafkaError._NO_OFFSET))
+            to_commit, self._stored = self._stored, {}
+        self._broker.commit(self.group_id, to_commit)
+        return None if asynchronous else [TopicPartition(t, p, o) for (t, p), o in to_commit.items()]
+
+    def committed(self, partitions, timeout=None):
+        return [TopicPartition(tp.topic, tp.partition, self._broker.committed(self.group_id, tp.topic, tp.partition))
+                for tp in partitions]
+
+    def position(self, partitions):
+        return [TopicPartition(tp.topic, tp.partition, self._positions.get((tp.topic, tp.partition), OFFSET_INVALID))
+                for tp in partitions]
+
+    def assignment(self):
+        return [TopicPartition(topic, partition) for topic, partition in self._positions]
+
+    def get_watermark_offsets(self, partition, timeout=None, cached=False):
+        return self._broker.watermarks(partition.topic, partition.partition)
+
+    def seek(self, partition):
+        self._start_at((partition.topic, partition.partition), partition.offset)
+
+    def pause(self, partitions):
+        self._paused.update((tp.topic, tp.partition) for tp in partitions)
+
+    def resume(self, partitions):
+        self._paused.difference_update((tp.topic, tp.partition) for tp in partitions)
+
+    def list_topics(self, topic=None, timeout=-1):
+        return self._broker.metadata(topic)
+
+    def close(self):
+        if self._closed:
+            return
+        if self._auto_commit and self._stored:
+            self._broker.commit(self.group_id, self._stored)
+            self._stored = {}
+        self.unsubscribe()
+        self._closed = True
+
+
+class FakeKafkaConnection(KafkaConnection):
+    """A KafkaConnection whose clients, topics and admin calls are served by a FakeBroker."""
+    def __init__(self, broker=None):
+        super().__init__()
+        self.broker = broker or FakeBroker()
+
+    def _new_producer(self, config):
+        return FakeProducer(self.broker, config)
+
+    def _new_consumer(self, config):
+        return FakeConsumer(self.broker, config)
+
+    def create_topic(self, topic_name, num_partitions=1, replication_factor=1, config=None):
+        self.broker.create_topic(topic_name, num_partitions)
+        return True
+
+    def list_topics(self):
+        return self.broker.topic_names()
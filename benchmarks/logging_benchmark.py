@@ -0,0 +1,216 @@
+"""
+Measures what logging costs the consumer loop: KafkaConnection.consume_messages feeding
+ProductConsumer.handle_product_message from an in-memory consumer, under several logging setups.
+
+Workloads:
+  replay - commands that were already applied (decode, dedupe lookup, log); isolates logging
+  update - UpdateProductCommands written to an in-memory SQLite database
+
+Setups:
+  off        - logging disabled, the baseline
+  verbose    - every per-message event written synchronously, like the old INFO dump of each message
+  sync       - production level (INFO), written synchronously, no sampling
+  async      - production level, written by the queue listener thread, no sampling
+  production - production level, async, JSON, sampled and rate limited with the Config defaults
+
+Log output goes to --log-file (default: a temporary file, removed afterwards). loop_us is the time
+per message spent in the loop, best of --repeat runs; drain_ms is how long the async writer needed
+afterwards to empty its queue. Run from the repository root:
+
+    python -m benchmarks.logging_benchmark [--messages 20000] [--repeat 3] [--workload replay] [--json results.json]
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from flask import Flask
+
+from src import db
+from src.config import Config, TestingConfig
+from src.kafka.connection import KafkaConnection
+from src.logging_config import _stop_listener, configure_logging
+from src.Shop.dedupe import CommandDeduplicator
+from src.Shop.model import Inventory, Products
+from src.Shop.product_consumer import ProductConsumer
+
+SETUPS = {
+    'off': {'LOG_LEVEL': 'CRITICAL', 'LOG_ASYNC': False},
+    'verbose': {'LOG_LEVEL': 'DEBUG', 'LOG_ASYNC': False, 'LOG_MESSAGE_MAX_PER_SECOND': 0},
+    'sync': {'LOG_LEVEL': 'INFO', 'LOG_ASYNC': False, 'LOG_MESSAGE_MAX_PER_SECOND': 0},
+    'async': {'LOG_LEVEL': 'INFO', 'LOG_ASYNC': True, 'LOG_MESSAGE_MAX_PER_SECOND': 0},
+    'production': {
+        'LOG_LEVEL': 'INFO', 'LOG_ASYNC': True, 'LOG_FORMAT': 'json',
+        'LOG_MESSAGE_SAMPLE_EVERY': Config.LOG_MESSAGE_SAMPLE_EVERY,
+        'LOG_MESSAGE_MAX_PER_SECOND': Config.LOG_MESSAGE_MAX_PER_SECOND,
+    },
+}
+
+
+class _Message:
+    """The parts of confluent_kafka.Message the consumer loop and the handler use."""
+    def __init__(self, value, offset, key):
+        self._value = value
+        self._offset = offset
+        self._key = key
+
+    def value(self):
+        return self._value
+
+    def key(self):
+        return self._key
+
+    def topic(self):
+        return 'product_commands'
+
+    def partition(self):
+        return 0
+
+    def offset(self):
+        return self._offset
+
+    def error(self):
+        return None
+
+    def headers(self):
+        return [('content-type', b'application/json')]
+
+
+class _InMemoryConsumer:
+    """Hands out a fixed list of messages, then sets stop_event."""
+    def __init__(self, messages, stop_event):
+        self._messages = iter(messages)
+        self._stop_event = stop_event
+
+    def poll(self, timeout=None):
+        msg = next(self._messages, None)
+        if msg is None:
+            self._stop_event.set()
+        return msg
+
+    def store_offsets(self, message=None, offsets=None):
+        pass
+
+    def commit(self, message=None, offsets=None, asynchronous=True):
+        pass
+
+    def assignment(self):
+        return []
+
+
+def _timestamp():
+    return datetime.utcnow().isoformat() + 'Z'
+
+
+def _make_app():
+    app = Flask('logging_benchmark')
+    app.config.from_object(TestingConfig)
+    db.init_app(app)
+    return app
+
+
+def build_messages(count, product_ids):
+    messages = []
+    for offset in range(count):
+        product_id = product_ids[offset % len(product_ids)]
+        command = {
+            "command_id": str(uuid.uuid4()),
+            "command_type": "UpdateProductCommand",
+            "timestamp": _timestamp(),
+            "payload": {
+                "product_id": product_id,
+                "name": f"Product {offset}",
+                "price": 10 + offset % 90,
+                "description": "Benchmark product " * 20,
+                "image_url": f"/uploads/{product_id}.png",
+                "stock_quantity": 100,
+                "updated_at": _timestamp()
+            }
+        }
+        messages.append(_Message(json.dumps(command).encode('utf-8'), offset, product_id.encode('utf-8')))
+    return messages
+
+
+def run(setup, workload, num_messages, log_stream):
+    configure_logging(dict(SETUPS[setup]), stream=log_stream)
+    app = _make_app()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        product_ids = [str(uuid.uuid4()) for _ in range(100)]
+        for product_id in product_ids:
+            db.session.add(Products(id=product_id, name='Product', price=10, description='Benchmark product'))
+            db.session.add(Inventory(product_id=product_id, quantity=100, low_stock_threshold=10))
+        db.session.commit()
+
+        kafka_conn = KafkaConnection()
+        consumer = ProductConsumer()
+        consumer.kafka_conn = kafka_conn
+        consumer.dedupe = CommandDeduplicator(max_entries=num_messages)
+        messages = build_messages(num_messages, product_ids)
+        if workload == 'replay':
+            for msg in messages:
+                consumer.dedupe.committed(json.loads(msg.value())['command_id'])
+
+        stop_event = threading.Event()
+        started = time.perf_counter()
+        kafka_conn.consume_messages(_InMemoryConsumer(messages, stop_event), consumer.handle_product_message,
+                                    timeout=0, stop_event=stop_event)
+        loop_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        _stop_listener()
+        drain_seconds = time.perf_counter() - started
+        db.session.remove()
+    return {
+        'setup': setup,
+        'workload': workload,
+        'messages_per_second': round(num_messages / loop_seconds),
+        'loop_us': round(loop_seconds / num_messages * 1e6, 2),
+        'drain_ms': round(drain_seconds * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workload', choices=('replay', 'update', 'both'), default='both')
+    parser.add_argument('--log-file', help='where the log output goes (default: a temporary file)')
+    parser.add_argument('--json', dest='json_path', help='also write the results to this file')
+    args = parser.parse_args()
+
+    # The loop's own start/stop lines are the same in every setup; keep them out of the way
+    os.environ.setdefault('KAFKA_TRAFFIC_SUMMARY_INTERVAL', '0')
+    workloads = ('replay', 'update') if args.workload == 'both' else (args.workload,)
+    results = []
+    log_stream = open(args.log_file, 'w') if args.log_file else tempfile.TemporaryFile('w')
+    with log_stream:
+        for workload in workloads:
+            # Setups take turns, so drift in machine load affects all of them alike
+            runs = {setup: [] for setup in SETUPS}
+            for _ in range(args.repeat):
+                for setup in SETUPS:
+                    runs[setup].append(run(setup, workload, args.messages, log_stream))
+            results.extend(min(rows, key=lambda row: row['loop_us']) for rows in runs.values())
+        logging.getLogger().handlers.clear()
+
+    print(f"{'workload':<8} {'setup':<11} {'msgs/s':>9} {'loop us':>9} {'overhead us':>12} {'drain ms':>9}")
+    baselines = {row['workload']: row['loop_us'] for row in results if row['setup'] == 'off'}
+    for row in results:
+        row['overhead_us'] = round(row['loop_us'] - baselines[row['workload']], 2)
+        print(f"{row['workload']:<8} {row['setup']:<11} {row['messages_per_second']:>9} {row['loop_us']:>9} "
+              f"{row['overhead_us']:>12} {row['drain_ms']:>9}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'messages': args.messages, 'repeat': args.repeat, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
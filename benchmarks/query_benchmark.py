@@ -0,0 +1,212 @@
+"""
+Measures the latency of the hot shop queries on a seeded SQLite database, with the schema
+as it was before the hot-query indexes (INTEGER inventory.product_id, no product/created_at
+indexes) and as declared by the current models.
+
+Seeding 1M orders takes a minute or two; the database is kept at --db and reused by later
+runs with the same sizes. Run from the repository root:
+
+    python -m benchmarks.query_benchmark [--orders 1000000] [--products 10000] [--repeat 200] [--json results.json]
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+
+from src import db
+from src.Shop import model  # noqa: F401  (registers the tables on db.metadata)
+
+NEW_INDEXES = {
+    'ix_orders_product_id_created_at': 'CREATE INDEX ix_orders_product_id_created_at ON orders (product_id, created_at)',
+    'ix_inventory_product_id_quantity': 'CREATE INDEX ix_inventory_product_id_quantity ON inventory (product_id, quantity)',
+    'ix_products_created_at_id': 'CREATE INDEX ix_products_created_at_id ON products (created_at, id)',
+}
+
+INVENTORY_DDL = """
+CREATE TABLE inventory (
+    id INTEGER NOT NULL PRIMARY KEY,
+    product_id {product_id_type} NOT NULL UNIQUE REFERENCES products (id),
+    quantity INTEGER NOT NULL,
+    low_stock_threshold INTEGER,
+    created_at DATETIME,
+    updated_at DATETIME
+)
+"""
+
+# name -> (sql, parameter factory). The same seeded random parameters are used for both schemas.
+QUERIES = {
+    'orders_for_product': (
+        "SELECT id, quantity, total_price, created_at FROM orders WHERE product_id = ? "
+        "ORDER BY created_at DESC LIMIT 20",
+        lambda ctx: (ctx.product_id(),)
+    ),
+    'product_sales_last_week': (
+        "SELECT COUNT(*), SUM(quantity) FROM orders WHERE product_id = ? AND created_at >= ?",
+        lambda ctx: (ctx.product_id(), ctx.week_ago)
+    ),
+    'stock_for_product': (
+        "SELECT quantity FROM inventory WHERE product_id = ?",
+        lambda ctx: (ctx.product_id(),)
+    ),
+    'product_detail_with_stock': (
+        "SELECT products.*, inventory.quantity FROM products "
+        "LEFT OUTER JOIN inventory ON products.id = inventory.product_id WHERE products.id = ?",
+        lambda ctx: (ctx.product_id(),)
+    ),
+    'product_page_with_stock': (
+        "SELECT products.*, inventory.quantity FROM products "
+        "LEFT OUTER JOIN inventory ON products.id = inventory.product_id "
+        "ORDER BY products.created_at DESC, products.id DESC LIMIT 21",
+        lambda ctx: ()
+    ),
+    'reserve_stock': (
+        "UPDATE inventory SET quantity = quantity - ? WHERE product_id = ? AND quantity >= ?",
+        lambda ctx: (1, ctx.product_id(), 1)
+    ),
+}
+
+
+class _Params:
+    def __init__(self, product_ids, seed):
+        self._product_ids = product_ids
+        self._random = random.Random(seed)
+        self.week_ago = (datetime(2026, 1, 1) - timedelta(days=7)).isoformat(sep=' ')
+
+    def product_id(self):
+        return self._random.choice(self._product_ids)
+
+
+def seed(path, num_products, num_orders, chunk_size=50000):
+    """Creates the current schema at path and fills it. Returns the product ids."""
+    if os.path.exists(path):
+        os.remove(path)
+    db.metadata.create_all(create_engine(f"sqlite:///{path}"))
+
+    rng = random.Random(42)
+    start = datetime(2025, 1, 1)
+    span_seconds = int((datetime(2026, 1, 1) - start).total_seconds())
+    product_ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(num_products)]
+
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO products (id, name, price, description, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (pid, f"Product {i}", rng.randint(1, 500), "Benchmark product",
+             (start + timedelta(seconds=rng.randrange(span_seconds))).isoformat(sep=' '), start.isoformat(sep=' '))
+            for i, pid in enumerate(product_ids)
+        ]
+    )
+    conn.executemany(
+        "INSERT INTO inventory (product_id, quantity, low_stock_threshold) VALUES (?, ?, ?)",
+        [(pid, 1000000, 10) for pid in product_ids]
+    )
+    # A few hot products get most of the orders, like a real catalogue
+    weights = [1.0 / (rank + 1) for rank in range(num_products)]
+    for offset in range(0, num_orders, chunk_size):
+        count = min(chunk_size, num_orders - offset)
+        rows = []
+        for pid in rng.choices(product_ids, weights=weights, k=count):
+            created_at = (start + timedelta(seconds=rng.randrange(span_seconds))).isoformat(sep=' ')
+            quantity = rng.randint(1, 5)
+            rows.append((str(uuid.UUID(int=rng.getrandbits(128))), pid, quantity, quantity * 10, created_at, created_at))
+        conn.executemany(
+            "INSERT INTO orders (id, product_id, quantity, total_price, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        conn.commit()
+    conn.close()
+    return product_ids
+
+
+def _rebuild_inventory(conn, product_id_type):
+    conn.execute("ALTER TABLE inventory RENAME TO inventory_previous")
+    conn.execute(INVENTORY_DDL.format(product_id_type=product_id_type))
+    conn.execute("INSERT INTO inventory SELECT * FROM inventory_previous")
+    conn.execute("DROP TABLE inventory_previous")
+
+
+def use_schema(path, schema):
+    """Switches the seeded database between the 'before' and 'after' schema in place."""
+    conn = sqlite3.connect(path)
+    for name in NEW_INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    _rebuild_inventory(conn, 'INTEGER' if schema == 'before' else 'VARCHAR')
+    if schema == 'after':
+        for ddl in NEW_INDEXES.values():
+            conn.execute(ddl)
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def time_queries(path, product_ids, repeat):
+    conn = sqlite3.connect(path)
+    results = {}
+    for name, (sql, params) in QUERIES.items():
+        ctx = _Params(product_ids, seed=name)
+        samples = []
+        for _ in range(repeat):
+            args = params(ctx)
+            started = time.perf_counter()
+            conn.execute(sql, args).fetchall()
+            samples.append((time.perf_counter() - started) * 1000.0)
+            if sql.startswith('UPDATE'):
+                conn.rollback()
+        samples.sort()
+        results[name] = {
+            'median_ms': round(statistics.median(samples), 4),
+            'p95_ms': round(samples[int(len(samples) * 0.95) - 1], 4),
+            'plan': ' | '.join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params(ctx))),
+        }
+    conn.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='query_benchmark.db', help='SQLite file to seed (default: %(default)s)')
+    parser.add_argument('--orders', type=int, default=1000000)
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--reseed', action='store_true', help='seed again even if --db exists')
+    parser.add_argument('--json', dest='json_path', help='also write the results to this file')
+    args = parser.parse_args()
+
+    sizes_path = args.db + '.json'
+    sizes = {'orders': args.orders, 'products': args.products}
+    if args.reseed or not os.path.exists(args.db) or not os.path.exists(sizes_path) \
+            or json.load(open(sizes_path)).get('sizes') != sizes:
+        print(f"Seeding {args.orders} orders for {args.products} products into {args.db}...")
+        started = time.perf_counter()
+        product_ids = seed(args.db, args.products, args.orders)
+        with open(sizes_path, 'w') as f:
+            json.dump({'sizes': sizes, 'product_ids': product_ids}, f)
+        print(f"Seeded in {time.perf_counter() - started:.1f}s")
+    else:
+        product_ids = json.load(open(sizes_path))['product_ids']
+
+    results = {}
+    for schema in ('before', 'after'):
+        use_schema(args.db, schema)
+        results[schema] = time_queries(args.db, product_ids, args.repeat)
+
+    print(f"{'query':<28} {'before ms':>10} {'after ms':>10} {'speedup':>9}")
+    for name in QUERIES:
+        before, after = results['before'][name]['median_ms'], results['after'][name]['median_ms']
+        speedup = f"{before / after:.1f}x" if after else '-'
+        print(f"{name:<28} {before:>10} {after:>10} {speedup:>9}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'sizes': sizes, 'repeat': args.repeat, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
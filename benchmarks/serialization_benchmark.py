@@ -0,0 +1,109 @@
+"""
+Compares the Kafka message codecs on realistic command and event payloads.
+
+Reports bytes per message and encode/decode time per message for every codec in
+src.kafka.serialization.CODECS. Run from the repository root:
+
+    python -m benchmarks.serialization_benchmark [--iterations 20000] [--json results.json]
+"""
+import argparse
+import json
+import timeit
+import uuid
+from datetime import datetime
+
+from src.kafka.serialization import CODECS
+
+
+def _timestamp():
+    return datetime.utcnow().isoformat() + 'Z'
+
+
+def sample_payloads():
+    """One message of each kind the system produces, shaped like the ones built in the views and consumers."""
+    product_id = str(uuid.uuid4())
+    order_id = str(uuid.uuid4())
+    description = ("Hand-finished oak desk organiser with three compartments, a phone stand and a hidden "
+                   "cable channel. ") * 20  # ~2000 chars, the ProductCreateCommand maximum
+    return {
+        'CreateProductCommand': {
+            "command_id": str(uuid.uuid4()),
+            "command_type": "CreateProductCommand",
+            "timestamp": _timestamp(),
+            "payload": {
+                "product_id": product_id,
+                "name": "Oak desk organiser",
+                "price": 49.99,
+                "description": description[:2000],
+                "image_url": f"/uploads/{uuid.uuid4()}.png",
+                "initial_stock_quantity": 250,
+                "created_at": _timestamp(),
+                "updated_at": _timestamp()
+            }
+        },
+        'CreateOrderCommand': {
+            "command_id": str(uuid.uuid4()),
+            "timestamp": _timestamp(),
+            "command_type": "CreateOrderCommand",
+            "payload": {
+                "order_id": order_id,
+                "product_id": product_id,
+                "quantity": 3,
+                "total_price": 149.97,
+                "created_at": _timestamp(),
+                "updated_at": _timestamp()
+            }
+        },
+        'OrderCreated (analytics)': {
+            "event_type": "OrderCreated",
+            "order_id": order_id,
+            "quantity": 3,
+            "total_price": 149,
+            "order_created_at": _timestamp(),
+            "product_details": {
+                "product_id": product_id,
+                "name": "Oak desk organiser",
+                "price": 49,
+                "description": description[:2000],
+                "image_url": f"/uploads/{uuid.uuid4()}.png"
+            }
+        },
+    }
+
+
+def run(iterations):
+    results = []
+    for payload_name, payload in sample_payloads().items():
+        for codec_name, codec in CODECS.items():
+            encoded = codec.encode(payload)
+            assert codec.decode(encoded) == payload
+            encode_seconds = timeit.timeit(lambda: codec.encode(payload), number=iterations)
+            decode_seconds = timeit.timeit(lambda: codec.decode(encoded), number=iterations)
+            results.append({
+                'payload': payload_name,
+                'codec': codec_name,
+                'bytes': len(encoded),
+                'encode_us': round(encode_seconds / iterations * 1e6, 3),
+                'decode_us': round(decode_seconds / iterations * 1e6, 3),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--json', dest='json_path', help='also write the results to this file')
+    args = parser.parse_args()
+
+    results = run(args.iterations)
+    print(f"{'payload':<26} {'codec':<8} {'bytes':>7} {'encode us':>10} {'decode us':>10}")
+    for row in results:
+        print(f"{row['payload']:<26} {row['codec']:<8} {row['bytes']:>7} {row['encode_us']:>10} {row['decode_us']:>10}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'iterations': args.iterations, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,32 +1,52 @@
 import os
 import logging
+import signal
+import threading
 from flask import Flask, current_app
 from src.config import Config
+from src.database import apply_sqlite_pragmas, configure_engine, track_commit_time
 from src.kafka.connection import KafkaConnection
+from src.kafka.retry import failure_topics, retry_topic
+from src.kafka.supervisor import ConsumerSupervisor
+from src.logging_config import configure_logging
+from src.metrics import REGISTRY, start_metrics_server
+from src.redis.redis_connection import RedisConnection
+from src.Shop.cache import ProductCache
+from src.Shop.command_status import CommandStatusStore
+from src.Shop.outbox import OutboxRelay
 from src.Shop.product_consumer import ProductConsumer
 from src.Shop.order_consumer import OrderConsumer
 from src.Shop.model import Products, Inventory, Orders
 from src import db, migrate
-import threading
-import time
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 def create_consumer_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    configure_logging(app.config)
     app.logger.info(f"Consumer microservice starting up with config: {config_class.__name__}")
 
+    configure_engine(app)
     db.init_app(app)
     migrate.init_app(app, db)
+    with app.app_context():
+        apply_sqlite_pragmas(app, db.engine)
+    track_commit_time()
+
+    # The product consumer invalidates the catalog cache whenever it applies a product command
+    app.redis_connection = RedisConnection()
+    if not app.redis_connection.connect():
+        app.logger.warning("Consumer microservice: Could not connect to Redis, cache invalidation disabled.")
+    app.product_cache = ProductCache(
+        app.redis_connection,
+        list_ttl=app.config['PRODUCT_CACHE_LIST_TTL'],
+        detail_ttl=app.config['PRODUCT_CACHE_DETAIL_TTL']
+    )
+    app.command_status = CommandStatusStore(app.redis_connection, ttl=app.config['COMMAND_STATUS_TTL'])
     
     return app
 
-def run_consumer_in_context(app, consumer_instance, topic_name):
-    with app.app_context():
-        consumer_instance.start_consuming(topic_name=topic_name)
-
 if __name__ == '__main__':
     os.environ['FLASK_APP'] = 'consumer_app.py'
 
@@ -41,7 +61,11 @@ if __name__ == '__main__':
         product_consumer_topic = 'product_commands'
         order_consumer_topic = 'order_commands'
         
+        # Failed messages are retried through per-topic retry topics and finally parked in a dead-letter topic
+        retry_delays = app.config['RETRY_DELAYS_SECONDS']
         all_topics_to_check = [product_consumer_topic, order_consumer_topic]
+        for topic_name in (product_consumer_topic, order_consumer_topic):
+            all_topics_to_check += failure_topics(topic_name, retry_delays)
         existing_topics = []
         try:
             existing_topics = app.kafka_connection.list_topics()
@@ -52,10 +76,11 @@ if __name__ == '__main__':
         except Exception as e:
             app.logger.error(f"Consumer microservice: Error listing Kafka topics: {e}", exc_info=True)
 
+        num_partitions = app.config['COMMAND_TOPIC_PARTITIONS']
         for topic_name in all_topics_to_check:
             if topic_name not in existing_topics:
                 app.logger.info(f"Consumer microservice: Attempting to create Kafka topic '{topic_name}'...")
-                success = app.kafka_connection.create_topic(topic_name, num_partitions=3, replication_factor=1)
+                success = app.kafka_connection.create_topic(topic_name, num_partitions=num_partitions, replication_factor=1)
                 if success:
                     app.logger.info(f"Consumer microservice: Kafka topic '{topic_name}' created successfully.")
                 else:
@@ -63,34 +88,55 @@ if __name__ == '__main__':
             else:
                 app.logger.info(f"Consumer microservice: Kafka topic '{topic_name}' already exists. Skipping creation.")
 
-        product_consumer = ProductConsumer()
-        app.logger.info("Consumer microservice: ProductConsumer instance created.")
-        order_consumer = OrderConsumer()
-        app.logger.info("Consumer microservice: OrderConsumer instance created.")
-        
-        product_consumer_thread = threading.Thread(
-            target=run_consumer_in_context,
-            args=(app, product_consumer, product_consumer_topic,),
-            daemon=True
+        supervisor = ConsumerSupervisor(
+            app,
+            app_factory=create_consumer_app,
+            mode=app.config['CONSUMER_WORKER_MODE'],
+            lag_report_interval=app.config['CONSUMER_LAG_REPORT_INTERVAL']
         )
-        order_consumer_thread = threading.Thread(
-            target=run_consumer_in_context,
-            args=(app, order_consumer, order_consumer_topic,),
-            daemon=True
+        supervisor.add_pool(product_consumer_topic, ProductConsumer, app.config['PRODUCT_CONSUMER_WORKERS'], num_partitions)
+        supervisor.add_pool(order_consumer_topic, OrderConsumer, app.config['ORDER_CONSUMER_WORKERS'], num_partitions)
+        for attempt in range(1, len(retry_delays) + 1):
+            supervisor.add_pool(retry_topic(product_consumer_topic, attempt), ProductConsumer, app.config['RETRY_CONSUMER_WORKERS'], num_partitions)
+            supervisor.add_pool(retry_topic(order_consumer_topic, attempt), OrderConsumer, app.config['RETRY_CONSUMER_WORKERS'], num_partitions)
+
+        app.logger.info("Consumer microservice: Starting consumer workers.")
+        supervisor.start()
+
+        # Lag per partition (for autoscaling), throughput and latencies, in the Prometheus format
+        metrics_server = None
+        if app.config['CONSUMER_METRICS_PORT']:
+            REGISTRY.add_collector(supervisor.metric_families)
+            metrics_server = start_metrics_server(app.config['CONSUMER_METRICS_PORT'])
+
+        # Publishes the commands the web app wrote to the outbox table
+        outbox_relay = OutboxRelay(
+            app,
+            app.kafka_connection,
+            batch_size=app.config['OUTBOX_BATCH_SIZE'],
+            poll_interval=app.config['OUTBOX_POLL_INTERVAL'],
+            retention_hours=app.config['OUTBOX_RETENTION_HOURS'],
+            max_attempts=app.config['OUTBOX_MAX_ATTEMPTS']
         )
+        outbox_relay.start()
+
+        stop_event = threading.Event()
+
+        def _request_stop(signum, frame):
+            app.logger.info(f"Consumer microservice: received signal {signum}, shutting down consumer workers.")
+            stop_event.set()
 
-        app.logger.info("Consumer microservice: Starting consumer threads.")
-        product_consumer_thread.start()
-        order_consumer_thread.start()
+        signal.signal(signal.SIGINT, _request_stop)
+        signal.signal(signal.SIGTERM, _request_stop)
 
         try:
-            while True:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            app.logger.info("Consumer microservice: Shutting down consumer threads due to interrupt.")
+            while not stop_event.wait(1):
+                supervisor.check_workers()
         finally:
-            product_consumer.shutdown()
-            order_consumer.shutdown()
+            outbox_relay.stop()
+            supervisor.shutdown(timeout=app.config['CONSUMER_SHUTDOWN_TIMEOUT'])
+            if metrics_server:
+                metrics_server.shutdown()
             app.logger.info("Consumer microservice: All consumers shut down.")
 
     logger.info("Consumer microservice application finished (this message might not be seen if consumer runs indefinitely).")
\ No newline at end of file
@@ -0,0 +1,43 @@
+"""Index products by name and price for the listing filters
+
+Revision ID: 282218ec596d
+Revises: f88c80cf5a72
+Create Date: 2026-10-18 14:12:00
+
+Back the name prefix and price range filters of the keyset-paginated product listing.
+Indexes that already exist are skipped.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '282218ec596d'
+down_revision = 'f88c80cf5a72'
+branch_labels = None
+depends_on = None
+
+
+FILTER_INDEXES = (
+    ('ix_products_name', 'products', ['name']),
+    ('ix_products_price', 'products', ['price']),
+)
+
+
+def _existing_indexes(inspector, table):
+    return {index['name'] for index in inspector.get_indexes(table)}
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+    for name, table, columns in FILTER_INDEXES:
+        if table in tables and name not in _existing_indexes(inspector, table):
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    for name, table, columns in FILTER_INDEXES:
+        if name in _existing_indexes(inspector, table):
+            op.drop_index(name, table_name=table)
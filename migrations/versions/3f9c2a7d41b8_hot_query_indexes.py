@@ -0,0 +1,64 @@
+"""Type inventory.product_id as a string and index the hot order and inventory queries
+
+Revision ID: 3f9c2a7d41b8
+Revises:
+Create Date: 2026-10-18 10:55:00
+
+inventory.product_id was declared INTEGER although it references the UUID string
+products.id, so the products/inventory join compared mixed types. Databases created by
+db.create_all() before this revision are brought up to date; steps that are already
+applied (e.g. on a database created from the current models) are skipped.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c2a7d41b8'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+NEW_INDEXES = (
+    ('ix_orders_product_id_created_at', 'orders', ['product_id', 'created_at']),
+    ('ix_inventory_product_id_quantity', 'inventory', ['product_id', 'quantity']),
+)
+# Declared on the models earlier (keyset pagination) but missing from databases created before that
+PAGINATION_INDEXES = (
+    ('ix_orders_created_at_id', 'orders', ['created_at', 'id']),
+    ('ix_products_created_at_id', 'products', ['created_at', 'id']),
+)
+
+
+def _existing_indexes(inspector, table):
+    return {index['name'] for index in inspector.get_indexes(table)}
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    if 'inventory' in tables:
+        product_id = next(c for c in inspector.get_columns('inventory') if c['name'] == 'product_id')
+        if isinstance(product_id['type'], sa.Integer):
+            with op.batch_alter_table('inventory') as batch_op:
+                batch_op.alter_column(
+                    'product_id',
+                    existing_type=sa.Integer(),
+                    type_=sa.String(),
+                    existing_nullable=False,
+                    postgresql_using='product_id::varchar'
+                )
+
+    for name, table, columns in NEW_INDEXES + PAGINATION_INDEXES:
+        if table in tables and name not in _existing_indexes(inspector, table):
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    # inventory.product_id stays a string: product ids are UUIDs and would not survive a cast back
+    inspector = sa.inspect(op.get_bind())
+    for name, table, columns in NEW_INDEXES:
+        if name in _existing_indexes(inspector, table):
+            op.drop_index(name, table_name=table)
@@ -0,0 +1,51 @@
+"""Add the outbox_messages table for the transactional outbox
+
+Revision ID: 878902c73e2b
+Revises: 282218ec596d
+Create Date: 2026-10-18 14:14:00
+
+The web app writes the Kafka commands it sends into outbox_messages in the same transaction
+as its DB change, and the outbox relay publishes them. dead_lettered_at marks rows the relay
+gave up on. An existing table (e.g. from db.create_all()) only gets the columns it is missing.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '878902c73e2b'
+down_revision = '282218ec596d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'outbox_messages' not in inspector.get_table_names():
+        op.create_table(
+            'outbox_messages',
+            sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column('topic', sa.String(), nullable=False),
+            sa.Column('message_key', sa.String(), nullable=True),
+            sa.Column('payload', sa.Text(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.Column('sent_at', sa.DateTime(), nullable=True),
+            sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('last_error', sa.String(), nullable=True),
+            sa.Column('dead_lettered_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_outbox_messages_sent_at_id', 'outbox_messages', ['sent_at', 'id'])
+        return
+
+    columns = {column['name'] for column in inspector.get_columns('outbox_messages')}
+    if 'dead_lettered_at' not in columns:
+        with op.batch_alter_table('outbox_messages') as batch_op:
+            batch_op.add_column(sa.Column('dead_lettered_at', sa.DateTime(), nullable=True))
+    if 'ix_outbox_messages_sent_at_id' not in {index['name'] for index in inspector.get_indexes('outbox_messages')}:
+        op.create_index('ix_outbox_messages_sent_at_id', 'outbox_messages', ['sent_at', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_outbox_messages_sent_at_id', table_name='outbox_messages')
+    op.drop_table('outbox_messages')
@@ -0,0 +1,38 @@
+"""Add the processed_commands table for command deduplication
+
+Revision ID: f88c80cf5a72
+Revises: 3f9c2a7d41b8
+Create Date: 2026-10-18 14:10:00
+
+The order and product consumers record every applied command_id here in the same transaction
+as its effects, so a redelivered command is skipped. Skipped if the table already exists
+(e.g. on a database created from the current models).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f88c80cf5a72'
+down_revision = '3f9c2a7d41b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'processed_commands' in inspector.get_table_names():
+        return
+    op.create_table(
+        'processed_commands',
+        sa.Column('command_id', sa.String(), nullable=False),
+        sa.Column('command_type', sa.String(), nullable=True),
+        sa.Column('processed_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('command_id')
+    )
+    op.create_index('ix_processed_commands_processed_at', 'processed_commands', ['processed_at'])
+
+
+def downgrade():
+    op.drop_index('ix_processed_commands_processed_at', table_name='processed_commands')
+    op.drop_table('processed_commands')
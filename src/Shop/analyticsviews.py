@@ -0,0 +1,81 @@
+import logging
+from datetime import timedelta
+from flask import current_app, request, jsonify
+from src.analytics.aggregates import GRANULARITIES, parse_event_time
+
+
+logger = logging.getLogger(__name__)
+
+# Range used when the client does not pass start/end
+DEFAULT_WINDOWS = {
+    'minute': timedelta(hours=1),
+    'hour': timedelta(hours=24),
+    'day': timedelta(days=30),
+}
+
+
+class AnalyticsViews:
+    def __init__(self):
+        pass
+
+    def _get_aggregates(self):
+        return getattr(current_app, 'analytics_aggregates', None)
+
+    def _time_range(self):
+        """
+        Reads ?granularity=minute|hour|day&start=<iso>&end=<iso>. Timestamps with an offset are converted
+        to UTC; naive ones are taken as UTC.
+        Raises ValueError for unknown granularities, malformed timestamps or a start after the end.
+        """
+        granularity = request.args.get('granularity', 'hour')
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+        end = parse_event_time(request.args.get('end'))
+        start = request.args.get('start')
+        start = parse_event_time(start) if start else end - DEFAULT_WINDOWS[granularity]
+        if start > end:
+            raise ValueError("start must not be after end")
+        return granularity, start, end
+
+    def summary(self):
+        """Order count, units and revenue per bucket, plus all-time totals"""
+        aggregates = self._get_aggregates()
+        if not aggregates:
+            return jsonify({'error': 'Analytics are unavailable'}), 503
+        try:
+            granularity, start, end = self._time_range()
+            series = aggregates.totals(granularity, start, end)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({
+            'granularity': granularity,
+            'series': series,
+            'all_time': aggregates.all_time_totals()
+        })
+
+    def top_products(self):
+        """Top products by revenue over a range, or all time with ?range=all"""
+        aggregates = self._get_aggregates()
+        if not aggregates:
+            return jsonify({'error': 'Analytics are unavailable'}), 503
+        limit = min(request.args.get('limit', 10, type=int), 100)
+        try:
+            if request.args.get('range') == 'all':
+                return jsonify({'products': aggregates.top_products(limit=limit)})
+            granularity, start, end = self._time_range()
+            products = aggregates.top_products(granularity, start, end, limit=limit)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({'granularity': granularity, 'products': products})
+
+    def product_series(self, product_id):
+        """Units and revenue per bucket for a single product"""
+        aggregates = self._get_aggregates()
+        if not aggregates:
+            return jsonify({'error': 'Analytics are unavailable'}), 503
+        try:
+            granularity, start, end = self._time_range()
+            series = aggregates.product_series(product_id, granularity, start, end)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({'product_id': product_id, 'granularity': granularity, 'series': series})
@@ -0,0 +1,98 @@
+import json
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class _CacheEncoder(json.JSONEncoder):
+    """Encodes datetimes as {"$dt": iso} so they come back as datetimes for the templates."""
+    def default(self, o):
+        if isinstance(o, datetime):
+            return {'$dt': o.isoformat()}
+        return super().default(o)
+
+
+def _restore_datetimes(value):
+    if isinstance(value, dict):
+        if set(value) == {'$dt'}:
+            return datetime.fromisoformat(value['$dt'])
+        return {k: _restore_datetimes(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_restore_datetimes(v) for v in value]
+    return value
+
+
+class ProductCache:
+    """
+    Read-through cache for product listings and product details, backed by RedisConnection.
+
+    Listing pages are stored under a version number that is bumped whenever a product changes,
+    so a single INCR invalidates every cached page without scanning keys; stale pages simply
+    expire through their TTL. When Redis is unavailable every read falls through to the loader.
+    """
+    VERSION_KEY = 'cache:products:version'
+
+    def __init__(self, redis_conn, list_ttl=60, detail_ttl=300):
+        self.redis_conn = redis_conn
+        self.list_ttl = list_ttl
+        self.detail_ttl = detail_ttl
+        self._lock = threading.Lock()
+        self._counters = {'list_hits': 0, 'list_misses': 0, 'detail_hits': 0, 'detail_misses': 0}
+
+    def _available(self):
+        return self.redis_conn is not None and self.redis_conn.client is not None
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _detail_key(self, product_id):
+        return f"cache:product:{product_id}"
+
+    def _list_key(self, variant):
+        version = self.redis_conn.get_data(self.VERSION_KEY) or 0
+        return f"cache:products:v{version}:{variant}"
+
+    def _read_through(self, key, loader, ttl, kind):
+        cached = self.redis_conn.get_data(key)
+        if cached is not None:
+            self._count(f"{kind}_hits")
+            return _restore_datetimes(cached)
+
+        self._count(f"{kind}_misses")
+        value = loader()
+        if value is not None:
+            self.redis_conn.set_data(key, json.dumps(value, cls=_CacheEncoder), ex=ttl)
+        return value
+
+    def get_product_list(self, loader, variant='all'):
+        """
+        Returns the cached listing for variant (e.g. a page/filter combination), calling loader() on a miss.
+        """
+        if not self._available():
+            return loader()
+        return self._read_through(self._list_key(variant), loader, self.list_ttl, 'list')
+
+    def get_product(self, product_id, loader):
+        """Returns the cached product details, calling loader() on a miss. None results are not cached."""
+        if not self._available():
+            return loader()
+        return self._read_through(self._detail_key(product_id), loader, self.detail_ttl, 'detail')
+
+    def invalidate_product(self, product_id):
+        """Drops the product's details and every cached listing page."""
+        if not self._available():
+            return
+        self.redis_conn.delete_data(self._detail_key(product_id))
+        self.redis_conn.incr(self.VERSION_KEY)
+
+    def stats(self):
+        """Returns the hit/miss counters of this process."""
+        with self._lock:
+            stats = dict(self._counters)
+        for kind in ('list', 'detail'):
+            total = stats[f"{kind}_hits"] + stats[f"{kind}_misses"]
+            stats[f"{kind}_hit_ratio"] = round(stats[f"{kind}_hits"] / total, 4) if total else None
+        return stats
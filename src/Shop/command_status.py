@@ -0,0 +1,106 @@
+import logging
+import time
+from datetime import datetime
+
+from flask import current_app, jsonify, redirect, request, url_for, flash
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+APPLIED = 'applied'
+FAILED = 'failed'
+# The command was valid but could not be carried out, e.g. an order the stock cannot cover
+REJECTED = 'rejected'
+
+
+class CommandStatusStore:
+    """
+    Tracks the lifecycle of commands sent to Kafka in Redis.
+    Views mark a command pending before producing it, and the consumers mark it applied, rejected or
+    failed once they have processed it. Entries expire after ttl seconds.
+    """
+    KEY_PREFIX = 'command:status:'
+
+    def __init__(self, redis_conn, ttl=3600, poll_interval=0.05):
+        self.redis_conn = redis_conn
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+
+    def _available(self):
+        return self.redis_conn is not None and self.redis_conn.client is not None
+
+    def _key(self, command_id):
+        return f"{self.KEY_PREFIX}{command_id}"
+
+    def set_status(self, command_id, status, command_type=None, error=None, **details):
+        """Records the command's current status. Returns False if Redis is unavailable."""
+        if not command_id or not self._available():
+            return False
+        entry = {
+            'command_id': command_id,
+            'status': status,
+            'updated_at': datetime.utcnow().isoformat() + 'Z'
+        }
+        if command_type:
+            entry['command_type'] = command_type
+        if error:
+            entry['error'] = error
+        entry.update(details)
+        return bool(self.redis_conn.set_data(self._key(command_id), entry, ex=self.ttl))
+
+    def get_status(self, command_id):
+        """Returns the command's status entry, or None if it is unknown or expired."""
+        if not self._available():
+            return None
+        return self.redis_conn.get_data(self._key(command_id))
+
+    def wait_for(self, command_id, timeout):
+        """
+        Waits up to timeout seconds for the command to leave the pending state and returns its latest entry.
+        Used by clients that need to read their own writes.
+        """
+        deadline = time.monotonic() + max(timeout, 0)
+        entry = self.get_status(command_id)
+        while entry and entry.get('status') == PENDING and time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            entry = self.get_status(command_id)
+        return entry
+
+
+def command_accepted(command_id, status_store, redirect_to, message):
+    """
+    Builds the response for a command that has been handed to Kafka, without waiting for the consumer.
+    JSON clients get 202 with the command_id and its status URL; form posts are redirected with a flash.
+    Clients that need read-your-writes can pass wait=<seconds> (capped by COMMAND_STATUS_MAX_WAIT) to
+    hold the response until the command has been applied, rejected or has failed.
+    """
+    wait = min(request.values.get('wait', type=float) or 0, current_app.config['COMMAND_STATUS_MAX_WAIT'])
+    entry = status_store.wait_for(command_id, wait) if status_store and wait > 0 else None
+    status = entry['status'] if entry else PENDING
+    status_url = url_for('shop.command_status', command_id=command_id)
+
+    if request.is_json or request.accept_mimetypes.best == 'application/json':
+        body = {'command_id': command_id, 'status': status, 'status_url': status_url}
+        if entry and entry.get('error'):
+            body['error'] = entry['error']
+        return jsonify(body), 200 if status == APPLIED else 202
+
+    category = 'error' if status in (FAILED, REJECTED) else 'success'
+    flash(f"{message} (command {command_id}: {status})", category)
+    return redirect(redirect_to)
+
+
+def command_not_sent(command_id, status_store, command_type, render_form, **details):
+    """
+    Builds the response for a command that could not be handed to Kafka and marks it failed.
+    JSON clients get 503 with the command_id; form posts get the form back with an error flash.
+    """
+    error = "The command could not be sent. Please try again."
+    if status_store:
+        status_store.set_status(command_id, FAILED, command_type, error=error, **details)
+
+    if request.is_json or request.accept_mimetypes.best == 'application/json':
+        return jsonify({'command_id': command_id, 'status': FAILED, 'error': error}), 503
+
+    flash(error, 'error')
+    return render_form(), 503
@@ -0,0 +1,84 @@
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from src import db
+from src.Shop.model import ProcessedCommands
+
+logger = logging.getLogger(__name__)
+
+
+class CommandDeduplicator:
+    """
+    Remembers which command_ids have been applied so that commands replayed after a crash or
+    rebalance become no-ops.
+    The processed_commands table is the durable record and is written in the same transaction as
+    the command's side effects; recently seen ids are also kept in a bounded in-memory LRU so the
+    common case does not hit the DB.
+    """
+    PRUNE_INTERVAL_SECONDS = 300
+
+    def __init__(self, max_entries=10000, retention_hours=168):
+        self.max_entries = max_entries
+        self.retention = timedelta(hours=retention_hours)
+        self._seen = OrderedDict()
+        self._last_prune = time.monotonic()
+
+    def _remember(self, command_id):
+        self._seen[command_id] = True
+        self._seen.move_to_end(command_id)
+        while len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+
+    def is_processed(self, command_id):
+        """Returns True if the command has already been applied."""
+        if command_id in self._seen:
+            self._seen.move_to_end(command_id)
+            return True
+        if db.session.get(ProcessedCommands, command_id) is not None:
+            self._remember(command_id)
+            return True
+        return False
+
+    def filter_processed(self, command_ids):
+        """Returns the subset of command_ids that have already been applied, using one query for the LRU misses."""
+        processed = {command_id for command_id in command_ids if command_id in self._seen}
+        misses = [command_id for command_id in command_ids if command_id not in processed]
+        if misses:
+            rows = db.session.query(ProcessedCommands.command_id)\
+                .filter(ProcessedCommands.command_id.in_(misses)).all()
+            for (command_id,) in rows:
+                self._remember(command_id)
+                processed.add(command_id)
+        return processed
+
+    def record(self, command_id, command_type):
+        """Adds the processed marker to the current session. It becomes durable with the caller's commit."""
+        db.session.add(ProcessedCommands(
+            command_id=command_id,
+            command_type=command_type,
+            processed_at=datetime.utcnow()
+        ))
+
+    def committed(self, *command_ids):
+        """Call after a successful commit so the ids are served from memory from now on."""
+        for command_id in command_ids:
+            self._remember(command_id)
+        self.prune()
+
+    def prune(self):
+        """Deletes markers older than the retention window, at most once per PRUNE_INTERVAL_SECONDS."""
+        if time.monotonic() - self._last_prune < self.PRUNE_INTERVAL_SECONDS:
+            return
+        self._last_prune = time.monotonic()
+        try:
+            deleted = ProcessedCommands.query\
+                .filter(ProcessedCommands.processed_at < datetime.utcnow() - self.retention)\
+                .delete(synchronize_session=False)
+            db.session.commit()
+            if deleted:
+                logger.info(f"Pruned {deleted} processed command markers older than {self.retention}.")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to prune processed command markers: {e}", exc_info=True)
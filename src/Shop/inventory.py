@@ -0,0 +1,66 @@
+import logging
+
+from sqlalchemy import bindparam
+from src import db
+from src.Shop.model import Inventory
+
+logger = logging.getLogger(__name__)
+
+
+def reserve_stock(product_id, quantity, updated_at):
+    """
+    Atomically takes quantity units of a product in the current transaction:
+    UPDATE inventory SET quantity = quantity - n WHERE product_id = ? AND quantity >= n.
+    The check and the decrement are a single statement, so concurrent consumers can never drive
+    stock negative and no row has to be locked first. Returns False, changing nothing, if the
+    product has no inventory row or too little stock.
+    """
+    if quantity <= 0:
+        return False
+    inventory = Inventory.__table__
+    result = db.session.execute(
+        inventory.update()
+        .where(inventory.c.product_id == product_id, inventory.c.quantity >= quantity)
+        .values(quantity=inventory.c.quantity - quantity, updated_at=updated_at)
+    )
+    return result.rowcount == 1
+
+
+def reserve_stock_bulk(deltas):
+    """
+    Applies {product_id: (quantity, updated_at)} as conditional decrements in the current transaction.
+    Returns True only if every product had enough stock; otherwise the caller must roll back.
+    Uses one executemany statement where the driver reports reliable row counts for it.
+    """
+    if not deltas:
+        return True
+    if not db.engine.dialect.supports_sane_multi_rowcount:
+        return all(reserve_stock(product_id, quantity, updated_at) for product_id, (quantity, updated_at) in deltas.items())
+
+    inventory = Inventory.__table__
+    result = db.session.execute(
+        inventory.update()
+        .where(inventory.c.product_id == bindparam('b_product_id'), inventory.c.quantity >= bindparam('b_quantity'))
+        .values(quantity=inventory.c.quantity - bindparam('b_quantity'), updated_at=bindparam('b_updated_at')),
+        [
+            {'b_product_id': product_id, 'b_quantity': quantity, 'b_updated_at': updated_at}
+            for product_id, (quantity, updated_at) in deltas.items()
+        ]
+    )
+    return result.rowcount == len(deltas)
+
+
+def stock_levels(product_ids):
+    """Returns {product_id: quantity} for the products that have an inventory row, in one query."""
+    if not product_ids:
+        return {}
+    rows = db.session.query(Inventory.product_id, Inventory.quantity)\
+        .filter(Inventory.product_id.in_(list(product_ids))).all()
+    return {product_id: quantity for product_id, quantity in rows}
+
+
+def rejection_reason(product_id, quantity, available):
+    """Human readable reason for an order that could not be filled, given the stock that was available."""
+    if available is None:
+        return f"Product {product_id} not found"
+    return f"Insufficient stock for product {product_id}: requested {quantity}, available {available}"
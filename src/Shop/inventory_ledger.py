@@ -0,0 +1,137 @@
+import logging
+import time
+from collections import namedtuple
+
+from src import db
+from src.Shop.inventory import reserve_stock_bulk, stock_levels
+
+logger = logging.getLogger(__name__)
+
+# Everything decided since the last flush: orders as (command_id, order, unit_price), inventory
+# deltas as {product_id: (quantity, last_updated)}, {(topic, partition): next_offset} to commit
+# and rejected orders as (command_id, order, reason)
+LedgerBatch = namedtuple('LedgerBatch', ['orders', 'deltas', 'offsets', 'rejections'])
+
+
+class InventoryLedger:
+    """
+    In-memory stock counters for the order consumer, with write-behind persistence.
+
+    Counters are sharded by the Kafka partition the orders arrive on. Order commands are keyed by
+    product_id, so each product lives in exactly one partition and therefore in exactly one consumer's
+    ledger, and reserve() can decide accept/reject in memory. A product's counter is loaded from the
+    inventory table the first time the shard sees it and equals the table's quantity minus the
+    reservations that have not been flushed yet.
+
+    Reserved orders and their inventory deltas are written in one transaction by the order consumer
+    whenever flush_due() says so, and only then are the Kafka offsets committed. After a crash the
+    state is rebuilt from the table and the consumer re-reads the uncommitted tail of the topic.
+    Flushed products are dropped from memory and reloaded on their next order, so stock changes made
+    elsewhere (e.g. a product update) are picked up within one flush interval.
+    """
+    def __init__(self, flush_interval_ms=200, max_pending=1000):
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_pending = max_pending
+        self._shards = {}
+        self._last_flush = time.monotonic()
+        self._reset_pending()
+
+    def _reset_pending(self):
+        self._orders = []
+        self._pending_command_ids = set()
+        self._pending_order_ids = set()
+        self._deltas = {}
+        self._offsets = {}
+        self._rejections = []
+
+    def load(self, partition, product_ids):
+        """Loads the counters the shard does not hold yet with one query. Unknown products are remembered as None."""
+        shard = self._shards.setdefault(partition, {})
+        missing = [product_id for product_id in set(product_ids) if product_id not in shard]
+        if not missing:
+            return
+        found = stock_levels(missing)
+        for product_id in missing:
+            shard[product_id] = found.get(product_id)
+
+    def available(self, partition, product_id):
+        return self._shards.get(partition, {}).get(product_id)
+
+    def reserve(self, partition, product_id, quantity):
+        """Takes quantity units of a loaded product. Returns False if the product is unknown or short of stock."""
+        shard = self._shards.setdefault(partition, {})
+        available = shard.get(product_id)
+        if available is None or quantity <= 0 or available < quantity:
+            return False
+        shard[product_id] = available - quantity
+        return True
+
+    def add_order(self, command_id, order, unit_price=None):
+        """Queues an order whose stock has been reserved, to be written at the next flush."""
+        self._orders.append((command_id, order, unit_price))
+        if command_id:
+            self._pending_command_ids.add(command_id)
+        self._pending_order_ids.add(order.id)
+        quantity, last_updated = self._deltas.get(order.product_id, (0, order.updated_at))
+        self._deltas[order.product_id] = (quantity + order.quantity, max(last_updated, order.updated_at))
+
+    def add_rejection(self, command_id, order, reason):
+        """Queues a rejected order. It is recorded and announced after the next flush, with the offsets that cover it."""
+        self._rejections.append((command_id, order, reason))
+        if command_id:
+            self._pending_command_ids.add(command_id)
+        self._pending_order_ids.add(order.id)
+
+    def is_pending(self, command_id):
+        return command_id in self._pending_command_ids
+
+    def has_order(self, order_id):
+        return order_id in self._pending_order_ids
+
+    def track_offset(self, msg):
+        """Marks a message as handled. Its offset is committed with the next flush."""
+        tp = (msg.topic(), msg.partition())
+        self._offsets[tp] = max(msg.offset() + 1, self._offsets.get(tp, 0))
+
+    def pending_count(self):
+        return len(self._orders)
+
+    def flush_due(self):
+        if not self._orders and not self._offsets:
+            return False
+        return len(self._orders) >= self.max_pending or time.monotonic() - self._last_flush >= self.flush_interval
+
+    def pending_batch(self):
+        return LedgerBatch(list(self._orders), dict(self._deltas), dict(self._offsets), list(self._rejections))
+
+    def write(self, batch):
+        """
+        Adds the batch's orders and one conditional bulk inventory UPDATE to the current session. The caller commits.
+        Raises if a product no longer has the stock the ledger reserved, e.g. because it was changed elsewhere.
+        """
+        if batch.orders:
+            db.session.add_all([order for command_id, order, unit_price in batch.orders])
+        if not reserve_stock_bulk(batch.deltas):
+            raise RuntimeError("inventory changed underneath the ledger")
+
+    def flushed(self, batch):
+        """Clears the pending state after the batch was committed and forgets the counters it touched."""
+        # Products that only had rejections are reloaded too, e.g. once they are restocked
+        touched = set(batch.deltas)
+        touched.update(order.product_id for command_id, order, reason in batch.rejections)
+        for shard in self._shards.values():
+            for product_id in touched:
+                shard.pop(product_id, None)
+        self._reset_pending()
+        self._last_flush = time.monotonic()
+
+    def drop_partitions(self, partitions):
+        """Forgets the shards of revoked partitions. Flush first, or their pending reservations are lost."""
+        for partition in partitions:
+            self._shards.pop(partition, None)
+
+    def reset(self):
+        """Discards all counters and pending reservations, e.g. after a failed flush."""
+        self._shards = {}
+        self._reset_pending()
+        self._last_flush = time.monotonic()
@@ -11,6 +11,13 @@ class Products(db.Model):
     created_at = db.Column(db.DateTime)
     updated_at = db.Column(db.DateTime)
 
+    # Back the keyset pagination (created_at, id) and the name prefix / price range filters
+    __table_args__ = (
+        db.Index('ix_products_created_at_id', 'created_at', 'id'),
+        db.Index('ix_products_name', 'name'),
+        db.Index('ix_products_price', 'price'),
+    )
+
     def __repr__(self):
         return f"<Product {self.name}>"
     
@@ -23,17 +30,58 @@ class Orders(db.Model):
     updated_at = db.Column(db.DateTime)
 
     product = db.relationship('Products', backref=db.backref('order_item', uselist=False))
+
+    # Keyset pagination over all orders, and a product's orders newest first (also covers the join to products)
+    __table_args__ = (
+        db.Index('ix_orders_created_at_id', 'created_at', 'id'),
+        db.Index('ix_orders_product_id_created_at', 'product_id', 'created_at'),
+    )
+
     def __repr__(self):
         return f"<Order {self.product_id}-{self.quantity}-{self.total_price}>"
     
 class Inventory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False, unique=True)
+    product_id = db.Column(db.String, db.ForeignKey('products.id'), nullable=False, unique=True)
     quantity = db.Column(db.Integer, nullable=False, default=0)
     low_stock_threshold = db.Column(db.Integer, nullable=True)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
     updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
 
     product = db.relationship('Products', backref=db.backref('inventory_item', uselist=False))
+
+    # Covers stock lookups and the conditional decrement (WHERE product_id = ? AND quantity >= ?)
+    __table_args__ = (
+        db.Index('ix_inventory_product_id_quantity', 'product_id', 'quantity'),
+    )
+
     def __repr__(self):
         return f"<Inventory product_id={self.product_id} quantity={self.quantity}>"
+
+class ProcessedCommands(db.Model):
+    command_id = db.Column(db.String, primary_key=True)
+    command_type = db.Column(db.String)
+    processed_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<ProcessedCommand {self.command_type}-{self.command_id}>"
+
+class OutboxMessages(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    topic = db.Column(db.String, nullable=False)
+    message_key = db.Column(db.String)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String, nullable=True)
+    # Set when the relay gives up on the row after OUTBOX_MAX_ATTEMPTS failures
+    dead_lettered_at = db.Column(db.DateTime, nullable=True)
+
+    # The relay scans unsent rows in id order
+    __table_args__ = (
+        db.Index('ix_outbox_messages_sent_at_id', 'sent_at', 'id'),
+    )
+
+    def __repr__(self):
+        return f"<OutboxMessage {self.id} {self.topic}>"
@@ -1,131 +1,549 @@
-import json
+import threading
 from datetime import datetime
 
 from flask import current_app
 from src import db
 from src.Shop.model import Inventory, Orders, Products
+from src.Shop.command_status import APPLIED, FAILED, REJECTED
+from src.Shop.dedupe import CommandDeduplicator
+from src.Shop.inventory import rejection_reason, reserve_stock, reserve_stock_bulk, stock_levels
+from src.Shop.inventory_ledger import InventoryLedger
+from src.kafka.retry import FailureRouter, parse_retry_topic
+from src.kafka.serialization import MessageDecodeError
+from src.logging_config import message_logger
 import logging
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
+# Per-message events, sampled and rate limited (see src/logging_config.py)
+message_log = message_logger(__name__)
 
 class OrderConsumer:
     def __init__(self):
         self.kafka_conn = None
         self.consumer = None
+        self.producer = None
         self.running = False
+        self.dedupe = None
+        self.status_store = None
+        self.ledger = None
+        self.failures = None
+        self.stop_event = threading.Event()
+        # Consecutive failed ledger flushes
+        self._flush_failures = 0
 
     def _get_kafka_connection(self):
         return current_app.kafka_connection
 
-    def initialize(self):
-        """Initialize the consumer connection"""
+    def _batch_size(self):
+        return current_app.config.get('ORDER_BATCH_SIZE', 1)
+
+    def _ledger_enabled(self):
+        return current_app.config.get('ORDER_INVENTORY_MODE', 'db') == 'ledger'
+
+    def initialize(self, retry=False):
+        """
+        Initialize the consumer connection.
+        retry=True sets up a consumer for a retry topic: its own consumer group and one message at a time.
+        """
         self.kafka_conn = self._get_kafka_connection()
         if not self.kafka_conn:
             return False
         
-        self.consumer = self.kafka_conn.create_consumer()
+        # In batch mode offsets are committed by consume_batches once the DB transaction has succeeded,
+        # in ledger mode by the ledger flush
+        config_overrides = {'enable.auto.commit': False} if not retry and (self._batch_size() > 1 or self._ledger_enabled()) else None
+        self.status_store = getattr(current_app, 'command_status', None)
+        self.dedupe = CommandDeduplicator(
+            max_entries=current_app.config.get('DEDUPE_CACHE_SIZE', 10000),
+            retention_hours=current_app.config.get('DEDUPE_RETENTION_HOURS', 168)
+        )
+
+        if self._ledger_enabled() and not retry:
+            if current_app.config.get('ORDER_PARTITION_KEY', 'product_id') != 'product_id':
+                logger.warning("The inventory ledger expects order commands keyed by product_id. "
+                               "Consumers sharing a product will keep failing their flushes.")
+            self.ledger = InventoryLedger(
+                flush_interval_ms=current_app.config.get('INVENTORY_FLUSH_INTERVAL_MS', 200),
+                max_pending=current_app.config.get('INVENTORY_FLUSH_MAX_ORDERS', 1000)
+            )
+
+        self.consumer = self.kafka_conn.create_consumer(config_overrides=config_overrides, role='order-retry' if retry else 'order')
         if not self.consumer:
             return False
         
         self.producer = self.kafka_conn.create_producer()
         if not self.producer:
             return False
-        
+
+        self.failures = FailureRouter(self.kafka_conn, self.producer, current_app.config.get('RETRY_DELAYS_SECONDS', ()))
         return True
     
     def handle_order_message(self, msg):
         """Process a single order creation message"""
+        command_id = None
         try:
-            message_value = json.loads(msg.value().decode('utf-8'))
-            logger.info(f"Processing order message: {message_value}")
+            message_value = self.kafka_conn.decode_message(msg)
+            message_log.debug("Processing order message: %s", message_value)
 
             if message_value.get('command_type') not in ['CreateOrderCommand', 'UpdateOrderCommand', 'DeleteOrderCommand']:
-                logger.warning(f"Unexpected command type: {message_value.get('command_type')}")
+                logger.warning("Unexpected command type: %s", message_value.get('command_type'))
+                return
+
+            command_id = message_value.get('command_id')
+            if command_id and self.dedupe and self.dedupe.is_processed(command_id):
+                message_log.info("Command %s has already been applied. Skipping replay.", command_id)
                 return
 
             payload = message_value.get('payload', {})
 
             if message_value.get('command_type') == 'CreateOrderCommand':
-                new_order = Orders(
-                    id=payload['order_id'],
-                    product_id=payload['product_id'],
-                    quantity=payload['quantity'],
-                    total_price=int(payload['total_price']),
-                    created_at=datetime.fromisoformat(payload['created_at'].replace('Z', '+00:00')),
-                    updated_at=datetime.fromisoformat(payload['updated_at'].replace('Z', '+00:00'))
-                )
+                new_order = self._build_order(payload)
 
-                # update inventory
-                inventory_item = Inventory.query.filter_by(product_id=payload['product_id']).first()
-                if inventory_item:
-                    inventory_item.quantity -= payload['quantity']
-                    inventory_item.updated_at = datetime.fromisoformat(payload['updated_at'].replace('Z', '+00:00'))
+                # update inventory: the order is only created if the stock covers it
+                if not reserve_stock(new_order.product_id, new_order.quantity, new_order.updated_at):
+                    available = stock_levels([new_order.product_id]).get(new_order.product_id)
+                    self._reject_order(command_id, new_order, rejection_reason(new_order.product_id, new_order.quantity, available))
+                    return
 
-                db.session.add(inventory_item)
                 db.session.add(new_order)
                 
-                # product details for analytics event
-                product = Products.query.get(payload['product_id'])
-                
-                if product:
-                    analytics_payload = {
-                        "event_type": "OrderCreated",
-                        "order_id": new_order.id,
-                        "quantity": new_order.quantity,
-                        "total_price": new_order.total_price,
-                        "order_created_at": new_order.created_at.isoformat() + 'Z',
-                        "product_details": {
-                            "product_id": product.id,
-                            "name": product.name,
-                            "price": product.price,
-                            "description": product.description,
-                            "image_url": product.image_url
-                        }
-                    }
-                    
-                    if self.kafka_conn:
-                        self.kafka_conn.produce_message(
-                            producer=self.producer,
-                            topic='analytics_events',
-                            message_obj=analytics_payload,
-                            key=new_order.id
-                        )
-                        logger.info(f"Published enriched order event to analytics_events topic for order {new_order.id}")
-                    else:
-                        logger.warning("Kafka connection not available to publish to analytics_events topic.")
+                if self._lean_analytics_events():
+                    # The analytics consumer joins product attributes from product_events
+                    self._publish_analytics_event(new_order, unit_price=payload.get('unit_price'))
                 else:
-                    logger.warning(f"Product with ID {payload['product_id']} not found for order {new_order.id}. Analytics event will be incomplete.")
+                    # product details for analytics event
+                    product = Products.query.get(payload['product_id'])
+
+                    if product:
+                        self._publish_analytics_event(new_order, product)
+                    else:
+                        logger.warning("Product with ID %s not found for order %s. Analytics event will be incomplete.", payload['product_id'], new_order.id)
 
-                logger.info(f"Successfully created order {new_order.id} and updated inventory record")
+                message_log.info("Successfully created order %s and updated inventory record", new_order.id)
 
+            if command_id and self.dedupe:
+                self.dedupe.record(command_id, message_value.get('command_type'))
             db.session.commit()
+            if command_id and self.dedupe:
+                self.dedupe.committed(command_id)
+            self._set_command_status(command_id, APPLIED, message_value.get('command_type'))
 
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to decode message: {e}")
+        except MessageDecodeError as e:
+            logger.error("Failed to decode message: %s", e)
+            self._dead_letter(msg, e)
         except KeyError as e:
-            logger.error(f"Missing required field in message: {e}")
+            db.session.rollback()
+            logger.error("Missing required field in message: %s", e)
+            self._set_command_status(command_id, FAILED, error=f"Missing required field: {e}")
+            self._dead_letter(msg, e)
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error processing order message: %s", e, exc_info=True)
+            if not self._retry(msg, e):
+                self._set_command_status(command_id, FAILED, error=str(e))
+
+    def _set_command_status(self, command_id, status, command_type=None, error=None):
+        if self.status_store and command_id:
+            self.status_store.set_status(command_id, status, command_type, error=error)
+
+    def _retry(self, msg, error):
+        """Schedules a failed message for another attempt. Returns False if it was dead-lettered instead, or retries are off."""
+        return self.failures.retry(msg, error) if self.failures else False
+
+    def _dead_letter(self, msg, error):
+        """Sends a message that can never succeed straight to the dead-letter topic"""
+        if self.failures:
+            self.failures.dead_letter(msg, error)
+
+    def _reject_order(self, command_id, order, reason):
+        """Records the command as processed, so a replay cannot accept it later, and announces the rejection"""
+        if command_id and self.dedupe:
+            self.dedupe.record(command_id, 'CreateOrderCommand')
+        db.session.commit()
+        if command_id and self.dedupe:
+            self.dedupe.committed(command_id)
+        self._announce_rejections([(command_id, order, reason)])
+
+    def _announce_rejections(self, rejections):
+        """Publishes an OrderRejected event to order_events and marks the command rejected, for each (command_id, order, reason)"""
+        for command_id, order, reason in rejections:
+            logger.warning("Rejected order %s: %s", order.id, reason)
+            if self.producer:
+                self.kafka_conn.produce_message(
+                    producer=self.producer,
+                    topic='order_events',
+                    message_obj={
+                        "event_type": "OrderRejected",
+                        "command_id": command_id,
+                        "order_id": order.id,
+                        "product_id": order.product_id,
+                        "quantity": order.quantity,
+                        "reason": reason,
+                        "rejected_at": datetime.utcnow().isoformat() + 'Z'
+                    },
+                    key=order.product_id
+                )
+            self._set_command_status(command_id, REJECTED, 'CreateOrderCommand', error=reason)
+
+    def handle_order_batch(self, msgs):
+        """
+        Process a batch of order messages in a single DB transaction.
+        Messages that cannot be decoded are skipped before the transaction starts, so one bad message
+        does not roll back the rest of the batch. Stock is read once for the batch and allocated to the
+        orders in arrival order; orders it cannot cover are rejected. Decrements are aggregated per
+        product and applied as one conditional bulk UPDATE. If stock changed underneath the batch or the
+        commit fails, the orders of the transaction are replayed message by message to isolate the culprit.
+        """
+        payloads = []
+        for msg in msgs:
+            try:
+                message_value = self.kafka_conn.decode_message(msg)
+            except MessageDecodeError as e:
+                logger.error("Failed to decode message at %s [%s] @ %s: %s", msg.topic(), msg.partition(), msg.offset(), e)
+                self._dead_letter(msg, e)
+                continue
+
+            if message_value.get('command_type') not in ['CreateOrderCommand', 'UpdateOrderCommand', 'DeleteOrderCommand']:
+                logger.warning("Unexpected command type: %s", message_value.get('command_type'))
+                continue
+
+            if message_value.get('command_type') == 'CreateOrderCommand':
+                payloads.append((msg, message_value.get('command_id'), message_value.get('payload', {})))
+
+        if not payloads:
+            return
+
+        command_ids = [command_id for msg, command_id, payload in payloads if command_id]
+        already_processed = self.dedupe.filter_processed(command_ids) if self.dedupe and command_ids else set()
+
+        new_orders = []
+        for msg, command_id, payload in payloads:
+            if command_id and command_id in already_processed:
+                message_log.info("Command %s has already been applied. Skipping replay.", command_id)
+                continue
+            try:
+                new_orders.append((msg, command_id, self._build_order(payload)))
+            except (KeyError, TypeError, ValueError) as e:
+                logger.error("Invalid order payload, skipping: %s", e)
+                self._set_command_status(command_id, FAILED, 'CreateOrderCommand', error=f"Invalid order payload: {e}")
+                self._dead_letter(msg, e)
+
+        product_ids = {order.product_id for msg, command_id, order in new_orders}
+        products = {p.id: p for p in Products.query.filter(Products.id.in_(product_ids)).all()} if product_ids else {}
+        existing_order_ids = {
+            order_id for (order_id,) in db.session.query(Orders.id)
+            .filter(Orders.id.in_([order.id for msg, command_id, order in new_orders])).all()
+        } if new_orders else set()
+
+        remaining = stock_levels(products)
+        accepted = []
+        accepted_command_ids = set()
+        rejected = []
+        # The messages whose orders go into the transaction, accepted or rejected
+        transaction_msgs = []
+        seen_order_ids = set()
+        seen_command_ids = set()
+        for msg, command_id, order in new_orders:
+            if order.id in existing_order_ids or order.id in seen_order_ids:
+                logger.warning("Order %s already exists. Skipping duplicate.", order.id)
+                self._set_command_status(command_id, FAILED, 'CreateOrderCommand', error=f"Order {order.id} already exists")
+                continue
+            if command_id and command_id in seen_command_ids:
+                continue
+            seen_order_ids.add(order.id)
+            if command_id:
+                seen_command_ids.add(command_id)
+            transaction_msgs.append(msg)
+            available = remaining.get(order.product_id)
+            if available is None or order.quantity <= 0 or available < order.quantity:
+                rejected.append((command_id, order, rejection_reason(order.product_id, order.quantity, available)))
+                continue
+            remaining[order.product_id] = available - order.quantity
+            accepted.append(order)
+            if command_id:
+                accepted_command_ids.add(command_id)
+
+        if not accepted and not rejected:
+            return
+
+        decrements = {}
+        for order in accepted:
+            quantity, last_updated = decrements.get(order.product_id, (0, order.updated_at))
+            decrements[order.product_id] = (quantity + order.quantity, max(last_updated, order.updated_at))
+
+        processed_command_ids = list(accepted_command_ids) + [command_id for command_id, order, reason in rejected if command_id]
+        try:
+            db.session.add_all(accepted)
+            if not reserve_stock_bulk(decrements):
+                raise RuntimeError("stock changed while the batch was being processed")
+            if self.dedupe:
+                for command_id in processed_command_ids:
+                    self.dedupe.record(command_id, 'CreateOrderCommand')
+            db.session.commit()
+            if self.dedupe:
+                self.dedupe.committed(*processed_command_ids)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Batch of {len(accepted)} orders failed to commit: {e}. Falling back to per-message processing.", exc_info=True)
+            # Messages dead-lettered or skipped above are already dealt with
+            for msg in transaction_msgs:
+                self.handle_order_message(msg)
+            return
+
+        message_log.info("Successfully created %d orders and updated %d inventory records in one batch", len(accepted), len(decrements))
+        self._announce_rejections(rejected)
+        for command_id in accepted_command_ids:
+            self._set_command_status(command_id, APPLIED, 'CreateOrderCommand')
+
+        unit_prices = {p.get('order_id'): p.get('unit_price') for msg, command_id, p in payloads}
+        lean = self._lean_analytics_events()
+        for order in accepted:
+            if lean:
+                self._publish_analytics_event(order, unit_price=unit_prices.get(order.id))
+            else:
+                self._publish_analytics_event(order, products[order.product_id])
+
+    def handle_order_batch_ledger(self, msgs):
+        """
+        Ledger mode: reserves stock for each order in memory (see InventoryLedger) and leaves the DB
+        writes and offset commits to the periodic flush. Orders short of stock are rejected in memory and
+        announced once the flush that covers their offsets has committed.
+        """
+        creates = []
+        for msg in msgs:
+            self.ledger.track_offset(msg)
+            try:
+                message_value = self.kafka_conn.decode_message(msg)
+            except MessageDecodeError as e:
+                logger.error("Failed to decode message at %s [%s] @ %s: %s", msg.topic(), msg.partition(), msg.offset(), e)
+                self._dead_letter(msg, e)
+                continue
+
+            if message_value.get('command_type') not in ['CreateOrderCommand', 'UpdateOrderCommand', 'DeleteOrderCommand']:
+                logger.warning("Unexpected command type: %s", message_value.get('command_type'))
+                continue
+
+            if message_value.get('command_type') == 'CreateOrderCommand':
+                creates.append((msg, message_value.get('command_id'), message_value.get('payload', {})))
+
+        command_ids = [command_id for msg, command_id, payload in creates if command_id]
+        already_processed = self.dedupe.filter_processed(command_ids) if self.dedupe and command_ids else set()
+
+        orders = []
+        for msg, command_id, payload in creates:
+            if command_id and (command_id in already_processed or self.ledger.is_pending(command_id)):
+                message_log.info("Command %s has already been applied. Skipping replay.", command_id)
+                continue
+            try:
+                orders.append((msg.partition(), command_id, self._build_order(payload), payload.get('unit_price')))
+            except (KeyError, TypeError, ValueError) as e:
+                logger.error("Invalid order payload, skipping: %s", e)
+                self._set_command_status(command_id, FAILED, 'CreateOrderCommand', error=f"Invalid order payload: {e}")
+                self._dead_letter(msg, e)
+
+        by_partition = {}
+        for partition, command_id, order, unit_price in orders:
+            by_partition.setdefault(partition, set()).add(order.product_id)
+        for partition, product_ids in by_partition.items():
+            self.ledger.load(partition, product_ids)
+        # A duplicate order id would make every flush fail, so it is rejected up front
+        existing_order_ids = {
+            order_id for (order_id,) in db.session.query(Orders.id)
+            .filter(Orders.id.in_([order.id for partition, command_id, order, unit_price in orders])).all()
+        } if orders else set()
+
+        for partition, command_id, order, unit_price in orders:
+            if order.id in existing_order_ids or self.ledger.has_order(order.id):
+                logger.warning("Order %s already exists. Skipping duplicate.", order.id)
+                self._set_command_status(command_id, FAILED, 'CreateOrderCommand', error=f"Order {order.id} already exists")
+                continue
+            available = self.ledger.available(partition, order.product_id)
+            if self.ledger.reserve(partition, order.product_id, order.quantity):
+                self.ledger.add_order(command_id, order, unit_price)
+            else:
+                self.ledger.add_rejection(command_id, order, rejection_reason(order.product_id, order.quantity, available))
+
+        if self.ledger.flush_due():
+            self.flush_ledger()
+
+    def flush_ledger(self):
+        """
+        Writes the ledger's pending orders and inventory deltas in one transaction, then commits the
+        Kafka offsets they came from. If the transaction fails, the in-memory state is discarded and
+        the consumer rewinds to its committed offsets, so the orders are reserved again from the table.
+        Retries back off exponentially; after INVENTORY_FLUSH_MAX_ATTEMPTS failures in a row the consumer
+        stops, leaving the uncommitted orders to the worker that takes over its partitions.
+        """
+        if not self.ledger:
+            return
+        batch = self.ledger.pending_batch()
+        command_ids = [command_id for command_id, order, unit_price in batch.orders if command_id]
+        rejected_command_ids = [command_id for command_id, order, reason in batch.rejections if command_id]
+        try:
+            self.ledger.write(batch)
+            if self.dedupe:
+                for command_id in command_ids + rejected_command_ids:
+                    self.dedupe.record(command_id, 'CreateOrderCommand')
+            db.session.commit()
         except Exception as e:
             db.session.rollback()
-            logger.error(f"Error processing order message: {e}", exc_info=True)
+            self.ledger.reset()
+            self.kafka_conn.rewind_to_committed(self.consumer)
+            self._flush_failures += 1
+            max_attempts = current_app.config.get('INVENTORY_FLUSH_MAX_ATTEMPTS', 5)
+            if self._flush_failures >= max_attempts:
+                logger.critical(f"Inventory ledger flush of {len(batch.orders)} orders failed {self._flush_failures} times in a row: {e}. "
+                                "Stopping the consumer; the orders are replayed from the last commit when it is restarted.", exc_info=True)
+                self.stop_event.set()
+                return
+            backoff = min(0.2 * 2 ** (self._flush_failures - 1), 5.0)
+            logger.error(f"Inventory ledger flush of {len(batch.orders)} orders failed (attempt {self._flush_failures}/{max_attempts}): {e}. "
+                         f"Replaying from the last commit in {backoff:.1f}s.", exc_info=True)
+            self.stop_event.wait(backoff)
+            return
+
+        self._flush_failures = 0
+        if self.dedupe:
+            self.dedupe.committed(*command_ids, *rejected_command_ids)
+        self.ledger.flushed(batch)
+        if batch.offsets:
+            self.kafka_conn.commit_offsets(self.consumer, batch.offsets)
+        if batch.orders:
+            message_log.info("Flushed %d orders and %d inventory deltas", len(batch.orders), len(batch.deltas))
+
+        for command_id in command_ids:
+            self._set_command_status(command_id, APPLIED, 'CreateOrderCommand')
+        self._announce_rejections(batch.rejections)
+        lean = self._lean_analytics_events()
+        products = {}
+        if not lean and batch.orders:
+            product_ids = {order.product_id for command_id, order, unit_price in batch.orders}
+            products = {p.id: p for p in Products.query.filter(Products.id.in_(product_ids)).all()}
+        for command_id, order, unit_price in batch.orders:
+            if lean or order.product_id not in products:
+                self._publish_analytics_event(order, unit_price=unit_price)
+            else:
+                self._publish_analytics_event(order, products[order.product_id])
+
+    def _flush_ledger_if_due(self):
+        if self.ledger.flush_due():
+            self.flush_ledger()
+
+    def _flush_before_revoke(self, partitions):
+        """Persists reservations before partitions move to another consumer, which reloads them from the table."""
+        self.flush_ledger()
+        self.ledger.drop_partitions([p.partition for p in partitions])
+
+    def _build_order(self, payload):
+        return Orders(
+            id=payload['order_id'],
+            product_id=payload['product_id'],
+            quantity=payload['quantity'],
+            total_price=int(payload['total_price']),
+            created_at=datetime.fromisoformat(payload['created_at'].replace('Z', '+00:00')),
+            updated_at=datetime.fromisoformat(payload['updated_at'].replace('Z', '+00:00'))
+        )
+
+    def _lean_analytics_events(self):
+        return current_app.config.get('ANALYTICS_EVENT_MODE', 'full') == 'lean'
+
+    def _publish_analytics_event(self, order, product=None, unit_price=None):
+        """
+        Publishes an order event to the analytics_events topic.
+        With a product the event embeds its details; without one (lean mode) it carries only the
+        product_id, quantity and prices.
+        """
+        analytics_payload = {
+            "event_type": "OrderCreated",
+            "order_id": order.id,
+            "quantity": order.quantity,
+            "total_price": order.total_price,
+            "order_created_at": order.created_at.isoformat() + 'Z',
+        }
+        if product is not None:
+            analytics_payload["product_details"] = {
+                "product_id": product.id,
+                "name": product.name,
+                "price": product.price,
+                "description": product.description,
+                "image_url": product.image_url
+            }
+        else:
+            analytics_payload["product_id"] = order.product_id
+            analytics_payload["price"] = unit_price if unit_price is not None else order.total_price / order.quantity
 
-    def start_consuming(self, topic_name='order_commands'):
-        """Start consuming messages from Kafka using the KafkaConnection's consume_messages method."""
-        if not self.initialize():
+        if self.kafka_conn:
+            self.kafka_conn.produce_message(
+                producer=self.producer,
+                topic='analytics_events',
+                message_obj=analytics_payload,
+                key=order.id
+            )
+            message_log.info("Published enriched order event to analytics_events topic for order %s", order.id)
+        else:
+            logger.warning("Kafka connection not available to publish to analytics_events topic.")
+
+    def start_consuming(self, topic_name='order_commands', reporter=None):
+        """
+        Start consuming messages from Kafka using the KafkaConnection's consume_messages method.
+        reporter, if given, receives partition assignments and consumer lag (see src.kafka.supervisor).
+        A retry topic (see src.kafka.retry) is consumed message by message, each once its delay has passed.
+        """
+        retrying = parse_retry_topic(topic_name)[1] > 0
+        if not self.initialize(retry=retrying):
             logger.error("Failed to initialize Kafka consumer. Aborting consumption.")
             return False
 
         try:
-            self.kafka_conn.subscibe_to_topic(self.consumer, topic_name)
+            self.kafka_conn.subscibe_to_topic(
+                self.consumer,
+                topic_name,
+                on_assign=reporter.on_assign if reporter else None,
+                on_revoke=reporter.on_revoke if reporter else None,
+                on_flush=self._flush_before_revoke if self.ledger else None
+            )
             self.running = True
             logger.info(f"Starting to consume messages from topic: {topic_name}")
 
-            self.kafka_conn.consume_messages(
-                consumer=self.consumer,
-                message_handler=self.handle_order_message,
-                timeout=1.0,
-                stop_event=None
-            )
+            batch_size = self._batch_size()
+            if retrying:
+                self.kafka_conn.consume_delayed(
+                    consumer=self.consumer,
+                    message_handler=self.handle_order_message,
+                    timeout=1.0,
+                    stop_event=self.stop_event,
+                    reporter=reporter
+                )
+            elif self.ledger:
+                self.kafka_conn.consume_batches(
+                    consumer=self.consumer,
+                    batch_handler=self.handle_order_batch_ledger,
+                    batch_size=batch_size if batch_size > 1 else self.ledger.max_pending,
+                    linger_ms=current_app.config.get('ORDER_BATCH_LINGER_MS', 100),
+                    stop_event=self.stop_event,
+                    reporter=reporter,
+                    commit=False,
+                    on_idle=self._flush_ledger_if_due,
+                    on_failure=self._retry
+                )
+            elif batch_size > 1:
+                self.kafka_conn.consume_batches(
+                    consumer=self.consumer,
+                    batch_handler=self.handle_order_batch,
+                    batch_size=batch_size,
+                    linger_ms=current_app.config.get('ORDER_BATCH_LINGER_MS', 100),
+                    stop_event=self.stop_event,
+                    reporter=reporter,
+                    on_failure=self._retry
+                )
+            else:
+                self.kafka_conn.consume_messages(
+                    consumer=self.consumer,
+                    message_handler=self.handle_order_message,
+                    timeout=1.0,
+                    stop_event=self.stop_event,
+                    reporter=reporter
+                )
 
         except Exception as e:
             logger.error(f"An unexpected error occurred during consumer operation: {e}", exc_info=True)
@@ -133,9 +551,23 @@ class OrderConsumer:
             self.shutdown()
             logger.info("OrderConsumer consumption loop has ended.")
 
+    def stop(self):
+        """Asks the consumption loop to finish the message or batch in hand and exit. Safe to call from another thread."""
+        self.stop_event.set()
+
     def shutdown(self):
-        """Cleanup resources"""
+        """
+        Cleanup resources. Runs on the consuming thread once the loop has exited: closing the consumer
+        leaves the group right away, so its partitions are reassigned without waiting for a session timeout.
+        """
         self.running = False
+        if self.ledger and self.consumer:
+            # Reservations still in memory are written, and their offsets committed, before the group is left
+            self.flush_ledger()
         if self.consumer:
             self.consumer.close()
-            logger.info("Kafka consumer closed")
\ No newline at end of file
+            self.consumer = None
+            logger.info("Kafka consumer closed")
+        if self.producer and self.kafka_conn:
+            self.kafka_conn.close_producer(self.producer, timeout=current_app.config.get('PRODUCER_FLUSH_TIMEOUT', 10))
+            self.producer = None
\ No newline at end of file
@@ -5,12 +5,14 @@ import os
 import uuid
 from werkzeug.utils import secure_filename
 from datetime import datetime
-from src.Shop.model import Orders, Products
+from sqlalchemy.orm import joinedload
+from src.Shop.model import Inventory, Orders, Products
+from src.Shop.command_status import PENDING, command_accepted, command_not_sent
+from src.Shop.outbox import enqueue_message
+from src.Shop.pagination import decode_cursor, keyset_page, page_size
 from src import db
-import time
 
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
@@ -23,13 +25,18 @@ class OrderViews:
     
     def _get_kafka_connection(self):
         return current_app.kafka_connection
+
+    def _get_command_status(self):
+        return getattr(current_app, 'command_status', None)
+
+    def _partition_key(self):
+        return current_app.config.get('ORDER_PARTITION_KEY', 'product_id')
     
     def create_order(self, product_id, price):
         """
         Create a new order to kafka
         """
         try:
-            print(price, product_id)
             if request.method == 'GET':
                 return render_template('shop/create_order.html', product_id = product_id, price = int(price))
             elif request.method == 'POST':
@@ -47,47 +54,86 @@ class OrderViews:
                     )
                 except ValueError as e:
                     flash(f"Validation error: {str(e)}", "warning")
+                    return render_template('shop/create_order.html', form_data=request.form), 400
+
+                # Early feedback only: the consumer's conditional decrement is what prevents overselling
+                inventory_item = Inventory.query.filter_by(product_id=product_id).first()
+                if not inventory_item or inventory_item.quantity < order_data.quantity:
+                    flash("Not enough stock to fill this order", "warning")
+                    return render_template('shop/create_order.html', form_data=request.form), 409
 
                 order_id = str(uuid.uuid4())
                 if not producer or not kafka_conn:
                     flash("System error: Unable to process request", "error")
                     return render_template('shop/create_order.html', form_data=request.form), 500
                 
+                command_id = str(uuid.uuid4())
                 command_message = {
-                    "command_id": str(uuid.uuid4()),
+                    "command_id": command_id,
                     "timestamp": datetime.utcnow().isoformat() + 'Z',
                     "command_type": "CreateOrderCommand",
                     "payload": {
                         "order_id": order_id,
                         "product_id": order_data.product_id,
                         "quantity": order_data.quantity,
+                        "unit_price": float(price),
                         "total_price": order_data.total_price,
                         "created_at": datetime.utcnow().isoformat()+'Z',
                         "updated_at": datetime.utcnow().isoformat()+'Z'
                     }
                 }
 
-                kafka_conn.produce_message(
+                # Marked pending before producing so the consumer's update can never be overwritten
+                status_store = self._get_command_status()
+                if status_store:
+                    status_store.set_status(command_id, PENDING, "CreateOrderCommand", order_id=order_id)
+
+                # Keyed by product by default so all orders for a product are handled, in order, by one consumer
+                sent = kafka_conn.produce_message(
                         producer,
                         topic='order_commands',
                         message_obj=command_message,
-                        key=order_id
+                        key=command_message['payload'][self._partition_key()]
+                    )
+                if not sent:
+                    return command_not_sent(
+                        command_id, status_store, "CreateOrderCommand",
+                        lambda: render_template('shop/create_order.html', form_data=request.form),
+                        order_id=order_id
                     )
 
                 logger.info(f"Created order command for {order_id}")
-                flash("order creation request received!", "success")
-                time.sleep(2)
-                return redirect(url_for('shop.list_orders'))
+                return command_accepted(
+                    command_id, status_store,
+                    redirect_to=url_for('shop.list_orders'),
+                    message="order creation request received!"
+                )
         except Exception as e:
             logger.error(f"Order creation failed: {str(e)}", exc_info=True)
             flash("An unexpected error occurred. Please try again.", "error")
             return render_template('shop/create_order.html', form_data=request.form), 500
 
     def list_orders(self):
-        """list orders"""
+        """list orders, one keyset page at a time"""
+        cursor = request.args.get('cursor') or None
+        per_page = page_size(request.args.get('per_page', type=int), current_app.config['ITEMS_PER_PAGE'])
+        page_args = {'per_page': per_page} if request.args.get('per_page') else {}
+        if cursor:
+            try:
+                decode_cursor(cursor)
+            except ValueError:
+                flash("Invalid page cursor. Showing the first page.", "warning")
+                return redirect(url_for('shop.list_orders', **page_args))
         try:
-            orders = Orders.query.all()
-            return render_template('shop/list_orders.html', orders=orders)
+            # The template links each order to its product, so id and name come in the same SELECT
+            query = Orders.query.options(joinedload(Orders.product).load_only(Products.id, Products.name))
+            orders, next_cursor = keyset_page(
+                query, Orders.created_at, Orders.id, cursor, per_page,
+                row_key=lambda order: (order.created_at, order.id)
+            )
+            next_url = url_for('shop.list_orders', cursor=next_cursor, **page_args) if next_cursor else None
+            first_url = url_for('shop.list_orders', **page_args) if cursor else None
+            return render_template('shop/list_orders.html', orders=orders, next_url=next_url, first_url=first_url)
         except Exception as e:
             logger.error(f"Error listing orders: {str(e)}", exc_info=True)
             flash("An unexpected error occurred while retrieving orders.", "error")
@@ -96,10 +142,10 @@ class OrderViews:
     def get_order(self, order_id):
         """get order"""
         try:
-            order = Orders.query.get(order_id)
+            order = Orders.query.options(joinedload(Orders.product)).filter(Orders.id == order_id).first()
             if not order:
                 flash("Order not found", "warning")
-                return redirect(url_for('order.list_orders'))
+                return redirect(url_for('shop.list_orders'))
             return render_template('shop/order_details.html', order=order)
         except Exception as e:
             logger.error(f"Error getting order {order_id}: {str(e)}", exc_info=True)
@@ -112,34 +158,29 @@ class OrderViews:
     def delete_order(self, order_id):
         """delete order"""
         try:
-            producer = self._get_kafka_producer()
-            kafka_conn = self._get_kafka_connection()
-
             order = Orders.query.get(order_id)
             if not order:
                 flash("Order not found", "warning")
+                return redirect(url_for('shop.list_orders'))
             db.session.delete(order)
-            db.session.commit()
 
-            # Sending Kafka Delete Command
+            # Kafka Delete Command, written to the outbox in the same transaction
             command_message = {
                     "command_id": str(uuid.uuid4()),
                     "command_type": "DeleteOrderCommand",
                     "timestamp": datetime.utcnow().isoformat() + 'Z',
+                    "db_applied": True,
                     "payload": {
                         "order_id": order_id
                     }
                 }
-            
-            kafka_conn.produce_message(
-                    producer,
-                    topic='order_commands',
-                    message_obj=command_message,
-                    key=order_id
-                )
+            enqueue_message('order_commands', command_message, key=getattr(order, self._partition_key(), order_id))
+
+            db.session.commit()
             flash("Order deleted successfully!", "success")
             return redirect(url_for('shop.list_orders'))
         except Exception as e:
+            db.session.rollback()
             logger.error(f"Error deleting order {order_id}: {str(e)}", exc_info=True)
             flash("An unexpected error occurred while deleting the order.", "error")
             return redirect(url_for('shop.list_orders'))
@@ -0,0 +1,150 @@
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from src import db
+from src.Shop.model import OutboxMessages
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_message(topic, message_obj, key=None):
+    """
+    Adds a Kafka message to the outbox in the current session.
+    It is written in the caller's transaction, so the message exists if and only if the DB change
+    it describes was committed. The OutboxRelay publishes it afterwards.
+    """
+    db.session.add(OutboxMessages(
+        topic=topic,
+        message_key=key,
+        payload=json.dumps(message_obj),
+        created_at=datetime.utcnow()
+    ))
+
+
+class OutboxRelay(threading.Thread):
+    """
+    Publishes outbox rows to Kafka in id order, batch_size rows at a time, and marks them sent once
+    the broker has acknowledged them. Only the rows before the first failure are marked, so a failed
+    row and everything after it is published again, in order, on the next pass. A row that has failed
+    max_attempts times is parked (dead_lettered_at is set) and skipped from then on. Sent rows are
+    deleted after retention_hours.
+    Delivery is at-least-once: a crash between the acknowledgement and the sent_at update republishes
+    the batch, which the consumers skip through their command_id dedupe.
+    """
+    PRUNE_INTERVAL_SECONDS = 300
+
+    def __init__(self, app, kafka_conn, batch_size=100, poll_interval=0.5, retention_hours=24, flush_timeout=10,
+                 max_attempts=10):
+        super().__init__(name='outbox-relay', daemon=True)
+        self.app = app
+        self.kafka_conn = kafka_conn
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retention = timedelta(hours=retention_hours)
+        self.flush_timeout = flush_timeout
+        self.max_attempts = max_attempts
+        self.producer = None
+        self._stop_event = threading.Event()
+        self._last_prune = 0.0
+
+    def run(self):
+        # Deliveries are collected by flushing after every batch, so no poller thread is needed
+        self.producer = self.kafka_conn.create_producer(start_poller=False)
+        if not self.producer:
+            logger.error("Outbox relay could not create a Kafka producer. Outbox messages will not be published.")
+            return
+
+        logger.info("Outbox relay started.")
+        with self.app.app_context():
+            while not self._stop_event.is_set():
+                try:
+                    published = self.relay_batch()
+                    self._maybe_prune()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Outbox relay error: {e}", exc_info=True)
+                    published = 0
+                finally:
+                    db.session.remove()
+                # Drain a backlog without pausing; otherwise wait for new rows
+                if published < self.batch_size:
+                    self._stop_event.wait(self.poll_interval)
+
+        self.kafka_conn.close_producer(self.producer)
+        logger.info("Outbox relay stopped.")
+
+    def relay_batch(self):
+        """Publishes the oldest unsent rows. Returns the number of rows that were sent."""
+        rows = OutboxMessages.query\
+            .filter(OutboxMessages.sent_at.is_(None), OutboxMessages.dead_lettered_at.is_(None))\
+            .order_by(OutboxMessages.id)\
+            .limit(self.batch_size)\
+            .all()
+        if not rows:
+            return 0
+
+        errors = {}
+        acked = set()
+        for row in rows:
+            def on_delivery(err, msg, row_id=row.id):
+                if err is None:
+                    acked.add(row_id)
+                else:
+                    errors[row_id] = str(err)
+            if not self.kafka_conn.produce_message(self.producer, row.topic, json.loads(row.payload), row.message_key, on_delivery=on_delivery):
+                errors[row.id] = "could not be queued"
+                break
+
+        remaining = self.producer.flush(self.flush_timeout)
+        if remaining:
+            logger.warning(f"Outbox relay: {remaining} message(s) still in flight after {self.flush_timeout}s.")
+
+        # Rows acked after a failed or unconfirmed one stay unsent, so the next pass keeps the order
+        sent = []
+        for row in rows:
+            if row.id not in acked:
+                break
+            sent.append(row.id)
+
+        now = datetime.utcnow()
+        if sent:
+            db.session.execute(
+                db.update(OutboxMessages)
+                .where(OutboxMessages.id.in_(sent))
+                .values(sent_at=now)
+            )
+        parked = []
+        for row in rows:
+            if row.id in errors:
+                row.attempts = (row.attempts or 0) + 1
+                row.last_error = errors[row.id]
+                if row.attempts >= self.max_attempts:
+                    row.dead_lettered_at = now
+                    parked.append(row)
+        db.session.commit()
+
+        if errors:
+            logger.error(f"Outbox relay: {len(errors)} of {len(rows)} message(s) failed; "
+                         f"{len(rows) - len(sent)} will be published again.")
+        for row in parked:
+            logger.error(f"Outbox relay: parked message {row.id} for topic '{row.topic}' after {row.attempts} "
+                         f"failed attempts: {row.last_error}")
+        return len(sent)
+
+    def _maybe_prune(self):
+        if time.monotonic() - self._last_prune < self.PRUNE_INTERVAL_SECONDS:
+            return
+        self._last_prune = time.monotonic()
+        deleted = OutboxMessages.query\
+            .filter(OutboxMessages.sent_at < datetime.utcnow() - self.retention)\
+            .delete(synchronize_session=False)
+        db.session.commit()
+        if deleted:
+            logger.info(f"Pruned {deleted} sent outbox messages.")
+
+    def stop(self, timeout=15):
+        self._stop_event.set()
+        self.join(timeout)
@@ -0,0 +1,53 @@
+import base64
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+MAX_PER_PAGE = 100
+
+
+def encode_cursor(created_at, item_id):
+    """Encodes the (created_at, id) position of the last row of a page into an opaque URL-safe cursor."""
+    raw = f"{created_at.isoformat()}|{item_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Decodes a cursor produced by encode_cursor. Raises ValueError for malformed cursors."""
+    try:
+        created_at, item_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|', 1)
+        return datetime.fromisoformat(created_at), item_id
+    except (UnicodeError, ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def page_size(requested, default):
+    """Clamps a requested page size to 1..MAX_PER_PAGE, using default when none was requested."""
+    if not requested:
+        return default
+    return max(1, min(requested, MAX_PER_PAGE))
+
+
+def keyset_page(query, created_at_column, id_column, cursor, per_page, row_key):
+    """
+    Returns (rows, next_cursor) for one page of query, newest first.
+
+    Rows are ordered by (created_at, id) descending and the page starts strictly after the cursor
+    position, so the DB can seek straight to it through an index on (created_at, id) instead of
+    scanning and discarding OFFSET rows. row_key(row) must return the row's (created_at, id).
+    next_cursor is None on the last page.
+    """
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            created_at_column < cursor_created_at,
+            and_(created_at_column == cursor_created_at, id_column < cursor_id)
+        ))
+
+    rows = query.order_by(created_at_column.desc(), id_column.desc()).limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(*row_key(rows[-1]))
+    return rows, next_cursor
@@ -1,43 +1,76 @@
-import json
+import threading
 from datetime import datetime
 
 from flask import current_app
 from src import db
 from src.Shop.model import Products, Inventory
+from src.Shop.command_status import APPLIED, FAILED
+from src.Shop.dedupe import CommandDeduplicator
+from src.kafka.retry import FailureRouter, parse_retry_topic
+from src.kafka.serialization import MessageDecodeError
+from src.logging_config import message_logger
 import logging
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
+# Per-message events, sampled and rate limited (see src/logging_config.py)
+message_log = message_logger(__name__)
 
 class ProductConsumer:
     def __init__(self):
         self.kafka_conn = None
         self.consumer = None
+        self.producer = None
         self.running = False
+        self.dedupe = None
+        self.status_store = None
+        self.cache = None
+        self.failures = None
+        self.stop_event = threading.Event()
 
     def _get_kafka_connection(self):
         return current_app.kafka_connection
 
-    def initialize(self):
-        """Initialize the consumer connection"""
+    def initialize(self, retry=False):
+        """
+        Initialize the consumer connection.
+        retry=True sets up a consumer for a retry topic, in a consumer group of its own.
+        """
         self.kafka_conn = self._get_kafka_connection()
         if not self.kafka_conn:
             return False
         
-        self.consumer = self.kafka_conn.create_consumer()
+        self.cache = getattr(current_app, 'product_cache', None)
+        self.status_store = getattr(current_app, 'command_status', None)
+        self.dedupe = CommandDeduplicator(
+            max_entries=current_app.config.get('DEDUPE_CACHE_SIZE', 10000),
+            retention_hours=current_app.config.get('DEDUPE_RETENTION_HOURS', 168)
+        )
+
+        self.consumer = self.kafka_conn.create_consumer(role='product-retry' if retry else 'product')
         if not self.consumer:
             return False
-        
+
+        self.producer = self.kafka_conn.create_producer()
+        if not self.producer:
+            return False
+
+        self.failures = FailureRouter(self.kafka_conn, self.producer, current_app.config.get('RETRY_DELAYS_SECONDS', ()))
         return True
 
     def handle_product_message(self, msg):
         """Process a single product creation message"""
+        command_id = None
         try:
-            message_value = json.loads(msg.value().decode('utf-8'))
-            logger.info(f"Processing product message: {message_value}")
+            message_value = self.kafka_conn.decode_message(msg)
+            message_log.debug("Processing product message: %s", message_value)
 
             if message_value.get('command_type') not in ['CreateProductCommand', 'UpdateProductCommand', 'DeleteProductCommand']:
-                logger.warning(f"Unexpected command type: {message_value.get('command_type')}")
+                logger.warning("Unexpected command type: %s", message_value.get('command_type'))
+                return
+
+            command_id = message_value.get('command_id')
+            if command_id and self.dedupe and self.dedupe.is_processed(command_id):
+                message_log.info("Command %s has already been applied. Skipping replay.", command_id)
                 return
 
             payload = message_value.get('payload', {})
@@ -65,10 +98,10 @@ class ProductConsumer:
 
                 db.session.add(new_inventory)
                 db.session.add(new_product)
-                logger.info(f"Successfully created product {new_product.id} and inventory record")
+                message_log.info("Successfully created product %s and inventory record", new_product.id)
 
-            # update product
-            if message_value.get('command_type') == 'UpdateProductCommand':
+            # update product, unless the view already wrote it in the same transaction as the outbox message
+            if message_value.get('command_type') == 'UpdateProductCommand' and not message_value.get('db_applied'):
                 product = Products.query.get(payload['product_id'])
                 if product:
                     product.name = payload['name']
@@ -85,34 +118,103 @@ class ProductConsumer:
 
                 db.session.add(product)
                 db.session.add(inventory_item)
-                logger.info(f"Successfully updated product {product.id} and inventory record")
+                message_log.info("Successfully updated product %s and inventory record", product.id)
 
+            if command_id and self.dedupe:
+                self.dedupe.record(command_id, message_value.get('command_type'))
             db.session.commit()
+            if command_id and self.dedupe:
+                self.dedupe.committed(command_id)
+            self._set_command_status(command_id, APPLIED, message_value.get('command_type'))
 
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to decode message: {e}")
+            if self.cache and payload.get('product_id'):
+                self.cache.invalidate_product(payload['product_id'])
+
+            self._publish_product_event(message_value.get('command_type'), payload)
+
+        except MessageDecodeError as e:
+            logger.error("Failed to decode message: %s", e)
+            self._dead_letter(msg, e)
         except KeyError as e:
-            logger.error(f"Missing required field in message: {e}")
+            db.session.rollback()
+            logger.error("Missing required field in message: %s", e)
+            self._set_command_status(command_id, FAILED, error=f"Missing required field: {e}")
+            self._dead_letter(msg, e)
         except Exception as e:
             db.session.rollback()
-            logger.error(f"Error processing product message: {e}", exc_info=True)
-
-    def start_consuming(self, topic_name='product_commands'):
-            """Start consuming messages from Kafka using the KafkaConnection's consume_messages method."""
-            if not self.initialize():
+            logger.error("Error processing product message: %s", e, exc_info=True)
+            if not self._retry(msg, e):
+                self._set_command_status(command_id, FAILED, error=str(e))
+
+    def _publish_product_event(self, command_type, payload):
+        """
+        Publishes the product's latest state to the compacted product_events topic, keyed by product_id.
+        Deletions are published as tombstones so compaction eventually drops the product.
+        """
+        product_id = payload.get('product_id')
+        if not product_id or not self.kafka_conn or not self.producer:
+            return
+
+        if command_type == 'DeleteProductCommand':
+            self.kafka_conn.produce_tombstone(self.producer, 'product_events', key=product_id)
+            return
+
+        self.kafka_conn.produce_message(
+            producer=self.producer,
+            topic='product_events',
+            message_obj={
+                "event_type": "ProductUpserted",
+                "product_id": product_id,
+                "name": payload.get('name'),
+                "price": payload.get('price'),
+                "description": payload.get('description'),
+                "image_url": payload.get('image_url'),
+                "updated_at": payload.get('updated_at')
+            },
+            key=product_id
+        )
+
+    def _set_command_status(self, command_id, status, command_type=None, error=None):
+        if self.status_store and command_id:
+            self.status_store.set_status(command_id, status, command_type, error=error)
+
+    def _retry(self, msg, error):
+        """Schedules a failed message for another attempt. Returns False if it was dead-lettered instead, or retries are off."""
+        return self.failures.retry(msg, error) if self.failures else False
+
+    def _dead_letter(self, msg, error):
+        """Sends a message that can never succeed straight to the dead-letter topic"""
+        if self.failures:
+            self.failures.dead_letter(msg, error)
+
+    def start_consuming(self, topic_name='product_commands', reporter=None):
+            """
+            Start consuming messages from Kafka using the KafkaConnection's consume_messages method.
+            reporter, if given, receives partition assignments and consumer lag (see src.kafka.supervisor).
+            A retry topic (see src.kafka.retry) is consumed message by message, each once its delay has passed.
+            """
+            retrying = parse_retry_topic(topic_name)[1] > 0
+            if not self.initialize(retry=retrying):
                 logger.error("Failed to initialize Kafka consumer. Aborting consumption.")
                 return False
 
             try:
-                self.kafka_conn.subscibe_to_topic(self.consumer, topic_name)
+                self.kafka_conn.subscibe_to_topic(
+                    self.consumer,
+                    topic_name,
+                    on_assign=reporter.on_assign if reporter else None,
+                    on_revoke=reporter.on_revoke if reporter else None
+                )
                 self.running = True
                 logger.info(f"Starting to consume messages from topic: {topic_name}")
 
-                self.kafka_conn.consume_messages(
+                consume = self.kafka_conn.consume_delayed if retrying else self.kafka_conn.consume_messages
+                consume(
                     consumer=self.consumer,
                     message_handler=self.handle_product_message,
                     timeout=1.0,
-                    stop_event=None
+                    stop_event=self.stop_event,
+                    reporter=reporter
                 )
 
             except Exception as e:
@@ -121,9 +223,20 @@ class ProductConsumer:
                 self.shutdown()
                 logger.info("ProductConsumer consumption loop has ended.")
 
+    def stop(self):
+        """Asks the consumption loop to finish the message or batch in hand and exit. Safe to call from another thread."""
+        self.stop_event.set()
+
     def shutdown(self):
-        """Cleanup resources"""
+        """
+        Cleanup resources. Runs on the consuming thread once the loop has exited: closing the consumer
+        leaves the group right away, so its partitions are reassigned without waiting for a session timeout.
+        """
         self.running = False
         if self.consumer:
             self.consumer.close()
-            logger.info("Kafka consumer closed")
\ No newline at end of file
+            self.consumer = None
+            logger.info("Kafka consumer closed")
+        if self.producer and self.kafka_conn:
+            self.kafka_conn.close_producer(self.producer, timeout=current_app.config.get('PRODUCER_FLUSH_TIMEOUT', 10))
+            self.producer = None
\ No newline at end of file
@@ -1,6 +1,7 @@
 from flask import Blueprint
 from src.Shop.views import ShopViews
 from src.Shop.orderviews import OrderViews
+from src.Shop.analyticsviews import AnalyticsViews
 
 
 # Create the shop blueprint
@@ -9,6 +10,7 @@ shop_bp = Blueprint('shop', __name__, template_folder='templates')
 # Initialize the view class
 shop_views = ShopViews()
 order_views = OrderViews()
+analytics_views = AnalyticsViews()
 
 # Define routes
 @shop_bp.route('/')
@@ -27,6 +29,18 @@ def list_products():
 def get_product(product_id):
     return shop_views.get_product(product_id)
 
+@shop_bp.route('/commands/<string:command_id>')
+def command_status(command_id):
+    return shop_views.command_status(command_id)
+
+@shop_bp.route('/cache/stats')
+def cache_stats():
+    return shop_views.cache_stats()
+
+@shop_bp.route('/kafka/traffic')
+def kafka_traffic():
+    return shop_views.kafka_traffic()
+
 @shop_bp.route('/products/<product_id>/update', methods=['POST', 'GET'])
 def update_product(product_id):
     return shop_views.update_product(product_id)
@@ -37,8 +51,6 @@ def delete_product(product_id):
 
 @shop_bp.route('/product/create-order/<string:product_id>/<price>', methods=['GET', 'POST'])
 def create_order(product_id, price):
-    print(product_id)
-    print(price)
     return order_views.create_order(product_id, price)
 
 @shop_bp.route('/orders')
@@ -52,4 +64,16 @@ def get_order(order_id):
 @shop_bp.route('/orders/<string:order_id>/delete', methods=['POST'])
 def delete_order(order_id):
     return order_views.delete_order(order_id)
-    
\ No newline at end of file
+    
+
+@shop_bp.route('/analytics/summary')
+def analytics_summary():
+    return analytics_views.summary()
+
+@shop_bp.route('/analytics/top-products')
+def analytics_top_products():
+    return analytics_views.top_products()
+
+@shop_bp.route('/analytics/products/<string:product_id>')
+def analytics_product_series(product_id):
+    return analytics_views.product_series(product_id)
@@ -1,20 +1,23 @@
 import logging
-from flask import current_app, render_template, request, redirect, url_for, flash
+from flask import current_app, render_template, request, redirect, url_for, flash, jsonify
 from src.Shop.validation import ProductCreateCommand
 import os
 import uuid
 from werkzeug.utils import secure_filename
 from datetime import datetime
 from src.Shop.model import Products, Inventory
+from src.Shop.command_status import PENDING, command_accepted, command_not_sent
+from src.Shop.outbox import enqueue_message
+from src.Shop.pagination import decode_cursor, keyset_page, page_size
+from sqlalchemy import func
 from src import db
-import time
 
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 UPLOAD_FOLDER = os.path.join(os.getcwd(), 'src', 'static', 'uploads')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+DEFAULT_LOW_STOCK_THRESHOLD = 10
 
 def allowed_file(filename):
     return '.' in filename and \
@@ -30,6 +33,17 @@ class ShopViews:
     def _get_kafka_connection(self):
         return current_app.kafka_connection
 
+    def _get_command_status(self):
+        return getattr(current_app, 'command_status', None)
+
+    def _get_product_cache(self):
+        return getattr(current_app, 'product_cache', None)
+
+    def _invalidate_product_cache(self, product_id):
+        cache = self._get_product_cache()
+        if cache:
+            cache.invalidate_product(product_id)
+
     def create_product(self):
         """
         Handles product creation to Kafka.
@@ -82,8 +96,9 @@ class ShopViews:
                     flash("System error: Unable to process request", "error")
                     return render_template('shop/create_product.html', form_data=request.form), 500
 
+                command_id = str(uuid.uuid4())
                 command_message = {
-                    "command_id": str(uuid.uuid4()),
+                    "command_id": command_id,
                     "command_type": "CreateProductCommand",
                     "timestamp": datetime.utcnow().isoformat() + 'Z',
                     "payload": {
@@ -98,17 +113,32 @@ class ShopViews:
                     }
                 }
 
-                kafka_conn.produce_message(
+                # Marked pending before producing so the consumer's update can never be overwritten
+                status_store = self._get_command_status()
+                if status_store:
+                    status_store.set_status(command_id, PENDING, "CreateProductCommand", product_id=product_id)
+
+                sent = kafka_conn.produce_message(
                     producer,
                     topic='product_commands',
                     message_obj=command_message,
                     key=product_id
                 )
+                if not sent:
+                    if image_path and os.path.exists(image_path):
+                        os.remove(image_path)
+                    return command_not_sent(
+                        command_id, status_store, "CreateProductCommand",
+                        lambda: render_template('shop/create_product.html', form_data=request.form),
+                        product_id=product_id
+                    )
 
                 logger.info(f"Created product command for {product_id}")
-                flash("Product creation request received!", "success")
-                time.sleep(2)
-                return redirect(url_for('shop.list_products'))
+                return command_accepted(
+                    command_id, status_store,
+                    redirect_to=url_for('shop.list_products'),
+                    message="Product creation request received!"
+                )
 
             except Exception as e:
                 logger.error(f"Product creation failed: {str(e)}", exc_info=True)
@@ -151,8 +181,6 @@ class ShopViews:
             return render_template('shop/update_product.html', product=product, form_data=form_data)
 
         elif request.method == 'POST':
-            producer = self._get_kafka_producer()
-            kafka_conn = self._get_kafka_connection()
             new_image_absolute_path = None
             old_image_relative_path = product.image_url
             
@@ -203,20 +231,14 @@ class ShopViews:
                         updated_at=datetime.utcnow()
                     )
                     db.session.add(inventory_item)
-                
-                db.session.commit()
 
-                # Deleting old image file if a new one was uploaded
-                if new_image_absolute_path and old_image_relative_path and old_image_relative_path != new_image_relative_path_for_db:
-                    old_image_absolute_path = os.path.join(os.getcwd(), 'src', 'static', old_image_relative_path)
-                    if os.path.exists(old_image_absolute_path):
-                        os.remove(old_image_absolute_path)
-
-                # Kafka Update Command
+                # Kafka Update Command, written to the outbox in the same transaction.
+                # db_applied tells the consumer the row is already up to date.
                 command_message = {
                     "command_id": str(uuid.uuid4()),
                     "command_type": "UpdateProductCommand",
                     "timestamp": datetime.utcnow().isoformat() + 'Z',
+                    "db_applied": True,
                     "payload": {
                         "product_id": product.id,
                         "name": product.name,
@@ -228,12 +250,16 @@ class ShopViews:
                         "updated_at": product.updated_at.isoformat() + 'Z'
                     }
                 }
-                kafka_conn.produce_message(
-                    producer,
-                    topic='product_commands',
-                    message_obj=command_message,
-                    key=product.id
-                )
+                enqueue_message('product_commands', command_message, key=product.id)
+
+                db.session.commit()
+                self._invalidate_product_cache(product.id)
+
+                # Deleting old image file if a new one was uploaded
+                if new_image_absolute_path and old_image_relative_path and old_image_relative_path != new_image_relative_path_for_db:
+                    old_image_absolute_path = os.path.join(os.getcwd(), 'src', 'static', old_image_relative_path)
+                    if os.path.exists(old_image_absolute_path):
+                        os.remove(old_image_absolute_path)
 
                 flash("Product updated successfully!", "success")
                 return redirect(url_for('shop.get_product', product_id=product.id))
@@ -252,9 +278,6 @@ class ShopViews:
 
     def delete_product(self, product_id):
         if request.method == 'POST':
-            producer = self._get_kafka_producer()
-            kafka_conn = self._get_kafka_connection()
-            
             try:
                 product = Products.query.get(product_id)
                 if not product:
@@ -273,23 +296,21 @@ class ShopViews:
                 db.session.delete(product)
                 if inventory_item:
                     db.session.delete(inventory_item)
-                db.session.commit()
 
-                # Sending Kafka Delete Command
+                # Kafka Delete Command, written to the outbox in the same transaction
                 command_message = {
                     "command_id": str(uuid.uuid4()),
                     "command_type": "DeleteProductCommand",
                     "timestamp": datetime.utcnow().isoformat() + 'Z',
+                    "db_applied": True,
                     "payload": {
                         "product_id": product_id
                     }
                 }
-                kafka_conn.produce_message(
-                    producer,
-                    topic='product_commands',
-                    message_obj=command_message,
-                    key=product_id
-                )
+                enqueue_message('product_commands', command_message, key=product_id)
+
+                db.session.commit()
+                self._invalidate_product_cache(product_id)
 
                 flash("Product deleted successfully!", "success")
                 return redirect(url_for('shop.list_products'))
@@ -301,53 +322,141 @@ class ShopViews:
         
         return "Method Not Allowed", 405
 
+    def _product_to_dict(self, product, quantity):
+        return {
+            'id': product.id,
+            'name': product.name,
+            'price': product.price,
+            'description': product.description,
+            'image_url': product.image_url,
+            'created_at': product.created_at,
+            'updated_at': product.updated_at,
+            'stock_quantity': quantity if quantity is not None else 0
+        }
+
+    def _product_filters(self):
+        """Reads the optional listing filters from the query string"""
+        return {
+            'name': (request.args.get('name') or '').strip() or None,
+            'min_price': request.args.get('min_price', type=float),
+            'max_price': request.args.get('max_price', type=float),
+            'low_stock': request.args.get('low_stock') in ('1', 'true', 'on'),
+        }
+
+    def _load_product_list(self, filters, cursor, per_page):
+        query = db.session.query(
+            Products,
+            Inventory.quantity
+        ).outerjoin(Inventory, Products.id == Inventory.product_id)
+
+        if filters['name']:
+            # Range instead of LIKE so the prefix match can use ix_products_name
+            query = query.filter(Products.name >= filters['name'], Products.name < filters['name'] + '\uffff')
+        if filters['min_price'] is not None:
+            query = query.filter(Products.price >= filters['min_price'])
+        if filters['max_price'] is not None:
+            query = query.filter(Products.price <= filters['max_price'])
+        if filters['low_stock']:
+            query = query.filter(func.coalesce(Inventory.quantity, 0) <= func.coalesce(Inventory.low_stock_threshold, DEFAULT_LOW_STOCK_THRESHOLD))
+
+        rows, next_cursor = keyset_page(
+            query, Products.created_at, Products.id, cursor, per_page,
+            row_key=lambda row: (row[0].created_at, row[0].id)
+        )
+
+        # Format the data for the template
+        return {
+            'products': [self._product_to_dict(product, quantity) for product, quantity in rows],
+            'next_cursor': next_cursor
+        }
+
+    def _load_product(self, product_id):
+        product_with_inventory = db.session.query(
+            Products,
+            Inventory.quantity
+        ).outerjoin(Inventory, Products.id == Inventory.product_id)\
+        .filter(Products.id == product_id)\
+        .first()
+
+        if not product_with_inventory:
+            return None
+
+        product, quantity = product_with_inventory
+        return self._product_to_dict(product, quantity)
+
     def list_products(self):
-        """list products"""
+        """list products, one keyset page at a time"""
+        filters = self._product_filters()
+        filter_args = {k: v for k, v in request.args.items() if k in ('name', 'min_price', 'max_price', 'low_stock', 'per_page') and v}
+        cursor = request.args.get('cursor') or None
+        per_page = page_size(request.args.get('per_page', type=int), current_app.config['ITEMS_PER_PAGE'])
+        if cursor:
+            try:
+                decode_cursor(cursor)
+            except ValueError:
+                flash("Invalid page cursor. Showing the first page.", "warning")
+                return redirect(url_for('shop.list_products', **filter_args))
         try:
-            products_with_inventory = db.session.query(
-                Products,
-                Inventory.quantity
-            ).outerjoin(Inventory, Products.id == Inventory.product_id).all()
-
-            # Format the data for the template
-            products_for_template = []
-            for product, quantity in products_with_inventory:
-                product_dict = {
-                    'id': product.id,
-                    'name': product.name,
-                    'price': product.price,
-                    'description': product.description,
-                    'image_url': product.image_url,
-                    'created_at': product.created_at,
-                    'updated_at': product.updated_at,
-                    'stock_quantity': quantity if quantity is not None else 0
-                }
-                products_for_template.append(product_dict)
-            return render_template('shop/list_products.html', products=products_for_template)
+            loader = lambda: self._load_product_list(filters, cursor, per_page)
+            cache = self._get_product_cache()
+            if cache:
+                variant = f"{cursor}:{per_page}:{filters['name']}:{filters['min_price']}:{filters['max_price']}:{filters['low_stock']}"
+                page = cache.get_product_list(loader, variant=variant)
+            else:
+                page = loader()
+
+            next_url = url_for('shop.list_products', cursor=page['next_cursor'], **filter_args) if page['next_cursor'] else None
+            first_url = url_for('shop.list_products', **filter_args) if cursor else None
+            return render_template('shop/list_products.html', products=page['products'], filters=filters,
+                                   next_url=next_url, first_url=first_url)
         except Exception as e:
             logger.error(f"Error listing products: {str(e)}", exc_info=True)
             flash("An unexpected error occurred while retrieving products.", "error")
-            return render_template('shop/list_products.html', products=[])
+            return render_template('shop/list_products.html', products=[], filters=filters)
 
     def get_product(self, product_id):
         """get product"""
         try:
-            product_with_inventory = db.session.query(
-                Products,
-                Inventory.quantity
-            ).outerjoin(Inventory, Products.id == Inventory.product_id)\
-            .filter(Products.id == product_id)\
-            .first()
-
-            if not product_with_inventory:
+            cache = self._get_product_cache()
+            if cache:
+                product = cache.get_product(product_id, lambda: self._load_product(product_id))
+            else:
+                product = self._load_product(product_id)
+
+            if not product:
                 flash("Product not found", "warning")
                 return redirect(url_for('shop.list_products'))
 
-            product, quantity = product_with_inventory
-            stock_quantity = quantity if quantity is not None else 0
-
-            return render_template('shop/product_details.html', product=product, stock_quantity=stock_quantity)
+            return render_template('shop/product_details.html', product=product, stock_quantity=product['stock_quantity'])
         except Exception as e:
             logger.error(f"Error getting product {product_id}: {str(e)}", exc_info=True)
             flash("An unexpected error occurred while retrieving the product.", "error")
-            return redirect(url_for('shop.list_products'))
\ No newline at end of file
+            return redirect(url_for('shop.list_products'))
+
+    def cache_stats(self):
+        """product cache hit/miss counters"""
+        cache = self._get_product_cache()
+        return jsonify(cache.stats() if cache else {})
+
+    def kafka_traffic(self):
+        """per-partition message rates and hot keys of the messages this process produced"""
+        kafka_conn = self._get_kafka_connection()
+        if not kafka_conn:
+            return jsonify({})
+        top_n = min(request.args.get('top', type=int) or 10, 100)
+        return jsonify(kafka_conn.produced_traffic.snapshot(top_n))
+
+    def command_status(self, command_id):
+        """
+        Status of a command sent to Kafka: pending, applied, rejected or failed.
+        ?wait=<seconds> long-polls until the command leaves the pending state.
+        """
+        status_store = self._get_command_status()
+        if not status_store:
+            return jsonify({'error': 'Command status tracking is unavailable'}), 503
+
+        wait = min(request.args.get('wait', type=float) or 0, current_app.config['COMMAND_STATUS_MAX_WAIT'])
+        entry = status_store.wait_for(command_id, wait) if wait > 0 else status_store.get_status(command_id)
+        if not entry:
+            return jsonify({'command_id': command_id, 'error': 'Unknown or expired command'}), 404
+        return jsonify(entry)
@@ -2,44 +2,70 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from src.config import Config
+from src.database import apply_sqlite_pragmas, configure_engine, track_commit_time
 from src.kafka.connection import KafkaConnection
+from src.logging_config import configure_logging
+from src.metrics import metrics_view
 from src.redis.redis_connection import RedisConnection
+import atexit
 import logging
 import os
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 db = SQLAlchemy()
 migrate = Migrate()
 
-def create_app(config_class=Config):
+def create_app(config_class=Config, kafka_connection=None, redis_connection=None):
     """
     Application factory function.
     Creates and configures a Flask application instance, initializes database,
     and sets up Kafka topics and a producer.
+    kafka_connection and redis_connection replace the clients built from the environment,
+    e.g. with in-process stand-ins for benchmarks (see benchmarks/e2e_benchmark.py).
     """
     app = Flask(__name__, static_folder=os.path.join(os.getcwd(), 'src', 'static'))
     app.config.from_object(config_class)
+    configure_logging(app.config)
     app.logger.info(f"Application starting up with config: {config_class.__name__}")
 
     # Initialize extensions with the application instance
+    configure_engine(app)
     db.init_app(app)
     migrate.init_app(app, db)
+    with app.app_context():
+        apply_sqlite_pragmas(app, db.engine)
+    track_commit_time()
 
+    from src.Shop.cache import ProductCache
+    from src.Shop.command_status import CommandStatusStore
+    from src.analytics.aggregates import AnalyticsAggregates
     from src.Shop.routes import shop_bp
     app.register_blueprint(shop_bp, url_prefix='/shop')
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
 
     with app.app_context():
         from src.Shop.model import Products, Orders, Inventory
         db.create_all()
         app.logger.info("Database tables checked/created.")
 
-        kafka_conn = KafkaConnection()
+        kafka_conn = kafka_connection or KafkaConnection()
         app.logger.info("KafkaConnection instance created.")
 
-        app.redis_connection = RedisConnection()
+        app.redis_connection = redis_connection or RedisConnection()
         app.logger.info("RedisConnection instance created.")
+        if app.redis_connection.connect():
+            app.logger.info("Connected to Redis.")
+        else:
+            app.logger.warning("Could not connect to Redis, product cache disabled.")
+
+        app.product_cache = ProductCache(
+            app.redis_connection,
+            list_ttl=app.config['PRODUCT_CACHE_LIST_TTL'],
+            detail_ttl=app.config['PRODUCT_CACHE_DETAIL_TTL']
+        )
+        app.command_status = CommandStatusStore(app.redis_connection, ttl=app.config['COMMAND_STATUS_TTL'])
+        app.analytics_aggregates = AnalyticsAggregates(app.redis_connection, retention=app.config['ANALYTICS_RETENTION'])
 
         # Topics needed for the system
         required_topics = [
@@ -50,6 +76,10 @@ def create_app(config_class=Config):
             'inventory_events',     # Order Command Processor / Inventory Service publishes stock changes here
             'analytics_events'      # (Optional) For aggregated data for the dashboard
         ]
+        # product_events holds the latest state of every product keyed by product_id, so it is compacted
+        topic_configs = {
+            'product_events': {'cleanup.policy': 'compact'}
+        }
 
         existing_topics = kafka_conn.list_topics()
         if existing_topics:
@@ -63,7 +93,7 @@ def create_app(config_class=Config):
                 app.logger.info(f"Kafka topic '{topic}' already exists. Skipping creation.")
             else:
                 app.logger.info(f"Attempting to create Kafka topic '{topic}'...")
-                success = kafka_conn.create_topic(topic, num_partitions=3, replication_factor=1)
+                success = kafka_conn.create_topic(topic, num_partitions=3, replication_factor=1, config=topic_configs.get(topic))
                 if success:
                     app.logger.info(f"Kafka topic '{topic}' created successfully.")
                 else:
@@ -73,6 +103,8 @@ def create_app(config_class=Config):
         app.kafka_connection = kafka_conn
         if app.kafka_producer:
             app.logger.info("Kafka Producer initialized and attached to app.")
+            # Deliver queued commands before the process exits
+            atexit.register(kafka_conn.close_producer, app.kafka_producer)
         else:
             app.logger.error("Failed to initialize Kafka Producer. Commands cannot be sent to Kafka.")
 
@@ -0,0 +1,255 @@
+import logging
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# Bucket granularities: (bucket width, key format)
+GRANULARITIES = {
+    'minute': (timedelta(minutes=1), '%Y%m%d%H%M'),
+    'hour': (timedelta(hours=1), '%Y%m%d%H'),
+    'day': (timedelta(days=1), '%Y%m%d'),
+}
+
+DEFAULT_RETENTION = {
+    'minute': timedelta(hours=24),
+    'hour': timedelta(days=30),
+    'day': timedelta(days=400),
+}
+
+# Longest range a single query may span, so a request cannot ask for millions of buckets
+MAX_BUCKETS_PER_QUERY = 1500
+
+
+def parse_event_time(value):
+    """Parses an event timestamp ('...Z' or '...+00:00Z') into a naive UTC datetime."""
+    if not value:
+        return datetime.utcnow()
+    parsed = datetime.fromisoformat(value.rstrip('Z'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+class AnalyticsAggregates:
+    """
+    Rolling order aggregates in Redis, maintained by the analytics consumer.
+
+    For every minute, hour and day bucket it keeps:
+      analytics:totals:<granularity>:<bucket>   hash of orders, units and revenue
+      analytics:units:<granularity>:<bucket>    hash of units per product_id
+      analytics:revenue:<granularity>:<bucket>  sorted set of revenue per product_id (top-N)
+    Bucket keys expire after the granularity's retention, so memory stays bounded. All-time
+    totals and the product revenue ranking live under analytics:totals:all and analytics:revenue:all,
+    and analytics:products maps product_id to its last known name.
+    Queries read one key per bucket, so their cost depends on the range, not on the number of orders.
+    """
+    PRODUCT_NAMES_KEY = 'analytics:products'
+    SEEN_KEY_PREFIX = 'analytics:seen:'
+    # Optimistic-locking rounds before record_orders gives up and lets the batch be redelivered
+    MAX_WATCH_ATTEMPTS = 5
+
+    def __init__(self, redis_conn, retention=None, seen_ttl=86400):
+        self.redis_conn = redis_conn
+        self.retention = dict(DEFAULT_RETENTION)
+        self.retention.update(retention or {})
+        self.seen_ttl = seen_ttl
+
+    def _available(self):
+        return self.redis_conn is not None and self.redis_conn.client is not None
+
+    @staticmethod
+    def _bucket(granularity, when):
+        return when.strftime(GRANULARITIES[granularity][1])
+
+    @staticmethod
+    def _key(kind, granularity, bucket=None):
+        return f"analytics:{kind}:{granularity}" + (f":{bucket}" if bucket else '')
+
+    def _bucket_range(self, granularity, start, end):
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown granularity '{granularity}'")
+        width = GRANULARITIES[granularity][0]
+        if end < start:
+            raise ValueError("end must not be before start")
+        if (end - start) / width > MAX_BUCKETS_PER_QUERY:
+            raise ValueError(f"Range spans more than {MAX_BUCKETS_PER_QUERY} {granularity} buckets")
+
+        buckets = []
+        current = start
+        while True:
+            bucket = self._bucket(granularity, current)
+            if not buckets or buckets[-1] != bucket:
+                buckets.append(bucket)
+            if current >= end:
+                break
+            current = min(current + width, end)
+        return buckets
+
+    def record_orders(self, events):
+        """
+        Adds a batch of OrderCreated events to the aggregates. Each event is a dict with order_id,
+        product_id, quantity, total_price, created_at (naive UTC datetime) and optionally product_name.
+
+        Orders already counted within seen_ttl are skipped, so redelivered batches are not counted
+        twice. The seen-markers are checked under WATCH and set in the same MULTI/EXEC as the
+        increments, so a batch is either counted and marked as a whole or not at all. Returns the
+        number of orders that were added.
+        """
+        if not events:
+            return 0
+        if not self._available():
+            raise ConnectionError("Redis is not connected")
+
+        seen_keys = list(dict.fromkeys(f"{self.SEEN_KEY_PREFIX}{event['order_id']}" for event in events))
+        for attempt in range(1, self.MAX_WATCH_ATTEMPTS + 1):
+            try:
+                with self.redis_conn.transaction() as pipe:
+                    pipe.watch(*seen_keys)
+                    already_seen = {key for key, marker in zip(seen_keys, pipe.mget(seen_keys)) if marker is not None}
+                    fresh = []
+                    for event in events:
+                        key = f"{self.SEEN_KEY_PREFIX}{event['order_id']}"
+                        if key not in already_seen:
+                            already_seen.add(key)
+                            fresh.append(event)
+                    if not fresh:
+                        logger.info(f"Skipping {len(events)} analytics events that were already aggregated.")
+                        return 0
+
+                    pipe.multi()
+                    for event in fresh:
+                        pipe.set(f"{self.SEEN_KEY_PREFIX}{event['order_id']}", 1, ex=self.seen_ttl)
+                    self._queue_increments(pipe, fresh)
+                    pipe.execute()
+                break
+            except redis.WatchError:
+                # Another consumer marked one of these orders in the meantime; check again
+                logger.info(f"Seen-markers changed while recording {len(events)} analytics events (attempt {attempt}).")
+        else:
+            raise redis.WatchError(f"Seen-markers kept changing after {self.MAX_WATCH_ATTEMPTS} attempts")
+
+        duplicates = len(events) - len(fresh)
+        if duplicates:
+            logger.info(f"Skipping {duplicates} analytics events that were already aggregated.")
+        return len(fresh)
+
+    def _queue_increments(self, pipe, events):
+        """Queues the bucket, all-time and product name updates for events on pipe."""
+        expiring = {}
+        names = {}
+        for event in events:
+            product_id = event['product_id']
+            quantity = int(event['quantity'])
+            revenue = float(event['total_price'])
+            for granularity in GRANULARITIES:
+                bucket = self._bucket(granularity, event['created_at'])
+                totals_key = self._key('totals', granularity, bucket)
+                units_key = self._key('units', granularity, bucket)
+                revenue_key = self._key('revenue', granularity, bucket)
+                pipe.hincrby(totals_key, 'orders', 1)
+                pipe.hincrby(totals_key, 'units', quantity)
+                pipe.hincrbyfloat(totals_key, 'revenue', revenue)
+                pipe.hincrby(units_key, product_id, quantity)
+                pipe.zincrby(revenue_key, revenue, product_id)
+                for key in (totals_key, units_key, revenue_key):
+                    expiring[key] = self.retention[granularity]
+
+            pipe.hincrby(self._key('totals', 'all'), 'orders', 1)
+            pipe.hincrby(self._key('totals', 'all'), 'units', quantity)
+            pipe.hincrbyfloat(self._key('totals', 'all'), 'revenue', revenue)
+            pipe.zincrby(self._key('revenue', 'all'), revenue, product_id)
+            if event.get('product_name'):
+                names[product_id] = event['product_name']
+
+        # Expiry is measured from the bucket's last write, which is at least as long as its retention
+        for key, ttl in expiring.items():
+            pipe.expire(key, ttl)
+        if names:
+            pipe.hset(self.PRODUCT_NAMES_KEY, mapping=names)
+
+    def totals(self, granularity, start, end):
+        """Returns [{bucket, orders, units, revenue}] for every bucket between start and end (inclusive)."""
+        if not self._available():
+            return []
+        buckets = self._bucket_range(granularity, start, end)
+        with self.redis_conn.pipeline() as pipe:
+            for bucket in buckets:
+                pipe.hgetall(self._key('totals', granularity, bucket))
+            results = pipe.execute()
+        series = []
+        for bucket, values in zip(buckets, results):
+            series.append({
+                'bucket': bucket,
+                'orders': int(values.get('orders', 0)),
+                'units': int(values.get('units', 0)),
+                'revenue': round(float(values.get('revenue', 0)), 2),
+            })
+        return series
+
+    def all_time_totals(self):
+        if not self._available():
+            return {}
+        values = self.redis_conn.client.hgetall(self._key('totals', 'all'))
+        return {
+            'orders': int(values.get('orders', 0)),
+            'units': int(values.get('units', 0)),
+            'revenue': round(float(values.get('revenue', 0)), 2),
+        }
+
+    def top_products(self, granularity=None, start=None, end=None, limit=10):
+        """
+        Returns the top products by revenue as [{product_id, name, revenue, units}].
+        Without a granularity the all-time ranking is used (revenue only).
+        """
+        if not self._available():
+            return []
+        client = self.redis_conn.client
+
+        if granularity is None:
+            ranked = client.zrevrange(self._key('revenue', 'all'), 0, limit - 1, withscores=True)
+            units = {}
+        else:
+            buckets = self._bucket_range(granularity, start, end)
+            with self.redis_conn.pipeline() as pipe:
+                for bucket in buckets:
+                    pipe.zrange(self._key('revenue', granularity, bucket), 0, -1, withscores=True)
+                    pipe.hgetall(self._key('units', granularity, bucket))
+                results = pipe.execute()
+            revenue = Counter()
+            units = Counter()
+            for bucket_revenue, bucket_units in zip(results[::2], results[1::2]):
+                for product_id, score in bucket_revenue:
+                    revenue[product_id] += score
+                for product_id, count in bucket_units.items():
+                    units[product_id] += int(count)
+            ranked = revenue.most_common(limit)
+
+        product_ids = [product_id for product_id, _ in ranked]
+        names = client.hmget(self.PRODUCT_NAMES_KEY, product_ids) if product_ids else []
+        return [
+            {
+                'product_id': product_id,
+                'name': name,
+                'revenue': round(score, 2),
+                'units': units.get(product_id),
+            }
+            for (product_id, score), name in zip(ranked, names)
+        ]
+
+    def product_series(self, product_id, granularity, start, end):
+        """Returns [{bucket, units, revenue}] for one product between start and end (inclusive)."""
+        if not self._available():
+            return []
+        buckets = self._bucket_range(granularity, start, end)
+        with self.redis_conn.pipeline() as pipe:
+            for bucket in buckets:
+                pipe.hget(self._key('units', granularity, bucket), product_id)
+                pipe.zscore(self._key('revenue', granularity, bucket), product_id)
+            results = pipe.execute()
+        return [
+            {'bucket': bucket, 'units': int(units or 0), 'revenue': round(float(revenue or 0), 2)}
+            for bucket, units, revenue in zip(buckets, results[::2], results[1::2])
+        ]
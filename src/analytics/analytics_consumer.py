@@ -1,23 +1,42 @@
-import json
-from datetime import datetime
+import threading
 
 from flask import current_app
+from src.kafka.serialization import MessageDecodeError
 import logging
 from src.redis.redis_connection import RedisConnection 
+from src.analytics.product_table import ProductTable
+from src.analytics.aggregates import AnalyticsAggregates, parse_event_time
+from src.logging_config import message_logger
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
+# Per-message events, sampled and rate limited (see src/logging_config.py)
+message_log = message_logger(__name__)
 
 class Analytics:
-    def __init__(self):
-        self.kafka_conn = None
+    """
+    Folds analytics_events into the Redis aggregates.
+    Inside a Flask app it picks up current_app.kafka_connection and current_app.config; the standalone
+    worker (analytics_worker.py) passes kafka_conn, config and a shared product_table instead.
+    A redis_conn that is passed in is used as is and left open on shutdown.
+    """
+    def __init__(self, kafka_conn=None, config=None, product_table=None, redis_conn=None):
+        self.kafka_conn = kafka_conn
+        self.config = config
         self.consumer = None
         self.running = False
-        self.redis_conn = None # Add Redis connection
+        self.redis_conn = redis_conn
+        self._owns_redis_conn = redis_conn is None
+        self.product_table = product_table
+        self._owns_product_table = product_table is None
+        self.aggregates = None
+        self.stop_event = threading.Event()
 
     def _get_kafka_connection(self):
         # Assumes current_app.kafka_connection is properly set up by your Flask app
-        return current_app.kafka_connection
+        return self.kafka_conn or current_app.kafka_connection
+
+    def _get_config(self):
+        return self.config if self.config is not None else current_app.config
 
     def initialize(self):
         """Initialize the consumer and Redis connections."""
@@ -26,71 +45,124 @@ class Analytics:
             logger.error("Kafka connection not available.")
             return False
 
-        self.consumer = self.kafka_conn.create_consumer()
+        config = self._get_config()
+        # Offsets are committed by consume_batches once a batch has been written to Redis
+        self.consumer = self.kafka_conn.create_consumer(config_overrides={'enable.auto.commit': False}, role='analytics')
         if not self.consumer:
             logger.error("Failed to create Kafka consumer.")
             return False
 
         # Initialize Redis connection
-        self.redis_conn = RedisConnection()
+        if self._owns_redis_conn:
+            self.redis_conn = RedisConnection()
         if not self.redis_conn.connect():
             logger.error("Failed to connect to Redis.")
             return False
+        self.aggregates = AnalyticsAggregates(self.redis_conn, retention=config.get('ANALYTICS_RETENTION'))
         
+        # Lean analytics events only carry a product_id; product attributes come from product_events
+        if self.product_table is None:
+            self.product_table = ProductTable(self.kafka_conn)
+            if not self.product_table.start():
+                logger.error("Failed to start the product table.")
+                return False
+        if not self.product_table.wait_until_loaded(timeout=30):
+            logger.warning("Product table is still loading. Early events may lack product details.")
+
         logger.info("Analytics consumer and Redis initialized successfully.")
         return True
     
     def handle_analytics_message(self, msg):
+        """Processes a single analytics event message."""
+        self.handle_analytics_batch([msg])
+
+    def handle_analytics_batch(self, msgs):
         """
-        Processes a single analytics event message and saves it to Redis.
-        Includes a timestamp in the Redis key to prevent overwrites for the same event type and order.
+        Folds a batch of analytics events into the rolling aggregates in Redis (see AnalyticsAggregates).
+        Malformed events are logged and skipped; if Redis rejects the writes the exception propagates
+        so consume_batches rewinds and redelivers the batch.
         """
+        events = []
+        for msg in msgs:
+            event = self._to_order_event(msg)
+            if event:
+                events.append(event)
+
+        if events:
+            added = self.aggregates.record_orders(events)
+            message_log.info("Aggregated %d of %d analytics events.", added, len(msgs))
+
+    def _to_order_event(self, msg):
         try:
-            message_value = json.loads(msg.value().decode('utf-8'))
-            logger.info(f"Processing analytics message: {message_value.get('event_type')}")
+            message_value = self.kafka_conn.decode_message(msg)
 
             event_type = message_value.get('event_type')
             order_id = message_value.get('order_id')
-
-            timestamp_str = message_value.get('order_created_at') or datetime.utcnow().isoformat() + 'Z'
-            timestamp_for_key = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00')).strftime("%Y%m%d%H%M%S%f")
-
             if not event_type or not order_id:
-                logger.warning(f"Message missing 'event_type' or 'order_id': {message_value}")
-                return
-            
-            redis_key = f"analytics:{event_type.lower()}:{order_id}:{timestamp_for_key}"
-            
-            if self.redis_conn.set_data(redis_key, message_value):
-                logger.info(f"Successfully saved analytics event (key: {redis_key}) to Redis.")
-            else:
-                logger.error(f"Failed to save analytics event (key: {redis_key}) to Redis.")
-
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to decode analytics message JSON: {e}")
+                logger.warning("Message missing 'event_type' or 'order_id': %s", message_value)
+                return None
+            if event_type != 'OrderCreated':
+                message_log.debug("Ignoring analytics event type %s", event_type)
+                return None
+
+            product = message_value.get('product_details')
+            if product is None and message_value.get('product_id'):
+                product = self._lookup_product(message_value['product_id'])
+            if not product or not product.get('product_id'):
+                logger.warning("Analytics event for order %s has no product.", order_id)
+                return None
+
+            return {
+                'order_id': order_id,
+                'product_id': product['product_id'],
+                'product_name': product.get('name'),
+                'quantity': message_value['quantity'],
+                'total_price': message_value['total_price'],
+                'created_at': parse_event_time(message_value.get('order_created_at')),
+            }
+        except MessageDecodeError as e:
+            logger.error("Failed to decode analytics message JSON: %s", e)
         except KeyError as e:
-            logger.error(f"Missing expected key in analytics message: {e}")
-        except Exception as e:
-            logger.error(f"Error processing analytics message: {e}", exc_info=True)
-
-    def start_consuming(self, topic_name='analytics_events'):
+            logger.error("Missing expected key in analytics message: %s", e)
+        except ValueError as e:
+            logger.error("Invalid value in analytics message: %s", e)
+        return None
+
+    def _lookup_product(self, product_id):
+        """Joins a lean event against the local product table."""
+        product = self.product_table.get(product_id) if self.product_table else None
+        if product is None:
+            logger.warning("Product %s is not in the product table yet.", product_id)
+            return {'product_id': product_id}
+        return dict(product)
+
+    def start_consuming(self, topic_name='analytics_events', reporter=None):
         """
-        Start consuming messages from the analytics events Kafka topic.
+        Start consuming messages from the analytics events Kafka topic until stop() is called.
+        reporter, if given, receives partition assignments and consumer lag (see src.kafka.supervisor).
         """
         if not self.initialize():
             logger.error("Failed to initialize Analytics consumer. Aborting consumption.")
             return False
 
         try:
-            self.kafka_conn.subscibe_to_topic(self.consumer, topic_name)
+            self.kafka_conn.subscibe_to_topic(
+                self.consumer,
+                topic_name,
+                on_assign=reporter.on_assign if reporter else None,
+                on_revoke=reporter.on_revoke if reporter else None
+            )
             self.running = True
             logger.info(f"Starting to consume analytics messages from topic: {topic_name}")
 
-            self.kafka_conn.consume_messages(
+            config = self._get_config()
+            self.kafka_conn.consume_batches(
                 consumer=self.consumer,
-                message_handler=self.handle_analytics_message,
-                timeout=1.0,
-                stop_event=None 
+                batch_handler=self.handle_analytics_batch,
+                batch_size=config.get('ANALYTICS_BATCH_SIZE', 500),
+                linger_ms=config.get('ANALYTICS_BATCH_LINGER_MS', 200),
+                stop_event=self.stop_event,
+                reporter=reporter
             )
 
         except Exception as e:
@@ -99,12 +171,19 @@ class Analytics:
             self.shutdown()
             logger.info("AnalyticsConsumer consumption loop has ended.")
 
+    def stop(self):
+        """Asks the consumption loop to finish its current batch and exit. Safe to call from another thread."""
+        self.stop_event.set()
+
     def shutdown(self):
         """Cleanup resources."""
         self.running = False
         if self.consumer:
             self.consumer.close()
+            self.consumer = None
             logger.info("Kafka analytics consumer closed.")
-        if self.redis_conn:
+        if self.product_table and self._owns_product_table:
+            self.product_table.stop()
+        if self.redis_conn and self._owns_redis_conn:
             self.redis_conn.close()
             logger.info("Redis connection for analytics consumer closed.")
\ No newline at end of file
@@ -0,0 +1,117 @@
+import logging
+import threading
+import uuid
+
+from confluent_kafka import KafkaError, KafkaException, OFFSET_BEGINNING, TopicPartition
+from src.kafka.serialization import MessageDecodeError
+
+logger = logging.getLogger(__name__)
+
+
+class ProductTable:
+    """
+    Local in-memory copy of the compacted product_events topic, keyed by product_id.
+
+    A background thread reads every partition from the beginning with its own consumer (assigned,
+    not subscribed, so it never joins a consumer group or commits offsets) and keeps following new
+    events. Tombstones remove products. Analytics events that only carry a product_id are joined
+    against this table instead of shipping a product snapshot in every message.
+    """
+    def __init__(self, kafka_conn, topic_name='product_events', poll_timeout=1.0):
+        self.kafka_conn = kafka_conn
+        self.topic_name = topic_name
+        self.poll_timeout = poll_timeout
+        self.products = {}
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+        self._stop_event = threading.Event()
+        self._pending_partitions = set()
+        self._thread = None
+        self.consumer = None
+
+    def start(self):
+        """Starts following the topic. Returns False if the consumer could not be created."""
+        self.consumer = self.kafka_conn.create_consumer(config_overrides={
+            'group.id': f"product-table-{uuid.uuid4()}",
+            'enable.auto.commit': False,
+            'enable.partition.eof': True,
+        })
+        if not self.consumer:
+            return False
+
+        try:
+            metadata = self.consumer.list_topics(self.topic_name, timeout=10).topics.get(self.topic_name)
+        except KafkaException as e:
+            logger.error(f"Could not read metadata for topic '{self.topic_name}': {e}")
+            return False
+        if metadata is None or not metadata.partitions:
+            logger.warning(f"Topic '{self.topic_name}' has no partitions. Product table stays empty.")
+            self._loaded.set()
+            return True
+
+        self._pending_partitions = set(metadata.partitions)
+        self.consumer.assign([TopicPartition(self.topic_name, p, OFFSET_BEGINNING) for p in metadata.partitions])
+
+        self._thread = threading.Thread(target=self._run, name='product-table', daemon=True)
+        self._thread.start()
+        return True
+
+    def _run(self):
+        try:
+            while not self._stop_event.is_set():
+                msg = self.consumer.poll(self.poll_timeout)
+                if msg is None:
+                    continue
+                if msg.error():
+                    if msg.error().code() == KafkaError._PARTITION_EOF:
+                        self._partition_caught_up(msg.partition())
+                    else:
+                        logger.error(f"Product table consumer error: {msg.error()}")
+                    continue
+                self.apply(msg)
+        except Exception as e:
+            logger.error(f"Product table consumer stopped unexpectedly: {e}", exc_info=True)
+        finally:
+            self.consumer.close()
+
+    def _partition_caught_up(self, partition):
+        if partition in self._pending_partitions:
+            self._pending_partitions.discard(partition)
+            if not self._pending_partitions:
+                logger.info(f"Product table loaded {len(self.products)} products from '{self.topic_name}'.")
+                self._loaded.set()
+
+    def apply(self, msg):
+        """Applies one product_events message: an upsert, or a deletion if the value is a tombstone."""
+        product_id = msg.key().decode('utf-8') if msg.key() else None
+        if not product_id:
+            return
+        if msg.value() is None:
+            with self._lock:
+                self.products.pop(product_id, None)
+            return
+        try:
+            event = self.kafka_conn.decode_message(msg)
+        except MessageDecodeError as e:
+            logger.error(f"Failed to decode product event for {product_id}: {e}")
+            return
+        with self._lock:
+            self.products[product_id] = {
+                'product_id': product_id,
+                'name': event.get('name'),
+                'price': event.get('price'),
+                'image_url': event.get('image_url'),
+            }
+
+    def get(self, product_id):
+        with self._lock:
+            return self.products.get(product_id)
+
+    def wait_until_loaded(self, timeout=None):
+        """Blocks until the table has caught up with the topic as it was at start-up."""
+        return self._loaded.wait(timeout)
+
+    def stop(self, timeout=5):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
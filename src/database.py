@@ -0,0 +1,173 @@
+import logging
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from src.metrics import DB_COMMIT_DURATION
+
+logger = logging.getLogger(__name__)
+
+SQLITE_JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+SQLITE_SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+def normalize_database_url(url):
+    """Accepts the 'postgres://' scheme many hosting providers hand out, which SQLAlchemy no longer does."""
+    if url and url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def _is_sqlite(uri):
+    return make_url(uri).get_backend_name() == 'sqlite'
+
+
+def _is_sqlite_memory(uri):
+    return make_url(uri).database in (None, '', ':memory:')
+
+
+def engine_options(config):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS for the configured database. SQLite keeps SQLAlchemy's default pool
+    (pool sizes do not apply to a file lock); server databases get a sized, pre-pinged pool whose
+    connections are recycled before the server or a proxy drops them.
+    """
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    if _is_sqlite(uri):
+        return {}
+    return {
+        'pool_size': config.get('DB_POOL_SIZE', 10),
+        'max_overflow': config.get('DB_MAX_OVERFLOW', 20),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': True,
+    }
+
+
+def _sqlite_pragmas(config, uri):
+    journal_mode = str(config.get('SQLITE_JOURNAL_MODE', 'WAL')).upper()
+    if journal_mode not in SQLITE_JOURNAL_MODES:
+        logger.warning(f"Unknown SQLITE_JOURNAL_MODE '{journal_mode}'. Falling back to WAL.")
+        journal_mode = 'WAL'
+    synchronous = str(config.get('SQLITE_SYNCHRONOUS', 'NORMAL')).upper()
+    if synchronous not in SQLITE_SYNCHRONOUS_MODES:
+        logger.warning(f"Unknown SQLITE_SYNCHRONOUS '{synchronous}'. Falling back to NORMAL.")
+        synchronous = 'NORMAL'
+
+    pragmas = [f"busy_timeout = {int(config.get('SQLITE_BUSY_TIMEOUT_MS', 5000))}"]
+    # An in-memory database has no file to keep a write-ahead log in
+    if not _is_sqlite_memory(uri):
+        pragmas.append(f"journal_mode = {journal_mode}")
+    pragmas.append(f"synchronous = {synchronous}")
+    return pragmas
+
+
+def configure_engine(app):
+    """
+    Sets SQLALCHEMY_ENGINE_OPTIONS for the app's database unless the config already provides them.
+    Call before db.init_app(app), then apply_sqlite_pragmas(app, db.engine) inside the app context.
+    """
+    app.config['SQLALCHEMY_DATABASE_URI'] = normalize_database_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    logger.debug(f"Database URI: {make_url(app.config['SQLALCHEMY_DATABASE_URI']).render_as_string(hide_password=True)}")
+    if not app.config.get('SQLALCHEMY_ENGINE_OPTIONS'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+
+
+def apply_sqlite_pragmas(app, engine):
+    """
+    For SQLite, runs the WAL, busy-timeout and synchronous pragmas on every new connection, so web
+    reads no longer wait for consumer writes and concurrent writers wait for the lock instead of
+    failing with 'database is locked'. Does nothing for other databases. Call before the engine
+    opens its first connection.
+    """
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if not _is_sqlite(uri):
+        return
+    pragmas = _sqlite_pragmas(app.config, uri)
+
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(f"PRAGMA {pragma}")
+        finally:
+            cursor.close()
+
+    event.listen(engine, 'connect', _on_connect)
+    logger.info(f"SQLite connections configured with: {', '.join(pragmas)}")
+
+
+def _commit_started(session):
+    session.info['_commit_started'] = time.perf_counter()
+
+
+def _commit_finished(session):
+    started = session.info.pop('_commit_started', None)
+    if started is not None:
+        DB_COMMIT_DURATION.observe(time.perf_counter() - started)
+
+
+def _commit_abandoned(session):
+    session.info.pop('_commit_started', None)
+
+
+def track_commit_time():
+    """
+    Records how long every Session.commit() takes, including its final flush, in the
+    db_commit_duration_seconds histogram (see src.metrics). Applies to all sessions; safe to call again.
+    """
+    if event.contains(Session, 'before_commit', _commit_started):
+        return
+    event.listen(Session, 'before_commit', _commit_started)
+    event.listen(Session, 'after_commit', _commit_finished)
+    event.listen(Session, 'after_rollback', _commit_abandoned)
+
+
+class QueryCounter:
+    """The SQL statements executed on an engine while count_queries() is active."""
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+@contextmanager
+def count_queries(engine):
+    """
+    Records every statement executed on engine inside the block:
+
+        with count_queries(db.engine) as queries:
+            client.get('/shop/orders')
+        print(queries.count)
+    """
+    counter = QueryCounter()
+
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        counter.statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', _before_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', _before_execute)
+
+
+@contextmanager
+def assert_max_queries(engine, budget):
+    """
+    Fails with AssertionError if the block executes more than budget statements on engine, e.g. to
+    catch a listing that lazy-loads a relationship per row:
+
+        with assert_max_queries(db.engine, 2):
+            client.get('/shop/orders?per_page=50')
+    """
+    with count_queries(engine) as counter:
+        yield counter
+    if counter.count > budget:
+        listing = '\n'.join(f"  {i + 1}. {statement}" for i, statement in enumerate(counter.statements))
+        raise AssertionError(f"Expected at most {budget} queries, {counter.count} were executed:\n{listing}")
@@ -1,19 +1,79 @@
 import os
-import json
-from confluent_kafka import Producer, Consumer, KafkaException, KafkaError
+import time
+from confluent_kafka import Producer, Consumer, KafkaException, KafkaError, TopicPartition, OFFSET_BEGINNING
 import logging
 from confluent_kafka.admin import AdminClient, NewTopic, TopicMetadata, KafkaException
+from src.kafka.delivery import DeliveryStats, ProducerPoller
+from src.kafka.retry import RETRY_NOT_BEFORE_HEADER, DelayedPartitions, message_headers
+from src.kafka.serialization import TopicCodecs
+from src.kafka.traffic import TrafficStats
+from src.metrics import BATCH_SIZE, HANDLER_DURATION, MESSAGES_CONSUMED, MESSAGES_PRODUCED, PRODUCE_ERRORS
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+COMMIT_STRATEGIES = ('message', 'batch', 'interval')
+
+PARTITION_ASSIGNMENT_STRATEGIES = ('range', 'roundrobin', 'cooperative-sticky')
+
+# Seconds before a failed partition metadata lookup for a topic is tried again
+PARTITION_LOOKUP_RETRY_SECONDS = 30
+
+# Seconds to wait before redelivering a failed message or batch, doubling per attempt up to the maximum
+REDELIVERY_BACKOFF = 0.2
+REDELIVERY_BACKOFF_MAX = 5.0
+
+# librdkafka's built-in partitioners for keyed messages. 'murmur2_random' matches the Java client.
+PARTITIONERS = ('random', 'consistent', 'consistent_random', 'murmur2', 'murmur2_random', 'fnv1a', 'fnv1a_random')
+
+# Producer defaults per KAFKA_PRODUCER_PROFILE. Each value can be overridden by its own environment variable.
+PRODUCER_PROFILES = {
+    'throughput': {'linger.ms': 20, 'batch.size': 262144, 'compression.type': 'lz4', 'enable.idempotence': True},
+    'latency': {'linger.ms': 0, 'batch.size': 16384, 'compression.type': 'none', 'enable.idempotence': True},
+}
+
 class KafkaConnection:
     def __init__(self):
-        pass
+        self.delivery_stats = DeliveryStats()
+        self._pollers = {}
+        self._pending_offsets = {}
+        self.codecs = TopicCodecs()
+        self.produced_traffic = TrafficStats()
+        self.consumed_traffic = TrafficStats()
+        self._partitioners = {}
+        self._partition_counts = {}
+        self._partition_lookup_retry_at = {}
+        self._last_traffic_summary = time.monotonic()
+
+    def get_group_id(self, role=None):
+        """
+        Returns the consumer group id for a consumer role ('product', 'order', 'analytics', ...).
+        Each role gets its own group, "<KAFKA_GROUP_ID>.<role>", unless KAFKA_GROUP_ID_<ROLE> names one
+        explicitly, so restarting one kind of consumer never rebalances the others.
+        Without a role the shared KAFKA_GROUP_ID is returned.
+        """
+        base = os.getenv('KAFKA_GROUP_ID', 'default_flask_app_group')
+        if not role:
+            return base
+        return os.getenv(f"KAFKA_GROUP_ID_{role.upper().replace('-', '_')}") or f"{base}.{role}"
 
-    def get_config(self, client_type):
+    def get_commit_strategy(self):
+        """
+        Returns the consumer offset commit strategy from KAFKA_COMMIT_STRATEGY. Offsets are only ever
+        committed for messages that have been processed:
+          message  - synchronous commit after every message
+          batch    - synchronous commit after every KAFKA_COMMIT_BATCH_SIZE messages (or every batch in consume_batches)
+          interval - processed offsets are stored and committed in the background every KAFKA_COMMIT_INTERVAL_MS
+        """
+        strategy = os.getenv('KAFKA_COMMIT_STRATEGY', 'interval')
+        if strategy not in COMMIT_STRATEGIES:
+            logger.warning(f"Unknown KAFKA_COMMIT_STRATEGY '{strategy}'. Falling back to 'interval'.")
+            strategy = 'interval'
+        return strategy
+
+    def get_config(self, client_type, role=None):
         """
         Constructs and returns Kafka configuration dictionary based on environment variables.
+        For consumers, role selects the consumer group (see get_group_id).
         """
         config = {
             'bootstrap.servers': os.getenv('KAFKA_BOOTSTRAP_SERVERS', 'localhost:9092'),
@@ -37,35 +97,92 @@ class KafkaConnection:
         if client_type == 'producer':
             config['acks'] = 'all'
             config['retries'] = 3
+
+            profile_name = os.getenv('KAFKA_PRODUCER_PROFILE', 'throughput')
+            profile = PRODUCER_PROFILES.get(profile_name)
+            if profile is None:
+                logger.warning(f"Unknown KAFKA_PRODUCER_PROFILE '{profile_name}'. Falling back to 'throughput'.")
+                profile = PRODUCER_PROFILES['throughput']
+            config['linger.ms'] = int(os.getenv('KAFKA_PRODUCER_LINGER_MS', profile['linger.ms']))
+            config['batch.size'] = int(os.getenv('KAFKA_PRODUCER_BATCH_SIZE', profile['batch.size']))
+            config['compression.type'] = os.getenv('KAFKA_PRODUCER_COMPRESSION', profile['compression.type'])
+            idempotence = os.getenv('KAFKA_PRODUCER_IDEMPOTENCE')
+            config['enable.idempotence'] = idempotence.lower() in ('1', 'true', 'yes') if idempotence else profile['enable.idempotence']
+            partitioner = os.getenv('KAFKA_PARTITIONER')
+            if partitioner:
+                if partitioner in PARTITIONERS:
+                    config['partitioner'] = partitioner
+                else:
+                    logger.warning(f"Unknown KAFKA_PARTITIONER '{partitioner}'. Using the client default.")
             
         if client_type == 'consumer':
-            config['group.id'] = os.getenv('KAFKA_GROUP_ID', 'default_flask_app_group')
+            config['group.id'] = self.get_group_id(role)
             config['auto.offset.reset'] = 'earliest'
-            config['enable.auto.commit'] = True
-            config['auto.commit.interval.ms'] = 5000
+            # 'cooperative-sticky' is opt-in: partitions are moved incrementally instead of the whole group
+            # stopping on every rebalance. All members of a group must use the same protocol.
+            assignment_strategy = os.getenv('KAFKA_PARTITION_ASSIGNMENT_STRATEGY')
+            if assignment_strategy:
+                if assignment_strategy in PARTITION_ASSIGNMENT_STRATEGIES:
+                    config['partition.assignment.strategy'] = assignment_strategy
+                else:
+                    logger.warning(f"Unknown KAFKA_PARTITION_ASSIGNMENT_STRATEGY '{assignment_strategy}'. Using the client default.")
+            # Offsets are stored/committed by the consume loops only after a message has been processed.
+            # With the interval strategy librdkafka commits the stored offsets in the background.
+            config['enable.auto.offset.store'] = False
+            if self.get_commit_strategy() == 'interval':
+                config['enable.auto.commit'] = True
+                config['auto.commit.interval.ms'] = int(os.getenv('KAFKA_COMMIT_INTERVAL_MS', 5000))
+            else:
+                config['enable.auto.commit'] = False
 
         return config
+
+    def _new_producer(self, config):
+        """Builds the client for create_producer. Overridden by in-process stand-ins (see benchmarks/fake_kafka.py)."""
+        return Producer(config)
+
+    def _new_consumer(self, config):
+        """Builds the client for create_consumer. Overridden by in-process stand-ins (see benchmarks/fake_kafka.py)."""
+        return Consumer(config)
     
-    def create_producer(self):
+    def create_producer(self, start_poller=True):
         """
         Creates and returns a Kafka Producer instance.
+        Unless start_poller is False, a background ProducerPoller serves its delivery callbacks.
+        Call close_producer() on shutdown so queued messages are flushed.
         """
         try:
             producer_config = self.get_config(client_type='producer')
-            producer = Producer(producer_config)
-            logger.info(f"Kafka Producer created with config: {producer_config.get('bootstrap.servers')}")
+            producer = self._new_producer(producer_config)
+            logger.info(
+                f"Kafka Producer created with config: {producer_config.get('bootstrap.servers')} "
+                f"(linger.ms={producer_config['linger.ms']}, batch.size={producer_config['batch.size']}, "
+                f"compression={producer_config['compression.type']}, idempotence={producer_config['enable.idempotence']})"
+            )
+            if start_poller:
+                poller = ProducerPoller(
+                    producer,
+                    self.delivery_stats,
+                    traffic_stats=self.produced_traffic,
+                    summary_interval=int(os.getenv('KAFKA_DELIVERY_SUMMARY_INTERVAL', 60))
+                )
+                poller.start()
+                self._pollers[id(producer)] = poller
             return producer
         except KafkaException as e:
             logger.error(f"Error creating Kafka Producer: {e}")
             return None
 
-    def create_consumer(self):
+    def create_consumer(self, config_overrides=None, role=None):
         """
-        Creates and returns a Kafka Consumer instance.
+        Creates and returns a Kafka Consumer instance in the consumer group of role.
+        config_overrides are applied on top of the environment based consumer config.
         """
         try:
-            consumer_config = self.get_config(client_type='consumer')
-            consumer = Consumer(consumer_config)
+            consumer_config = self.get_config(client_type='consumer', role=role)
+            if config_overrides:
+                consumer_config.update(config_overrides)
+            consumer = self._new_consumer(consumer_config)
             logger.info(f"Kafka Consumer created with config: {consumer_config.get('bootstrap.servers')}, Group ID: {consumer_config.get('group.id')}")
             return consumer
         except KafkaException as e:
@@ -80,34 +197,160 @@ class KafkaConnection:
         if err is not None:
             # Decode key if it exists, otherwise use 'N/A'
             key_info = msg.key().decode('utf-8') if msg.key() else 'N/A'
-            logger.error(f"Message delivery failed for topic {msg.topic()} key {key_info}: {err}")
+            logger.error("Message delivery failed for topic %s key %s: %s", msg.topic(), key_info, err)
+            self.delivery_stats.record(msg.topic(), error=err)
+            PRODUCE_ERRORS.inc(topic=msg.topic())
         else:
-            logger.info(f"Message delivered to topic {msg.topic()} [{msg.partition()}] @ offset {msg.offset()}")
+            # Successful deliveries are aggregated in delivery_stats rather than logged one by one
+            self.delivery_stats.record(msg.topic(), latency_seconds=msg.latency())
+            self.produced_traffic.record(msg.topic(), msg.partition(), msg.key())
+            MESSAGES_PRODUCED.inc(topic=msg.topic(), partition=msg.partition())
 
-    def produce_message(self, producer, topic, message_obj, key):
-        """Produces a message to a kafka topic"""
+    def set_partitioner(self, topic, partitioner):
+        """
+        Routes messages produced to topic with partitioner(key, num_partitions) -> partition instead of
+        the producer's built-in key hashing (see KAFKA_PARTITIONER), e.g. to give hot keys partitions of
+        their own. Pass None to go back to the built-in partitioner. Messages without a key are left to
+        the producer.
+        """
+        if partitioner is None:
+            self._partitioners.pop(topic, None)
+        else:
+            self._partitioners[topic] = partitioner
+
+    def _custom_partition(self, producer, topic, key):
+        partitioner = self._partitioners.get(topic)
+        if partitioner is None or key is None:
+            return None
+        num_partitions = self._partition_count(producer, topic)
+        if num_partitions is None:
+            return None
+        return partitioner(key, num_partitions) % num_partitions
+
+    def _partition_count(self, client, topic):
+        """
+        Returns the number of partitions of topic from the cluster metadata, looked up once and cached,
+        and registers them with produced_traffic. Returns None if the lookup failed; it is retried
+        after PARTITION_LOOKUP_RETRY_SECONDS.
+        """
+        num_partitions = self._partition_counts.get(topic)
+        if num_partitions is not None or time.monotonic() < self._partition_lookup_retry_at.get(topic, 0):
+            return num_partitions
+        try:
+            metadata = client.list_topics(topic, timeout=5).topics.get(topic)
+        except KafkaException as e:
+            logger.warning(f"Could not look up the partitions of topic {topic}: {e}")
+            metadata = None
+        if metadata is None or not metadata.partitions:
+            self._partition_lookup_retry_at[topic] = time.monotonic() + PARTITION_LOOKUP_RETRY_SECONDS
+            return None
+        num_partitions = self._partition_counts[topic] = len(metadata.partitions)
+        self.produced_traffic.add_partitions(topic, range(num_partitions))
+        return num_partitions
+
+    def produce_message(self, producer, topic, message_obj, key, on_delivery=None):
+        """
+        Produces a message to a kafka topic.
+        on_delivery(err, msg), if given, is called once the broker has acknowledged or rejected the message.
+        Returns True if the message was queued.
+        """
         try:
             encoded_key = key.encode('utf-8') if key else None
-            producer.produce(
-                topic,
-                key=encoded_key,
-                value=json.dumps(message_obj).encode('utf-8'),
-                callback=self.delivery_report
-            )
-            producer.poll(0)
-            logger.info(f"Message queued for production to topic {topic}")
+            value, headers = self.codecs.encode(topic, message_obj)
+            produce_kwargs = {'key': encoded_key, 'value': value, 'headers': headers}
+            partition = self._custom_partition(producer, topic, key)
+            if partition is not None:
+                produce_kwargs['partition'] = partition
+            elif topic not in self._partition_counts:
+                # Lets the traffic stats count partitions that receive nothing
+                self._partition_count(producer, topic)
+            callback = self.delivery_report
+            if on_delivery:
+                def callback(err, msg):
+                    self.delivery_report(err, msg)
+                    on_delivery(err, msg)
+            try:
+                producer.produce(topic, callback=callback, **produce_kwargs)
+            except BufferError:
+                # Local queue is full: wait for deliveries to drain it, then retry once
+                logger.warning("Producer queue full while producing to %s. Waiting for deliveries.", topic)
+                producer.poll(1)
+                producer.produce(topic, callback=callback, **produce_kwargs)
+
+            if id(producer) not in self._pollers:
+                producer.poll(0)
+            logger.debug(f"Message queued for production to topic {topic}")
+            return True
         except Exception as e:
             logger.error(f"Error producing message to Kafka: {e}", exc_info=True)
+            return False
 
-    def create_topic(self, topic_name, num_partitions=1, replication_factor=1):
+    def forward_message(self, producer, topic, msg, headers=None, drop_headers=()):
         """
-        Creates a Kafka topic using the AdminClient
+        Produces a consumed message to another topic unchanged: same key, same encoded value and the
+        same headers, minus drop_headers, plus headers ({name: str}). Returns True if it was queued.
         """
-        admin_config = {k: v for k, v in self.get_config(client_type='admin').items() if k not in ['acks', 'retries', 'group.id', 'auto.offset.reset', 'enable.auto.commit', 'auto.commit.interval.ms']}
+        try:
+            forwarded = [(name, value) for name, value in (msg.headers() or []) if name not in drop_headers]
+            forwarded += [(name, str(value).encode('utf-8')) for name, value in (headers or {}).items()]
+            try:
+                producer.produce(topic, key=msg.key(), value=msg.value(), headers=forwarded, callback=self.delivery_report)
+            except BufferError:
+                logger.warning("Producer queue full while forwarding to %s. Waiting for deliveries.", topic)
+                producer.poll(1)
+                producer.produce(topic, key=msg.key(), value=msg.value(), headers=forwarded, callback=self.delivery_report)
+            if id(producer) not in self._pollers:
+                producer.poll(0)
+            return True
+        except Exception as e:
+            logger.error(f"Error forwarding message to {topic}: {e}", exc_info=True)
+            return False
+
+    def produce_tombstone(self, producer, topic, key):
+        """Produces a null-valued message, which deletes the key from a compacted topic"""
+        try:
+            producer.produce(topic, key=key.encode('utf-8'), value=None, callback=self.delivery_report)
+            if id(producer) not in self._pollers:
+                producer.poll(0)
+            logger.debug(f"Tombstone queued for key {key} on topic {topic}")
+        except Exception as e:
+            logger.error(f"Error producing tombstone to Kafka: {e}", exc_info=True)
+
+    def decode_message(self, msg):
+        """
+        Decodes a consumed message with the codec named in its content-type header (JSON if absent).
+        Raises MessageDecodeError if the value cannot be decoded.
+        """
+        return self.codecs.decode(msg)
+
+    def close_producer(self, producer, timeout=10):
+        """
+        Stops the producer's poller and flushes every queued message, waiting at most timeout seconds.
+        Returns the number of messages that could not be delivered in time.
+        """
+        if producer is None:
+            return 0
+        poller = self._pollers.pop(id(producer), None)
+        if poller:
+            poller.stop()
+        remaining = producer.flush(timeout)
+        if remaining:
+            logger.error(f"{remaining} message(s) were still queued after flushing the producer for {timeout}s.")
+        else:
+            logger.info("Kafka producer flushed.")
+        self.delivery_stats.log_summary()
+        return remaining
+
+    def create_topic(self, topic_name, num_partitions=1, replication_factor=1, config=None):
+        """
+        Creates a Kafka topic using the AdminClient.
+        config holds topic-level settings such as {'cleanup.policy': 'compact'}.
+        """
+        admin_config = {k: v for k, v in self.get_config(client_type='admin').items() if k not in ['acks', 'retries', 'group.id', 'auto.offset.reset', 'enable.auto.commit', 'auto.commit.interval.ms', 'enable.auto.offset.store']}
 
         admin_client = AdminClient(admin_config)
 
-        new_topic = NewTopic(topic_name, num_partitions=num_partitions, replication_factor=replication_factor)
+        new_topic = NewTopic(topic_name, num_partitions=num_partitions, replication_factor=replication_factor, config=config or {})
 
         futures = admin_client.create_topics([new_topic])
 
@@ -131,7 +374,7 @@ class KafkaConnection:
         """
         Lists all topics in the Kafka cluster using the AdminClient.
         """
-        admin_config = {k: v for k, v in self.get_config(client_type='admin').items() if k not in ['acks', 'retries', 'group.id', 'auto.offset.reset', 'enable.auto.commit', 'auto.commit.interval.ms']}
+        admin_config = {k: v for k, v in self.get_config(client_type='admin').items() if k not in ['acks', 'retries', 'group.id', 'auto.offset.reset', 'enable.auto.commit', 'auto.commit.interval.ms', 'enable.auto.offset.store']}
         admin_client = AdminClient(admin_config)
 
         try:
@@ -143,56 +386,417 @@ class KafkaConnection:
             logger.error(f"An unexpected error occurred while listing topics: {e}", exc_info=True)
             return []
 
-    def subscibe_to_topic(self, consumer, topic):
-        """subscribes a consumer to a topic"""
+    def subscibe_to_topic(self, consumer, topic, on_assign=None, on_revoke=None, on_flush=None):
+        """
+        subscribes a consumer to a topic.
+        on_assign and on_revoke are called as callback(consumer, partitions) when the group rebalances.
+        Before partitions are revoked, on_flush(partitions) lets the caller finish work it has buffered,
+        and then every processed offset for those partitions is committed, so the next owner resumes
+        exactly where this consumer stopped. Lost partitions (cooperative rebalancing after a session
+        timeout) are dropped without committing, because another consumer may already own them.
+        The assigned partitions are registered with consumed_traffic, so its skew covers idle ones too.
+        """
+        def _on_assign(consumer, partitions):
+            self._track_assignment(partitions, assigned=True)
+            if on_assign:
+                on_assign(consumer, partitions)
+
+        def _on_revoke(consumer, partitions):
+            if on_flush:
+                try:
+                    on_flush(partitions)
+                except Exception as e:
+                    logger.error(f"Error flushing work before partitions were revoked: {e}", exc_info=True)
+            self._commit_before_revoke(consumer, partitions)
+            self._track_assignment(partitions, assigned=False)
+            if on_revoke:
+                on_revoke(consumer, partitions)
+
+        def _on_lost(consumer, partitions):
+            logger.warning(f"Lost partitions: {', '.join(f'{p.topic}[{p.partition}]' for p in partitions)}")
+            self._discard_pending(consumer, partitions)
+            self._track_assignment(partitions, assigned=False)
+            if on_revoke:
+                on_revoke(consumer, partitions)
+
         try:
-            consumer.subscribe([topic])
+            consumer.subscribe([topic], on_assign=_on_assign, on_revoke=_on_revoke, on_lost=_on_lost)
             logger.info(f"Subscribed to topic {topic}")
         except Exception as e:
             logger.error(f"Error subscribing to topic {topic}: {e}")
 
-    def consume_messages(self, consumer, message_handler, timeout, stop_event=None):
+    def _track_assignment(self, partitions, assigned):
+        """Registers (or unregisters) assigned partitions with consumed_traffic."""
+        by_topic = {}
+        for p in partitions:
+            by_topic.setdefault(p.topic, []).append(p.partition)
+        for topic, numbers in by_topic.items():
+            if assigned:
+                self.consumed_traffic.add_partitions(topic, numbers)
+            else:
+                self.consumed_traffic.remove_partitions(topic, numbers)
+
+    def _commit_before_revoke(self, consumer, partitions):
+        """Synchronously commits processed offsets of partitions that are about to be revoked."""
+        revoked = {(p.topic, p.partition) for p in partitions}
+        pending = self._pending_offsets.get(id(consumer), {})
+        offsets = {tp: offset for tp, offset in pending.items() if tp in revoked}
+        if offsets:
+            self._commit_offsets(consumer, offsets)
+            for tp in offsets:
+                pending.pop(tp, None)
+
+        if self.get_commit_strategy() == 'interval':
+            # Offsets stored since the last auto-commit would otherwise be processed again by the next owner
+            self._commit_stored_offsets(consumer)
+
+    def _commit_stored_offsets(self, consumer):
+        """Synchronously commits the offsets stored for the background auto-commit, if there are any."""
+        try:
+            consumer.commit(asynchronous=False)
+        except KafkaException as e:
+            if e.args[0].code() != KafkaError._NO_OFFSET:
+                logger.error(f"Failed to commit stored offsets: {e}")
+
+    def _discard_pending(self, consumer, partitions):
+        pending = self._pending_offsets.get(id(consumer), {})
+        for p in partitions:
+            pending.pop((p.topic, p.partition), None)
+
+    def get_consumer_lag(self, consumer):
+        """
+        Returns {"topic[partition]": lag} for every partition assigned to the consumer, where lag is the
+        high watermark minus the group's committed offset, i.e. what kafka-consumer-groups reports and
+        what a replacement consumer would still have to process. Partitions without a committed offset
+        fall back to the consumer's current position.
+        """
+        lag = {}
+        try:
+            assignment = consumer.assignment()
+            if not assignment:
+                return lag
+            committed = {(tp.topic, tp.partition): tp.offset for tp in consumer.committed(assignment, timeout=5)}
+            for tp in consumer.position(assignment):
+                low, high = consumer.get_watermark_offsets(tp, timeout=5, cached=False)
+                offset = committed.get((tp.topic, tp.partition), -1)
+                if offset < 0:
+                    offset = tp.offset if tp.offset >= 0 else low
+                lag[f"{tp.topic}[{tp.partition}]"] = max(high - offset, 0)
+        except KafkaException as e:
+            logger.warning(f"Could not compute consumer lag: {e}")
+        return lag
+
+    def _maybe_report_lag(self, consumer, reporter):
+        if reporter and reporter.lag_due():
+            reporter.report_lag(self.get_consumer_lag(consumer))
+
+    def _maybe_log_traffic(self):
+        """Logs per-partition rates and hot keys of the consumed messages every KAFKA_TRAFFIC_SUMMARY_INTERVAL seconds."""
+        interval = int(os.getenv('KAFKA_TRAFFIC_SUMMARY_INTERVAL', 60))
+        if interval and time.monotonic() - self._last_traffic_summary >= interval:
+            self._last_traffic_summary = time.monotonic()
+            self.consumed_traffic.log_summary('Consumed')
+
+    def consume_messages(self, consumer, message_handler, timeout, stop_event=None, reporter=None):
             """
             Continuously consumes messages from Kafka and processes them using a handler.
             This is a blocking call and will run until stop_event is set or KeyboardInterrupt.
+            The message being handled when stop_event is set is finished and every processed offset is
+            committed before returning; closing the consumer is left to the caller.
+            An offset is committed (or buffered/stored, depending on the commit strategy) only after
+            message_handler returned. If the handler raises, the partition is rewound to the message and
+            it is delivered again after a backoff, so a failure is never turned into a lost message.
+            If a reporter is given, the consumer lag is reported to it periodically.
             """
             if consumer is None:
                 logger.error("Consumer instance is None. Cannot consume messages.")
                 return
 
-            logger.info("Starting Kafka message consumption loop...")
+            strategy = self.get_commit_strategy()
+            commit_batch_size = int(os.getenv('KAFKA_COMMIT_BATCH_SIZE', 100))
+            # Shared with the revoke callback, which commits the offsets of partitions being taken away
+            pending_offsets = self._pending_offsets.setdefault(id(consumer), {})
+            uncommitted = 0
+            # Consecutive failures of the message at this (topic, partition, offset)
+            failed_position, failed_attempts = None, 0
+
+            logger.info(f"Starting Kafka message consumption loop (commit strategy: {strategy})...")
             try:
                 # Loop until a stop_event is set (if provided) or indefinitely
                 while not (stop_event and stop_event.is_set()):
+                    self._maybe_report_lag(consumer, reporter)
+                    self._maybe_log_traffic()
                     msg = consumer.poll(timeout)
 
                     if msg is None: # Timeout, no message currently available
                         continue
                     
                     if msg.error():
-                        if msg.error().code() == KafkaError._PARTITION_EOF:
-                            # End of partition event, not necessarily an error, just means no more messages for now
-                            logger.debug(
-                                f"Reached end of partition: {msg.topic()} [{msg.partition()}] at offset {msg.offset()}"
-                            )
-                        elif msg.error().code() == KafkaError._TRANSPORT:
-                            # Intermittent network/transport error. confluent-kafka handles retries internally.
-                            logger.warning(f"Consumer transport error: {msg.error()}. Will attempt to recover.")
-                        else:
-                            # Other consumer errors (e.g., deserialization error)
-                            logger.error(f"Consumer error: {msg.error()}")
-                            # Depending on the error, you might want to break or implement specific recovery
+                        self._log_consumer_error(msg)
                     else:
                         # Proper message received
+                        self.consumed_traffic.record(msg.topic(), msg.partition(), msg.key())
+                        MESSAGES_CONSUMED.inc(topic=msg.topic(), partition=msg.partition())
                         try:
-                            message_handler(msg)
+                            with HANDLER_DURATION.time(topic=msg.topic(), kind='message'):
+                                message_handler(msg)
                         except Exception as e:
-                            logger.error(f"Error processing message in handler: {e}. Message value: {msg.value()}", exc_info=True)
-                            # Log the error but continue consuming. Decide if you want to commit this offset or not.
+                            position = (msg.topic(), msg.partition(), msg.offset())
+                            failed_attempts = failed_attempts + 1 if position == failed_position else 1
+                            failed_position = position
+                            logger.error("Error processing message in handler (attempt %d): %s. Message value: %s. Redelivering it.",
+                                         failed_attempts, e, msg.value(), exc_info=True)
+                            self._rewind_batch(consumer, [msg])
+                            self._back_off(failed_attempts, stop_event)
+                            continue
+                        failed_position, failed_attempts = None, 0
+
+                        # The handler has finished with the message, so its offset may now be committed
+                        if strategy == 'message':
+                            self._commit_offsets(consumer, {(msg.topic(), msg.partition()): msg.offset() + 1})
+                        elif strategy == 'batch':
+                            pending_offsets[(msg.topic(), msg.partition())] = msg.offset() + 1
+                            uncommitted += 1
+                            if uncommitted >= commit_batch_size:
+                                self._commit_offsets(consumer, pending_offsets)
+                                pending_offsets.clear()
+                                uncommitted = 0
+                        else:
+                            self._store_offset(consumer, msg)
             except Exception as e:
                 logger.error(f"An unexpected error occurred during message consumption loop: {e}", exc_info=True)
             finally:
                 logger.info("Kafka message consumption loop stopped.")
-                if consumer: # Ensure consumer object exists before closing
-                    consumer.close()
-                    logger.info("Kafka consumer closed.")
\ No newline at end of file
+                if pending_offsets:
+                    self._commit_offsets(consumer, pending_offsets)
+                if strategy == 'interval':
+                    self._commit_stored_offsets(consumer)
+                self._pending_offsets.pop(id(consumer), None)
+
+    def consume_delayed(self, consumer, message_handler, timeout, stop_event=None, reporter=None):
+            """
+            Consumes a retry topic (see src.kafka.retry): each message is handed to message_handler only
+            once the time in its x-retry-not-before-ms header has passed. Until then its partition is
+            paused, so waiting never blocks the source topic or the poll loop. Offsets are committed
+            after every handled message. If the handler raises, e.g. because the message could not be
+            routed to the next retry topic or the DLQ, the offset is not committed and the partition is
+            rewound to the message, which is handled again after a backoff. Closing the consumer is left
+            to the caller.
+            """
+            if consumer is None:
+                logger.error("Consumer instance is None. Cannot consume messages.")
+                return
+
+            delayed = DelayedPartitions()
+            failed_position, failed_attempts = None, 0
+            logger.info("Starting Kafka retry consumption loop...")
+            try:
+                while not (stop_event and stop_event.is_set()):
+                    self._maybe_report_lag(consumer, reporter)
+                    delayed.resume_due(consumer)
+                    next_due = delayed.next_due_in()
+                    msg = consumer.poll(min(timeout, next_due) if next_due is not None else timeout)
+                    if msg is None:
+                        continue
+                    if msg.error():
+                        self._log_consumer_error(msg)
+                        continue
+
+                    not_before = message_headers(msg).get(RETRY_NOT_BEFORE_HEADER)
+                    due_at = int(not_before) / 1000.0 if not_before and not_before.isdigit() else 0
+                    if due_at > time.time() and delayed.pause(consumer, msg, due_at):
+                        continue
+
+                    self.consumed_traffic.record(msg.topic(), msg.partition(), msg.key())
+                    MESSAGES_CONSUMED.inc(topic=msg.topic(), partition=msg.partition())
+                    try:
+                        with HANDLER_DURATION.time(topic=msg.topic(), kind='message'):
+                            message_handler(msg)
+                    except Exception as e:
+                        position = (msg.topic(), msg.partition(), msg.offset())
+                        failed_attempts = failed_attempts + 1 if position == failed_position else 1
+                        failed_position = position
+                        logger.error("Error processing retried message (attempt %d): %s. Message value: %s. Redelivering it.",
+                                     failed_attempts, e, msg.value(), exc_info=True)
+                        self._rewind_batch(consumer, [msg])
+                        self._back_off(failed_attempts, stop_event)
+                        continue
+                    failed_position, failed_attempts = None, 0
+                    self._commit_offsets(consumer, {(msg.topic(), msg.partition()): msg.offset() + 1})
+            except Exception as e:
+                logger.error(f"An unexpected error occurred during retry consumption loop: {e}", exc_info=True)
+            finally:
+                logger.info("Kafka retry consumption loop stopped.")
+
+    def consume_batches(self, consumer, batch_handler, batch_size, linger_ms, stop_event=None, reporter=None,
+                        commit=True, on_idle=None, on_failure=None):
+            """
+            Consumes messages in batches of up to batch_size, waiting at most linger_ms for a batch to fill,
+            and hands each batch to batch_handler.
+            Offsets are committed synchronously only after batch_handler returns, whatever the commit
+            strategy. If the handler raises, the consumer is rewound to the start of the batch so the
+            messages are delivered again, backing off between attempts. After KAFKA_BATCH_MAX_ATTEMPTS
+            failures of the same batch its messages are handled one at a time; a message that still
+            fails is passed to on_failure(msg, error) (e.g. a FailureRouter) or logged and skipped, so
+            a poison message cannot block its partition.
+            With commit=False the handler owns offset commits, e.g. because it buffers messages and
+            commits once their effects are durable. on_idle(), if given, is called whenever no
+            messages arrived within linger_ms.
+            stop_event is checked between batches, so the batch in flight is finished and committed
+            before returning. Closing the consumer is left to the caller.
+            """
+            if consumer is None:
+                logger.error("Consumer instance is None. Cannot consume messages.")
+                return
+
+            max_attempts = max(1, int(os.getenv('KAFKA_BATCH_MAX_ATTEMPTS', 3)))
+            # Consecutive failures of the batch starting at these positions
+            failed_start, failed_attempts = None, 0
+
+            logger.info(f"Starting Kafka batch consumption loop (batch_size={batch_size}, linger_ms={linger_ms})...")
+            try:
+                while not (stop_event and stop_event.is_set()):
+                    self._maybe_report_lag(consumer, reporter)
+                    self._maybe_log_traffic()
+                    msgs = consumer.consume(num_messages=batch_size, timeout=linger_ms / 1000.0)
+                    if not msgs:
+                        if on_idle:
+                            on_idle()
+                        continue
+
+                    batch = []
+                    for msg in msgs:
+                        if msg.error():
+                            self._log_consumer_error(msg)
+                        else:
+                            self.consumed_traffic.record(msg.topic(), msg.partition(), msg.key())
+                            MESSAGES_CONSUMED.inc(topic=msg.topic(), partition=msg.partition())
+                            batch.append(msg)
+
+                    if not batch:
+                        continue
+
+                    BATCH_SIZE.observe(len(batch), topic=batch[0].topic())
+                    try:
+                        with HANDLER_DURATION.time(topic=batch[0].topic(), kind='batch'):
+                            batch_handler(batch)
+                    except Exception as e:
+                        start = self._batch_start(batch)
+                        failed_attempts = failed_attempts + 1 if start == failed_start else 1
+                        failed_start = start
+                        if failed_attempts < max_attempts:
+                            logger.error("Error processing batch of %d messages (attempt %d/%d): %s. Rewinding batch.",
+                                         len(batch), failed_attempts, max_attempts, e, exc_info=True)
+                            self._rewind_batch(consumer, batch)
+                            self._back_off(failed_attempts, stop_event)
+                            continue
+                        logger.error("Batch of %d messages failed %d times: %s. Handling its messages one at a time.",
+                                     len(batch), failed_attempts, e)
+                        self._handle_individually(batch, batch_handler, on_failure)
+                    failed_start, failed_attempts = None, 0
+
+                    if not commit:
+                        continue
+                    next_offsets = {}
+                    for msg in batch:
+                        tp = (msg.topic(), msg.partition())
+                        next_offsets[tp] = max(msg.offset() + 1, next_offsets.get(tp, 0))
+                    self._commit_offsets(consumer, next_offsets)
+            except Exception as e:
+                logger.error(f"An unexpected error occurred during batch consumption loop: {e}", exc_info=True)
+            finally:
+                logger.info("Kafka batch consumption loop stopped.")
+
+    def _commit_offsets(self, consumer, offsets):
+        """Synchronously commits {(topic, partition): next_offset_to_read}."""
+        try:
+            consumer.commit(
+                offsets=[TopicPartition(topic, partition, offset) for (topic, partition), offset in offsets.items()],
+                asynchronous=False
+            )
+        except KafkaException as e:
+            logger.error("Failed to commit offsets %s: %s", offsets, e)
+
+    def _store_offset(self, consumer, msg):
+        """Marks a processed message's offset for the next background auto-commit."""
+        try:
+            consumer.store_offsets(message=msg)
+        except KafkaException as e:
+            logger.error("Failed to store offset for %s [%s] @ %s: %s", msg.topic(), msg.partition(), msg.offset(), e)
+
+    @staticmethod
+    def _back_off(attempt, stop_event=None):
+        """Waits before redelivering a failed message or batch, doubling per attempt. Cut short by stop_event."""
+        backoff = min(REDELIVERY_BACKOFF * 2 ** (attempt - 1), REDELIVERY_BACKOFF_MAX)
+        if stop_event:
+            stop_event.wait(backoff)
+        else:
+            time.sleep(backoff)
+
+    def _handle_individually(self, batch, batch_handler, on_failure):
+        """Hands each message of a failing batch to batch_handler alone, routing the ones that still fail."""
+        for msg in batch:
+            try:
+                batch_handler([msg])
+            except Exception as e:
+                logger.error("Message %s [%s] @ %s failed on its own: %s", msg.topic(), msg.partition(), msg.offset(), e, exc_info=True)
+                if on_failure is None:
+                    logger.error("No failure handler; skipping %s [%s] @ %s", msg.topic(), msg.partition(), msg.offset())
+                    continue
+                try:
+                    on_failure(msg, e)
+                except Exception as routing_error:
+                    logger.error("Failed to route %s [%s] @ %s, skipping it: %s",
+                                 msg.topic(), msg.partition(), msg.offset(), routing_error, exc_info=True)
+
+    @staticmethod
+    def _batch_start(batch):
+        """The first offset of each partition in the batch, identifying it across redeliveries."""
+        first_offsets = {}
+        for msg in batch:
+            tp = (msg.topic(), msg.partition())
+            if tp not in first_offsets or msg.offset() < first_offsets[tp]:
+                first_offsets[tp] = msg.offset()
+        return frozenset(first_offsets.items())
+
+    def _rewind_batch(self, consumer, batch):
+        """Seeks every partition in the batch back to the first offset the batch contained."""
+        for (topic, partition), offset in self._batch_start(batch):
+            try:
+                consumer.seek(TopicPartition(topic, partition, offset))
+            except KafkaException as e:
+                logger.error(f"Failed to rewind {topic} [{partition}] to offset {offset}: {e}")
+
+    def rewind_to_committed(self, consumer):
+        """
+        Seeks every assigned partition back to its last committed offset, so everything processed
+        since the last commit is delivered again. Used when buffered work had to be discarded.
+        """
+        try:
+            assignment = consumer.assignment()
+            if not assignment:
+                return
+            for tp in consumer.committed(assignment, timeout=10):
+                offset = tp.offset if tp.offset >= 0 else OFFSET_BEGINNING
+                consumer.seek(TopicPartition(tp.topic, tp.partition, offset))
+            logger.info(f"Rewound {len(assignment)} partition(s) to their committed offsets.")
+        except KafkaException as e:
+            logger.error(f"Failed to rewind consumer to committed offsets: {e}")
+
+    def commit_offsets(self, consumer, offsets):
+        """Synchronously commits {(topic, partition): next_offset_to_read}."""
+        self._commit_offsets(consumer, offsets)
+
+    def _log_consumer_error(self, msg):
+        """Logs an error event returned by poll() or consume()."""
+        if msg.error().code() == KafkaError._PARTITION_EOF:
+            # End of partition event, not necessarily an error, just means no more messages for now
+            logger.debug(
+                f"Reached end of partition: {msg.topic()} [{msg.partition()}] at offset {msg.offset()}"
+            )
+        elif msg.error().code() == KafkaError._TRANSPORT:
+            # Intermittent network/transport error. confluent-kafka handles retries internally.
+            logger.warning("Consumer transport error: %s. Will attempt to recover.", msg.error())
+        else:
+            # Other consumer errors (e.g., deserialization error)
+            logger.error("Consumer error: %s", msg.error())
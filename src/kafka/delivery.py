@@ -0,0 +1,85 @@
+import bisect
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryStats:
+    """
+    Aggregated producer delivery metrics: delivered and failed counts per topic and a
+    produce-to-ack latency histogram. Updated from delivery callbacks, read from anywhere.
+    """
+    LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.delivered = {}
+        self.failed = {}
+        self.latency_counts = [0] * (len(self.LATENCY_BUCKETS_MS) + 1)
+        self.latency_sum_ms = 0.0
+
+    def record(self, topic, latency_seconds=None, error=None):
+        with self._lock:
+            if error is not None:
+                self.failed[topic] = self.failed.get(topic, 0) + 1
+                return
+            self.delivered[topic] = self.delivered.get(topic, 0) + 1
+            if latency_seconds is not None:
+                latency_ms = latency_seconds * 1000.0
+                self.latency_counts[bisect.bisect_left(self.LATENCY_BUCKETS_MS, latency_ms)] += 1
+                self.latency_sum_ms += latency_ms
+
+    def snapshot(self):
+        """Returns a copy of the counters. latency_ms_buckets maps each upper bound ('+Inf' last) to its count."""
+        with self._lock:
+            bounds = [str(b) for b in self.LATENCY_BUCKETS_MS] + ['+Inf']
+            observed = sum(self.latency_counts)
+            return {
+                'delivered': dict(self.delivered),
+                'failed': dict(self.failed),
+                'latency_ms_buckets': dict(zip(bounds, self.latency_counts)),
+                'latency_ms_avg': round(self.latency_sum_ms / observed, 3) if observed else None,
+            }
+
+    def log_summary(self):
+        snapshot = self.snapshot()
+        if not snapshot['delivered'] and not snapshot['failed']:
+            return
+        logger.info(
+            f"Producer deliveries: delivered={snapshot['delivered']} failed={snapshot['failed']} "
+            f"avg_latency_ms={snapshot['latency_ms_avg']}"
+        )
+
+
+class ProducerPoller(threading.Thread):
+    """
+    Serves a producer's delivery callbacks from a background thread so that request handlers
+    never have to call poll() themselves, and logs the aggregated delivery and traffic stats periodically.
+    """
+    def __init__(self, producer, delivery_stats, traffic_stats=None, poll_timeout=0.1, summary_interval=60):
+        super().__init__(name='kafka-producer-poller', daemon=True)
+        self.producer = producer
+        self.delivery_stats = delivery_stats
+        self.traffic_stats = traffic_stats
+        self.poll_timeout = poll_timeout
+        self.summary_interval = summary_interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        last_summary = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                self.producer.poll(self.poll_timeout)
+            except Exception as e:
+                logger.error(f"Error polling Kafka producer: {e}", exc_info=True)
+            if self.summary_interval and time.monotonic() - last_summary >= self.summary_interval:
+                last_summary = time.monotonic()
+                self.delivery_stats.log_summary()
+                if self.traffic_stats:
+                    self.traffic_stats.log_summary('Produced')
+
+    def stop(self, timeout=5):
+        self._stop_event.set()
+        self.join(timeout)
@@ -0,0 +1,212 @@
+import logging
+import time
+import traceback
+from datetime import datetime
+
+from confluent_kafka import KafkaException, TopicPartition
+
+logger = logging.getLogger(__name__)
+
+# Headers added to messages routed to a retry topic or the dead-letter topic
+ORIGINAL_TOPIC_HEADER = 'x-original-topic'
+ORIGINAL_PARTITION_HEADER = 'x-original-partition'
+ORIGINAL_OFFSET_HEADER = 'x-original-offset'
+RETRY_ATTEMPT_HEADER = 'x-retry-attempt'
+RETRY_NOT_BEFORE_HEADER = 'x-retry-not-before-ms'
+ERROR_CLASS_HEADER = 'x-error-class'
+ERROR_MESSAGE_HEADER = 'x-error-message'
+ERROR_TRACE_HEADER = 'x-error-trace'
+FAILED_AT_HEADER = 'x-failed-at'
+
+ROUTING_HEADERS = (
+    ORIGINAL_TOPIC_HEADER, ORIGINAL_PARTITION_HEADER, ORIGINAL_OFFSET_HEADER, RETRY_ATTEMPT_HEADER,
+    RETRY_NOT_BEFORE_HEADER, ERROR_CLASS_HEADER, ERROR_MESSAGE_HEADER, ERROR_TRACE_HEADER, FAILED_AT_HEADER,
+)
+
+MAX_ERROR_HEADER_LENGTH = 2000
+
+
+def retry_topic(topic, attempt):
+    """'order_commands', 1 -> 'order_commands.retry.1'"""
+    return f"{topic}.retry.{attempt}"
+
+
+def dead_letter_topic(topic):
+    return f"{topic}.dlq"
+
+
+def parse_retry_topic(topic):
+    """Returns (source_topic, attempt) for a retry topic, or (topic, 0) for any other topic."""
+    source, separator, attempt = topic.rpartition('.retry.')
+    if separator and attempt.isdigit():
+        return source, int(attempt)
+    return topic, 0
+
+
+def failure_topics(topic, delays):
+    """Every topic the retry subsystem needs for topic: one retry topic per delay, then the DLQ."""
+    return [retry_topic(topic, attempt) for attempt in range(1, len(delays) + 1)] + [dead_letter_topic(topic)]
+
+
+def message_headers(msg):
+    """A message's headers as a {name: str} dict. Later duplicates win."""
+    headers = {}
+    for name, value in msg.headers() or []:
+        headers[name] = value.decode('utf-8', errors='replace') if isinstance(value, bytes) else value
+    return headers
+
+
+class FailureRouter:
+    """
+    Routes messages a handler failed to process away from the partition they came from, so the
+    consumer can commit and move on instead of blocking or silently dropping them.
+
+    Transient failures go to '<topic>.retry.<n>', where n is the attempt number; the message is
+    handled again once delays[n - 1] seconds have passed (see KafkaConnection.consume_delayed).
+    After len(delays) attempts, and straight away for permanent failures such as undecodable or
+    incomplete messages, the message goes to '<topic>.dlq'. The original key, value and headers are
+    kept; the source position, attempt count and last error are added as x-* headers.
+    """
+    def __init__(self, kafka_conn, producer, delays):
+        self.kafka_conn = kafka_conn
+        self.producer = producer
+        self.delays = list(delays)
+
+    def retry(self, msg, error):
+        """
+        Schedules msg for another attempt, or dead-letters it if its attempts are used up.
+        Returns True if it was scheduled for a retry, False if it went to the DLQ.
+        """
+        headers = message_headers(msg)
+        source = headers.get(ORIGINAL_TOPIC_HEADER) or parse_retry_topic(msg.topic())[0]
+        attempt = int(headers.get(RETRY_ATTEMPT_HEADER) or 0) + 1
+        if attempt > len(self.delays):
+            self.dead_letter(msg, error)
+            return False
+
+        not_before_ms = int((time.time() + self.delays[attempt - 1]) * 1000)
+        target = retry_topic(source, attempt)
+        self._forward(msg, target, error, {
+            RETRY_ATTEMPT_HEADER: str(attempt),
+            RETRY_NOT_BEFORE_HEADER: str(not_before_ms),
+        })
+        logger.warning(f"Message {msg.topic()} [{msg.partition()}] @ {msg.offset()} failed ({error}). "
+                       f"Retry {attempt}/{len(self.delays)} via {target} in {self.delays[attempt - 1]}s.")
+        return True
+
+    def dead_letter(self, msg, error):
+        """Sends msg to its source topic's DLQ with the error attached."""
+        headers = message_headers(msg)
+        source = headers.get(ORIGINAL_TOPIC_HEADER) or parse_retry_topic(msg.topic())[0]
+        target = dead_letter_topic(source)
+        self._forward(msg, target, error, {RETRY_ATTEMPT_HEADER: headers.get(RETRY_ATTEMPT_HEADER) or '0'})
+        logger.error(f"Message {msg.topic()} [{msg.partition()}] @ {msg.offset()} sent to {target}: {error}")
+
+    def _forward(self, msg, target, error, extra_headers):
+        headers = message_headers(msg)
+        routing = {
+            ORIGINAL_TOPIC_HEADER: headers.get(ORIGINAL_TOPIC_HEADER) or parse_retry_topic(msg.topic())[0],
+            ORIGINAL_PARTITION_HEADER: headers.get(ORIGINAL_PARTITION_HEADER) or str(msg.partition()),
+            ORIGINAL_OFFSET_HEADER: headers.get(ORIGINAL_OFFSET_HEADER) or str(msg.offset()),
+            ERROR_CLASS_HEADER: type(error).__name__,
+            ERROR_MESSAGE_HEADER: str(error)[:MAX_ERROR_HEADER_LENGTH],
+            ERROR_TRACE_HEADER: ''.join(traceback.format_exception(error))[-MAX_ERROR_HEADER_LENGTH:],
+            FAILED_AT_HEADER: datetime.utcnow().isoformat() + 'Z',
+        }
+        routing.update(extra_headers)
+        if not self.kafka_conn.forward_message(self.producer, target, msg, headers=routing, drop_headers=ROUTING_HEADERS):
+            # The consume loop logs the exception, leaves the offset uncommitted and redelivers the message
+            raise RuntimeError(f"Could not route failed message to {target}")
+
+
+class DelayedPartitions:
+    """
+    Keeps track of retry-topic partitions that were paused because their next message is not due yet.
+    Every message in a retry topic waits the same delay, so a partition's messages become due in order
+    and pausing the partition at the first early message delays nothing that is already due.
+    """
+    def __init__(self):
+        self._resume_at = {}
+
+    def pause(self, consumer, msg, due_at):
+        tp = TopicPartition(msg.topic(), msg.partition(), msg.offset())
+        try:
+            consumer.pause([tp])
+            consumer.seek(tp)
+        except KafkaException as e:
+            logger.error(f"Failed to pause {msg.topic()} [{msg.partition()}] until its retry is due: {e}")
+            return False
+        self._resume_at[(msg.topic(), msg.partition())] = due_at
+        return True
+
+    def resume_due(self, consumer):
+        now = time.time()
+        due = [tp for tp, resume_at in self._resume_at.items() if resume_at <= now]
+        if not due:
+            return
+        try:
+            # Partitions revoked in the meantime are no longer paused by this consumer
+            assigned = {(tp.topic, tp.partition) for tp in consumer.assignment()}
+            resumable = [TopicPartition(topic, partition) for topic, partition in due if (topic, partition) in assigned]
+            if resumable:
+                consumer.resume(resumable)
+        except KafkaException as e:
+            logger.error(f"Failed to resume retry partitions {due}: {e}")
+            return
+        for tp in due:
+            self._resume_at.pop(tp, None)
+
+    def next_due_in(self):
+        """Seconds until the next paused partition is due, or None."""
+        if not self._resume_at:
+            return None
+        return max(min(self._resume_at.values()) - time.time(), 0)
+
+
+def replay_dead_letters(kafka_conn, topic, limit=None, dry_run=False, idle_timeout=10, on_message=None):
+    """
+    Re-publishes the messages parked in topic's dead-letter topic to the topic they failed on, with the
+    retry and error headers removed so they get a fresh set of retries. Reads until idle_timeout seconds
+    pass without a message or limit messages were handled, and commits the DLQ offsets (in the
+    'dlq-replay' consumer group) only after every re-published message was delivered.
+    With dry_run nothing is produced or committed. on_message(msg, headers), if given, is called for
+    each message, e.g. to print it. Returns the number of messages handled.
+    """
+    consumer = kafka_conn.create_consumer(config_overrides={'enable.auto.commit': False}, role='dlq-replay')
+    if consumer is None:
+        raise RuntimeError("Could not create a Kafka consumer for the dead-letter topic")
+    producer = None if dry_run else kafka_conn.create_producer(start_poller=False)
+    if not dry_run and producer is None:
+        consumer.close()
+        raise RuntimeError("Could not create a Kafka producer for replaying")
+
+    handled = 0
+    offsets = {}
+    try:
+        consumer.subscribe([dead_letter_topic(topic)])
+        last_message = time.monotonic()
+        while (limit is None or handled < limit) and time.monotonic() - last_message < idle_timeout:
+            msg = consumer.poll(1.0)
+            if msg is None:
+                continue
+            if msg.error():
+                logger.warning(f"Error reading {dead_letter_topic(topic)}: {msg.error()}")
+                continue
+            last_message = time.monotonic()
+            headers = message_headers(msg)
+            if on_message:
+                on_message(msg, headers)
+            if not dry_run:
+                target = headers.get(ORIGINAL_TOPIC_HEADER) or topic
+                if not kafka_conn.forward_message(producer, target, msg, drop_headers=ROUTING_HEADERS):
+                    raise RuntimeError(f"Could not re-publish {msg.topic()} [{msg.partition()}] @ {msg.offset()}")
+                offsets[(msg.topic(), msg.partition())] = msg.offset() + 1
+            handled += 1
+
+        if not dry_run and offsets:
+            if producer.flush(30):
+                raise RuntimeError("Replayed messages were not all delivered; DLQ offsets were not committed")
+            kafka_conn.commit_offsets(consumer, offsets)
+    finally:
+        consumer.close()
+    return handled
@@ -0,0 +1,110 @@
+import json
+import logging
+import os
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - msgpack is listed in requirements.txt
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE_HEADER = 'content-type'
+
+
+class MessageDecodeError(ValueError):
+    """Raised when a Kafka message value cannot be decoded by its codec."""
+
+
+class JsonCodec:
+    """UTF-8 JSON, the original wire format. Messages without a content-type header are assumed to be JSON."""
+    name = 'json'
+    content_type = 'application/json'
+
+    def encode(self, obj):
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    def decode(self, data):
+        try:
+            return json.loads(data.decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise MessageDecodeError(f"Invalid JSON message: {e}") from e
+
+
+class MsgpackCodec:
+    """Compact binary MessagePack encoding of the same message dicts."""
+    name = 'msgpack'
+    content_type = 'application/x-msgpack'
+
+    def encode(self, obj):
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def decode(self, data):
+        try:
+            return msgpack.unpackb(data, raw=False)
+        except (ValueError, msgpack.UnpackException) as e:
+            raise MessageDecodeError(f"Invalid msgpack message: {e}") from e
+
+
+CODECS = {JsonCodec.name: JsonCodec()}
+if msgpack is not None:
+    CODECS[MsgpackCodec.name] = MsgpackCodec()
+
+CODECS_BY_CONTENT_TYPE = {codec.content_type: codec for codec in CODECS.values()}
+
+
+def get_codec(name):
+    """Returns the codec registered under name, falling back to JSON when it is unknown or unavailable."""
+    codec = CODECS.get(name)
+    if codec is None:
+        logger.warning(f"Codec '{name}' is not available. Falling back to '{JsonCodec.name}'.")
+        return CODECS[JsonCodec.name]
+    return codec
+
+
+class TopicCodecs:
+    """
+    Chooses the codec used to produce to each topic.
+    KAFKA_TOPIC_CODECS maps topics to codecs ("analytics_events=msgpack,order_commands=msgpack");
+    other topics use KAFKA_DEFAULT_CODEC (json by default).
+    Decoding is driven by the message's content-type header, so consumers read either format
+    and topics can be switched without coordinating producers and consumers.
+    """
+    def __init__(self, default=None, overrides=None):
+        self.default = get_codec(default or os.getenv('KAFKA_DEFAULT_CODEC', JsonCodec.name))
+        if overrides is None:
+            overrides = self._parse(os.getenv('KAFKA_TOPIC_CODECS', ''))
+        self.by_topic = {topic: get_codec(name) for topic, name in overrides.items()}
+
+    @staticmethod
+    def _parse(spec):
+        overrides = {}
+        for item in spec.split(','):
+            if '=' in item:
+                topic, name = item.split('=', 1)
+                overrides[topic.strip()] = name.strip()
+        return overrides
+
+    def for_topic(self, topic):
+        return self.by_topic.get(topic, self.default)
+
+    def encode(self, topic, obj):
+        """Returns (value, headers) for producing obj to topic."""
+        codec = self.for_topic(topic)
+        return codec.encode(obj), [(CONTENT_TYPE_HEADER, codec.content_type.encode('utf-8'))]
+
+    def decode(self, msg):
+        """Decodes a consumed message according to its content-type header."""
+        value = msg.value()
+        if value is None:
+            raise MessageDecodeError("Message has no value")
+
+        codec = CODECS[JsonCodec.name]
+        for header, header_value in msg.headers() or []:
+            if header == CONTENT_TYPE_HEADER:
+                content_type = header_value.decode('utf-8') if isinstance(header_value, bytes) else header_value
+                codec = CODECS_BY_CONTENT_TYPE.get(content_type)
+                if codec is None:
+                    raise MessageDecodeError(f"Unsupported content type: {content_type}")
+                break
+        return codec.decode(value)
@@ -0,0 +1,230 @@
+import logging
+import multiprocessing
+import signal
+import threading
+import time
+
+from src.kafka.connection import KafkaConnection
+from src.metrics import REGISTRY, with_labels
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerReporter:
+    """
+    Records a worker's partition assignment and consumer lag in a status table shared with the supervisor.
+    The table is a plain dict for thread workers and a multiprocessing.Manager dict for process workers,
+    so every update replaces the worker's entry instead of mutating it in place.
+    With export_metrics (set in process workers) every lag report also carries a snapshot of the
+    worker process's metrics, which the supervisor serves alongside its own.
+    """
+    def __init__(self, worker_name, status_table, lag_interval=30):
+        self.worker_name = worker_name
+        self.status_table = status_table
+        self.lag_interval = lag_interval
+        self.export_metrics = False
+        self._last_lag_report = 0.0
+        self._update(partitions=[], lag={})
+
+    def _update(self, **fields):
+        entry = dict(self.status_table.get(self.worker_name) or {})
+        entry.update(fields)
+        entry['updated_at'] = time.time()
+        self.status_table[self.worker_name] = entry
+
+    def on_assign(self, consumer, partitions):
+        assigned = [f"{p.topic}[{p.partition}]" for p in partitions]
+        logger.info(f"Worker {self.worker_name} assigned partitions: {', '.join(assigned) or 'none'}")
+        current = set((self.status_table.get(self.worker_name) or {}).get('partitions', []))
+        self._update(partitions=sorted(current | set(assigned)))
+
+    def on_revoke(self, consumer, partitions):
+        revoked = {f"{p.topic}[{p.partition}]" for p in partitions}
+        logger.info(f"Worker {self.worker_name} revoked partitions: {', '.join(sorted(revoked)) or 'none'}")
+        entry = self.status_table.get(self.worker_name) or {}
+        remaining = [p for p in entry.get('partitions', []) if p not in revoked]
+        lag = {p: v for p, v in entry.get('lag', {}).items() if p not in revoked}
+        self._update(partitions=remaining, lag=lag)
+
+    def lag_due(self):
+        return time.monotonic() - self._last_lag_report >= self.lag_interval
+
+    def report_lag(self, lag):
+        self._last_lag_report = time.monotonic()
+        if self.export_metrics:
+            self._update(lag=lag, metrics=REGISTRY.collect(include_collectors=False))
+        else:
+            self._update(lag=lag)
+
+
+def run_worker(app, consumer, topic_name, reporter):
+    """Runs a single consumer worker inside the application context."""
+    with app.app_context():
+        if getattr(app, 'kafka_connection', None) is None:
+            app.kafka_connection = KafkaConnection()
+        consumer.start_consuming(topic_name=topic_name, reporter=reporter)
+
+
+def _run_worker_process(app_factory, consumer_cls, topic_name, reporter):
+    """
+    Entry point for process workers: every process builds its own app, DB engine and Kafka clients.
+    SIGTERM (sent by ConsumerSupervisor.shutdown) and SIGINT stop the consumer gracefully.
+    """
+    consumer = consumer_cls()
+
+    def _request_stop(signum, frame):
+        consumer.stop()
+
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+    reporter.export_metrics = True
+    run_worker(app_factory(), consumer, topic_name, reporter)
+
+
+class ConsumerSupervisor:
+    """
+    Starts a configurable number of consumer workers per topic and keeps them running.
+    Workers of the same pool join the same consumer group, so Kafka spreads the topic's
+    partitions across them and rebalances whenever a worker joins or leaves.
+    Workers run as threads sharing the app, or as separate processes (mode='process') built from app_factory.
+    """
+    RESTART_BACKOFF_SECONDS = 5
+
+    def __init__(self, app, app_factory=None, mode='thread', lag_report_interval=30):
+        if mode not in ('thread', 'process'):
+            raise ValueError(f"Unsupported worker mode: {mode}")
+        if mode == 'process' and app_factory is None:
+            raise ValueError("Process workers require an app_factory")
+
+        self.app = app
+        self.app_factory = app_factory
+        self.mode = mode
+        self.lag_report_interval = lag_report_interval
+        self.pools = {}
+        self.workers = {}
+        self._started_at = {}
+        self._running = False
+        self._last_status_report = time.monotonic()
+
+        if mode == 'process':
+            self._mp_context = multiprocessing.get_context('spawn')
+            self._manager = self._mp_context.Manager()
+            self.status_table = self._manager.dict()
+        else:
+            self._mp_context = None
+            self._manager = None
+            self.status_table = {}
+
+    def add_pool(self, topic_name, consumer_cls, num_workers, num_partitions=None):
+        """Registers a pool of num_workers consumers of consumer_cls for topic_name."""
+        if num_workers < 1:
+            raise ValueError(f"Pool for topic '{topic_name}' needs at least one worker")
+        if num_partitions is not None and num_workers > num_partitions:
+            logger.warning(
+                f"Pool for topic '{topic_name}' has {num_workers} workers but only {num_partitions} partitions. "
+                f"{num_workers - num_partitions} worker(s) will stay idle."
+            )
+        self.pools[topic_name] = (consumer_cls, num_workers)
+
+    def start(self):
+        """Starts every worker of every registered pool."""
+        self._running = True
+        for topic_name, (consumer_cls, num_workers) in self.pools.items():
+            for index in range(num_workers):
+                self._start_worker(f"{topic_name}-{index}", topic_name, consumer_cls)
+        logger.info(f"Consumer supervisor started {len(self.workers)} {self.mode} worker(s).")
+
+    def _start_worker(self, worker_name, topic_name, consumer_cls):
+        reporter = WorkerReporter(worker_name, self.status_table, lag_interval=self.lag_report_interval)
+        consumer = None
+        if self.mode == 'process':
+            worker = self._mp_context.Process(
+                target=_run_worker_process,
+                args=(self.app_factory, consumer_cls, topic_name, reporter),
+                name=worker_name
+            )
+        else:
+            consumer = consumer_cls()
+            worker = threading.Thread(
+                target=run_worker,
+                args=(self.app, consumer, topic_name, reporter),
+                name=worker_name,
+                daemon=True
+            )
+        worker.start()
+        self._started_at[worker_name] = time.monotonic()
+        self.workers[worker_name] = (worker, topic_name, consumer_cls, consumer)
+
+    def check_workers(self):
+        """Restarts workers that exited while the supervisor is still running and logs status periodically."""
+        if not self._running:
+            return
+
+        for worker_name, (worker, topic_name, consumer_cls, consumer) in list(self.workers.items()):
+            if not worker.is_alive():
+                if time.monotonic() - self._started_at[worker_name] < self.RESTART_BACKOFF_SECONDS:
+                    continue
+                logger.warning(f"Worker {worker_name} for topic '{topic_name}' exited. Restarting it.")
+                self._start_worker(worker_name, topic_name, consumer_cls)
+
+        if time.monotonic() - self._last_status_report >= self.lag_report_interval:
+            self._last_status_report = time.monotonic()
+            self.log_status()
+
+    def worker_status(self):
+        """Returns {worker_name: {'partitions': [...], 'lag': {partition: lag}, 'total_lag': int}}."""
+        status = {}
+        for worker_name, entry in dict(self.status_table).items():
+            entry = dict(entry)
+            entry['total_lag'] = sum(entry.get('lag', {}).values())
+            status[worker_name] = entry
+        return status
+
+    def metric_families(self):
+        """
+        Consumer lag per worker and partition, as last reported by each worker, plus the metrics of
+        process workers (labelled with the worker name). Meant for REGISTRY.add_collector().
+        """
+        families = []
+        lag_samples = []
+        for worker_name, entry in dict(self.status_table).items():
+            for partition, lag in entry.get('lag', {}).items():
+                topic, _, index = partition.rpartition('[')
+                lag_samples.append(('kafka_consumer_lag', {'worker': worker_name, 'topic': topic, 'partition': index.rstrip(']')}, lag))
+            families.extend(with_labels(entry.get('metrics', []), worker=worker_name))
+        families.append((
+            'kafka_consumer_lag', 'gauge',
+            "Messages between the consumer group's committed offset and the high watermark.", lag_samples
+        ))
+        return families
+
+    def log_status(self):
+        for worker_name, entry in sorted(self.worker_status().items()):
+            logger.info(
+                f"Worker {worker_name}: partitions={', '.join(entry.get('partitions', [])) or 'none'} "
+                f"lag={entry['total_lag']}"
+            )
+
+    def shutdown(self, timeout=30):
+        """
+        Stops all workers within timeout seconds in total. Every worker is asked to stop at once, finishes
+        the message or batch in hand, commits its offsets, leaves the consumer group and flushes its
+        producer. Process workers still running at the deadline are killed; thread workers are daemons
+        and end with the process.
+        """
+        self._running = False
+        deadline = time.monotonic() + timeout
+        for worker_name, (worker, topic_name, consumer_cls, consumer) in self.workers.items():
+            if consumer is not None:
+                consumer.stop()
+            elif worker.is_alive():
+                worker.terminate()
+        for worker_name, (worker, topic_name, consumer_cls, consumer) in self.workers.items():
+            worker.join(max(deadline - time.monotonic(), 0))
+            if worker.is_alive():
+                logger.warning(f"Worker {worker_name} did not stop within {timeout}s.")
+                if consumer is None:
+                    worker.kill()
+        if self._manager:
+            self._manager.shutdown()
+        logger.info("Consumer supervisor shut down.")
@@ -0,0 +1,94 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TrafficStats:
+    """
+    Per-partition message counts and per-key counts for the topics a client produces or consumes.
+
+    Partition rates show whether a topic's load is spread evenly across its partitions; the key
+    counts show which keys (e.g. product ids on order_commands) are behind a hot partition.
+    At most max_keys keys are tracked per topic. When that limit is reached the least frequent
+    half is dropped, so the counts of rare keys are approximate but the heavy hitters stay exact.
+    Partitions registered with add_partitions (a topic's partitions from metadata, or a consumer's
+    assignment) are reported even before they have seen a message, so an idle partition shows up as skew.
+    """
+    def __init__(self, max_keys=1000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._expected = {}
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.partitions = {}
+            self.keys = {}
+            self._started = time.monotonic()
+
+    def add_partitions(self, topic, partitions):
+        """Registers partitions of topic that are expected to carry traffic. Kept across reset()."""
+        with self._lock:
+            self._expected.setdefault(topic, set()).update(partitions)
+
+    def remove_partitions(self, topic, partitions):
+        """Unregisters partitions, e.g. when they are revoked from this client's consumers."""
+        with self._lock:
+            self._expected.get(topic, set()).difference_update(partitions)
+
+    def record(self, topic, partition, key=None):
+        with self._lock:
+            counts = self.partitions.setdefault(topic, {})
+            counts[partition] = counts.get(partition, 0) + 1
+            if key is None:
+                return
+            if isinstance(key, bytes):
+                key = key.decode('utf-8', errors='replace')
+            keys = self.keys.setdefault(topic, {})
+            keys[key] = keys.get(key, 0) + 1
+            if len(keys) > self.max_keys:
+                for rare_key, count in sorted(keys.items(), key=lambda item: item[1])[:len(keys) // 2]:
+                    del keys[rare_key]
+
+    def snapshot(self, top_n=10):
+        """
+        Returns {topic: {...}} with, for every topic:
+          partitions        - {partition: {'messages': n, 'per_second': rate}}
+          partition_skew    - busiest partition's count divided by the mean over the registered and
+                              the seen partitions (1.0 is perfectly even)
+          top_keys          - the top_n keys as [{'key', 'messages', 'share'}], share of the topic's messages
+        Rates are averaged since the stats were created or last reset.
+        """
+        with self._lock:
+            elapsed = max(time.monotonic() - self._started, 1e-9)
+            result = {}
+            for topic, seen in self.partitions.items():
+                counts = dict.fromkeys(self._expected.get(topic, ()), 0)
+                counts.update(seen)
+                total = sum(counts.values())
+                mean = total / len(counts)
+                top_keys = sorted(self.keys.get(topic, {}).items(), key=lambda item: item[1], reverse=True)[:top_n]
+                result[topic] = {
+                    'messages': total,
+                    'partitions': {
+                        partition: {'messages': count, 'per_second': round(count / elapsed, 3)}
+                        for partition, count in sorted(counts.items())
+                    },
+                    'partition_skew': round(max(counts.values()) / mean, 3),
+                    'top_keys': [
+                        {'key': key, 'messages': count, 'share': round(count / total, 4)}
+                        for key, count in top_keys
+                    ],
+                }
+            return result
+
+    def log_summary(self, label='Kafka traffic', top_n=3):
+        for topic, stats in self.snapshot(top_n).items():
+            rates = ', '.join(f"[{p}]={s['per_second']}/s" for p, s in stats['partitions'].items())
+            hot_keys = ', '.join(f"{k['key']}={k['share']:.0%}" for k in stats['top_keys'])
+            logger.info(
+                f"{label} {topic}: {rates} skew={stats['partition_skew']}"
+                + (f" hot keys: {hot_keys}" if hot_keys else "")
+            )
@@ -0,0 +1,174 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_FORMATS = ('text', 'json')
+
+# Loggers for per-message events are named '<module>.messages' (see message_logger)
+MESSAGE_LOGGER_SUFFIX = '.messages'
+
+# Attributes every LogRecord has; anything else on a record came from extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+
+
+def message_logger(name):
+    """
+    The logger for per-message events of module name, e.g. 'Processing order message ...'.
+    Its records below WARNING are sampled and rate limited (see SampledLogger). Log with
+    %-style arguments, so nothing is formatted for records that are disabled or dropped.
+    """
+    return SampledLogger(logging.getLogger(name + MESSAGE_LOGGER_SUFFIX), {})
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, thread, any extra={...} fields and the traceback."""
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        if record.stack_info:
+            entry['stack_info'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class MessageSampler:
+    """
+    Decides which per-message records below WARNING are logged: every sample_every-th record of a
+    logger, and at most max_per_second of those per second (0 for no limit).
+    """
+    def __init__(self, sample_every=1, max_per_second=0):
+        self._lock = threading.Lock()
+        self.configure(sample_every, max_per_second)
+
+    def configure(self, sample_every=1, max_per_second=0):
+        with self._lock:
+            self.sample_every = max(int(sample_every), 1)
+            self.max_per_second = int(max_per_second)
+            # logger name -> [records seen, rate window start, passed in window, suppressed]
+            self._state = {}
+
+    def admit(self, name):
+        """Returns None if the record is to be dropped, else the number of records dropped since the last one admitted."""
+        with self._lock:
+            state = self._state.get(name)
+            if state is None:
+                state = self._state[name] = [0, 0.0, 0, 0]
+            state[0] += 1
+            keep = (state[0] - 1) % self.sample_every == 0
+            if keep and self.max_per_second:
+                now = time.monotonic()
+                if now - state[1] >= 1.0:
+                    state[1] = now
+                    state[2] = 0
+                keep = state[2] < self.max_per_second
+                state[2] += keep
+            if not keep:
+                state[3] += 1
+                return None
+            suppressed, state[3] = state[3], 0
+            return suppressed
+
+
+_sampler = MessageSampler()
+
+
+class SampledLogger(logging.LoggerAdapter):
+    """
+    Drops sampled-out records before a LogRecord is even built, so a dropped per-message event
+    costs a level check and a counter. The number of records dropped since the last one that was
+    logged is attached to it as 'suppressed'. Warnings and errors are always logged.
+    """
+    def log(self, level, msg, *args, **kwargs):
+        if not self.logger.isEnabledFor(level):
+            return
+        if level < logging.WARNING:
+            suppressed = _sampler.admit(self.logger.name)
+            if suppressed is None:
+                return
+            if suppressed:
+                kwargs['extra'] = dict(kwargs.get('extra') or {}, suppressed=suppressed)
+        # Report the caller's file and line, not this method's
+        kwargs['stacklevel'] = kwargs.get('stacklevel', 1) + 1
+        self.logger.log(level, msg, *args, **kwargs)
+
+
+class AsyncHandler(logging.handlers.QueueHandler):
+    """
+    Puts records on an in-memory queue for a QueueListener thread to write. The message is
+    rendered here, because its arguments may change once the call returns, and so is a traceback,
+    which would otherwise keep the failing frames alive; everything else is left for the formatter.
+    """
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def configure_logging(config=None, stream=None):
+    """
+    Sets up the root logger of this process from LOG_LEVEL, LOG_FORMAT ('text' or 'json'), LOG_ASYNC,
+    LOG_MESSAGE_SAMPLE_EVERY and LOG_MESSAGE_MAX_PER_SECOND in config (a dict or Flask config; see Config).
+    Replaces any handlers already on the root logger, so it can be called again, e.g. by every app factory.
+    With LOG_ASYNC the calling thread only enqueues records; a background thread writes them to stream
+    (stderr by default) and drains the queue when the process exits.
+    """
+    global _listener
+    config = config or {}
+    log_format = config.get('LOG_FORMAT', 'text')
+    if log_format not in LOG_FORMATS:
+        raise ValueError(f"Unsupported LOG_FORMAT: {log_format}. Use one of {', '.join(LOG_FORMATS)}")
+
+    _stop_listener()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+    stream_handler = logging.StreamHandler(stream or sys.stderr)
+    stream_handler.setFormatter(JsonFormatter() if log_format == 'json' else logging.Formatter(TEXT_FORMAT))
+
+    if config.get('LOG_ASYNC', True):
+        log_queue = queue.SimpleQueue()
+        handler = AsyncHandler(log_queue)
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+        _listener.start()
+    else:
+        handler = stream_handler
+    root.addHandler(handler)
+    root.setLevel(config.get('LOG_LEVEL', 'INFO'))
+    _sampler.configure(config.get('LOG_MESSAGE_SAMPLE_EVERY', 1), config.get('LOG_MESSAGE_MAX_PER_SECOND', 0))
+
+
+atexit.register(_stop_listener)
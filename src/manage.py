@@ -1,5 +1,7 @@
+import click
 from src import create_app, db
 from src.config import DevelopmentConfig 
+from src.kafka.retry import ERROR_CLASS_HEADER, ERROR_MESSAGE_HEADER, FAILED_AT_HEADER, RETRY_ATTEMPT_HEADER, replay_dead_letters
 
 app = create_app(DevelopmentConfig)
 
@@ -8,6 +10,23 @@ def seed_db_command():
     """Seeds the database with initial data."""
     print("Database seeded with example data.")
 
+@app.cli.command('replay_dlq')
+@click.argument('topic')
+@click.option('--limit', type=int, default=None, help='Replay at most this many messages.')
+@click.option('--dry-run', is_flag=True, help='Only list the dead-lettered messages.')
+@click.option('--idle-timeout', type=float, default=10, show_default=True,
+              help='Stop after this many seconds without a new message.')
+def replay_dlq_command(topic, limit, dry_run, idle_timeout):
+    """Re-publishes the messages in TOPIC's dead-letter topic (TOPIC.dlq) to TOPIC."""
+    def show(msg, headers):
+        key = msg.key().decode('utf-8', errors='replace') if msg.key() else '-'
+        print(f"{msg.topic()} [{msg.partition()}] @ {msg.offset()} key={key} attempts={headers.get(RETRY_ATTEMPT_HEADER, '0')} "
+              f"failed_at={headers.get(FAILED_AT_HEADER, '-')} {headers.get(ERROR_CLASS_HEADER, '')}: {headers.get(ERROR_MESSAGE_HEADER, '')}")
+
+    count = replay_dead_letters(app.kafka_connection, topic, limit=limit, dry_run=dry_run,
+                                idle_timeout=idle_timeout, on_message=show)
+    print(f"{'Found' if dry_run else 'Replayed'} {count} message(s) from {topic}.dlq")
+
 @app.shell_context_processor
 def make_shell_context():
     """Register items for the Flask shell."""
@@ -0,0 +1,256 @@
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS_SECONDS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class _Metric:
+    """A metric family: one value per combination of label values. Every label must be given on update."""
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes the labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def remove(self, **labels):
+        """Drops the series for these label values, e.g. for a partition that was revoked."""
+        with self._lock:
+            self._values.pop(self._key(labels), None)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def _samples(self):
+        with self._lock:
+            return [(self.name, dict(zip(self.labelnames, key)), value) for key, value in self._values.items()]
+
+    def collect(self):
+        """(name, type, documentation, [(sample_name, labels, value)]), as plain data that can be pickled."""
+        return self.name, self.type, self.documentation, self._samples()
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Cumulative buckets with upper bounds buckets (plus +Inf), and the sum and count of observations."""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS_SECONDS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One count per bucket, then +Inf, then the sum of the observed values
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the time spent in the with block, in seconds, also when the block raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self):
+        with self._lock:
+            values = {key: list(counts) for key, counts in self._values.items()}
+        samples = []
+        for key, counts in values.items():
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", dict(labels, le=_format_value(bound)), cumulative))
+            samples.append((f"{self.name}_sum", labels, counts[-1]))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    The metrics of this process, rendered in the Prometheus text format.
+    Collectors registered with add_collector() contribute families computed at scrape time, e.g. the
+    consumer lag held by the ConsumerSupervisor or the metrics reported by worker processes.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered as a {metric.type} with labels {metric.labelnames}")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS_SECONDS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def add_collector(self, collector):
+        """collector() returns an iterable of families in the format of _Metric.collect()."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def remove_collector(self, collector):
+        with self._lock:
+            if collector in self._collectors:
+                self._collectors.remove(collector)
+
+    def collect(self, include_collectors=True):
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors) if include_collectors else []
+        families = [metric.collect() for metric in metrics]
+        for collector in collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                logger.error(f"Metrics collector {collector} failed: {e}", exc_info=True)
+        return families
+
+    def render(self):
+        """Every family in the Prometheus text format. Families with the same name are merged."""
+        merged = {}
+        for name, metric_type, documentation, samples in self.collect():
+            family = merged.setdefault(name, (metric_type, documentation, []))
+            family[2].extend(samples)
+
+        lines = []
+        for name, (metric_type, documentation, samples) in merged.items():
+            lines.append(f"# HELP {name} {_escape(documentation, quote=False)}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for sample_name, labels, value in samples:
+                if labels:
+                    rendered = ','.join(f'{label}="{_escape(str(v))}"' for label, v in labels.items())
+                    lines.append(f"{sample_name}{{{rendered}}} {_format_value(value)}")
+                else:
+                    lines.append(f"{sample_name} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value, quote=True):
+    value = value.replace('\\', '\\\\').replace('\n', '\\n')
+    return value.replace('"', '\\"') if quote else value
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() and abs(value) < 1e15 else repr(value)
+    return str(value)
+
+
+def with_labels(families, **extra):
+    """Adds extra labels to every sample of families, e.g. worker="order_commands-0"."""
+    return [
+        (name, metric_type, documentation, [(sample, dict(labels, **extra), value) for sample, labels, value in samples])
+        for name, metric_type, documentation, samples in families
+    ]
+
+
+REGISTRY = MetricsRegistry()
+
+MESSAGES_CONSUMED = REGISTRY.counter(
+    'kafka_messages_consumed_total', 'Messages handed to a consumer handler.', ('topic', 'partition'))
+MESSAGES_PRODUCED = REGISTRY.counter(
+    'kafka_messages_produced_total', 'Messages acknowledged by the broker.', ('topic', 'partition'))
+PRODUCE_ERRORS = REGISTRY.counter(
+    'kafka_produce_errors_total', 'Messages the producer failed to deliver.', ('topic',))
+HANDLER_DURATION = REGISTRY.histogram(
+    'kafka_handler_duration_seconds', 'Time spent in a consumer handler per message or per batch.', ('topic', 'kind'))
+BATCH_SIZE = REGISTRY.histogram(
+    'kafka_batch_size', 'Messages per batch handed to a batch handler.', ('topic',), buckets=BATCH_SIZE_BUCKETS)
+DB_COMMIT_DURATION = REGISTRY.histogram(
+    'db_commit_duration_seconds', 'Time spent in Session.commit(), including the final flush.')
+REDIS_CALL_DURATION = REGISTRY.histogram(
+    'redis_call_duration_seconds', 'Redis round trips by command; pipelines count as one call.', ('command',))
+
+
+def metrics_view():
+    """Flask view serving REGISTRY. Each process (e.g. every gunicorn worker) reports its own metrics."""
+    from flask import Response
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would flood the log
+        pass
+
+
+def start_metrics_server(port, host='0.0.0.0', registry=REGISTRY):
+    """
+    Serves registry at http://host:port/metrics from a daemon thread, for processes without a Flask
+    server such as consumer_app.py. Returns the server; call shutdown() on it to stop.
+    """
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
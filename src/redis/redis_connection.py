@@ -1,29 +1,107 @@
 import os
 import redis
+import redis.client
+import redis.utils
 import logging
 import json
+from contextlib import contextmanager
+
+from src.metrics import REDIS_CALL_DURATION
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+class _TimedPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error=True):
+        with REDIS_CALL_DURATION.time(command='MULTI' if self.transaction else 'PIPELINE'):
+            return super().execute(raise_on_error)
+
+
+class TimedRedis(redis.StrictRedis):
+    """A Redis client that records the latency of every command and pipeline in redis_call_duration_seconds."""
+    def execute_command(self, *args, **options):
+        with REDIS_CALL_DURATION.time(command=str(args[0]).upper()):
+            return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return _TimedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
 class RedisConnection:
-    def __init__(self):
+    """
+    Redis access for the app and the consumers, backed by a shared connection pool.
+
+    Values that are not strings are stored as JSON and decoded again on the way out. Bulk helpers
+    (mget_data, mset_data) and the pipeline()/transaction() context managers send many commands in a
+    single round trip. A pre-built client (e.g. fakeredis.FakeStrictRedis(decode_responses=True)) can be
+    passed in instead of connecting to a server; only the client connect() creates records command latency.
+    """
+    def __init__(self, client=None):
         self.host = os.getenv('REDIS_HOST', 'localhost')
         self.port = int(os.getenv('REDIS_PORT', 6379))
         self.db = int(os.getenv('REDIS_DB', 0))
         self.password = os.getenv('REDIS_PASSWORD', None)
-        self.client = None
+        self.max_connections = int(os.getenv('REDIS_MAX_CONNECTIONS', 50))
+        self.socket_timeout = float(os.getenv('REDIS_SOCKET_TIMEOUT', 5))
+        self.health_check_interval = int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', 30))
+        self.pool = None
+        self.client = client
 
     def connect(self):
-        self.client = redis.StrictRedis(
+        """
+        Creates the connection pool and checks the server with a PING.
+        Returns False (and leaves the client unset) if Redis cannot be reached.
+        """
+        if self.client is not None:
+            return self.ping()
+
+        # redis-py parses replies with hiredis automatically when the package is installed
+        parser = 'hiredis' if redis.utils.HIREDIS_AVAILABLE else 'python'
+        self.pool = redis.ConnectionPool(
             host=self.host,
             port=self.port,
             db=self.db,
+            password=self.password,
             decode_responses=True,
+            max_connections=self.max_connections,
+            socket_timeout=self.socket_timeout,
+            socket_connect_timeout=self.socket_timeout,
+            socket_keepalive=True,
+            health_check_interval=self.health_check_interval,
+            retry_on_timeout=True,
         )
-        self.client.ping()
+        self.client = TimedRedis(connection_pool=self.pool)
+        try:
+            self.client.ping()
+        except redis.RedisError as e:
+            logger.error(f"Could not connect to Redis at {self.host}:{self.port}: {e}")
+            self.close()
+            return False
+        logger.info(f"Connected to Redis at {self.host}:{self.port} (pool size {self.max_connections}, {parser} parser).")
         return True
-    
+
+    def ping(self):
+        """Health check. Returns True if Redis answers."""
+        if not self.client:
+            return False
+        try:
+            return bool(self.client.ping())
+        except redis.RedisError as e:
+            logger.error(f"Redis health check failed: {e}")
+            return False
+
+    @staticmethod
+    def _encode(value):
+        return value if isinstance(value, str) else json.dumps(value)
+
+    @staticmethod
+    def _decode(data):
+        if data is None:
+            return None
+        try:
+            return json.loads(data)
+        except json.JSONDecodeError:
+            return data
+
     def set_data(self, key, value, ex=None, nx=False, xx=False):
         """
         Sets a key-value pair in Redis
@@ -32,9 +110,7 @@ class RedisConnection:
             logger.error("Redis client not connected.")
             return False
         try:
-            if not isinstance(value, str):
-                value = json.dumps(value)
-            return self.client.set(key, value, ex=ex, nx=nx, xx=xx)
+            return self.client.set(key, self._encode(value), ex=ex, nx=nx, xx=xx)
         except Exception as e:
             logger.error(f"Error setting data in Redis for key '{key}': {e}")
             return False
@@ -43,23 +119,106 @@ class RedisConnection:
         """
         Retrieves data from Redis by key
         """
-        if not self.redis_client:
+        if not self.client:
             logger.error("Redis client not connected.")
             return None
         try:
-            data = self.redis_client.get(key)
-            if data:
-                try:
-                    return json.loads(data)
-                except json.JSONDecodeError:
-                    return data
-            return None
+            data = self.client.get(key)
+            return self._decode(data) if data else None
         except Exception as e:
             logger.error(f"Error getting data from Redis for key '{key}': {e}")
             return None
 
+    def mget_data(self, keys):
+        """
+        Retrieves several keys in one round trip. Returns a list of decoded values in the order
+        of keys, with None for missing keys.
+        """
+        keys = list(keys)
+        if not self.client:
+            logger.error("Redis client not connected.")
+            return [None] * len(keys)
+        if not keys:
+            return []
+        try:
+            return [self._decode(data) if data else None for data in self.client.mget(keys)]
+        except Exception as e:
+            logger.error(f"Error getting {len(keys)} keys from Redis: {e}")
+            return [None] * len(keys)
+
+    def mset_data(self, mapping, ex=None):
+        """
+        Sets several key-value pairs in one round trip, each with an optional expiry in seconds.
+        Returns True if every key was written.
+        """
+        if not self.client:
+            logger.error("Redis client not connected.")
+            return False
+        if not mapping:
+            return True
+        try:
+            if ex is None:
+                return bool(self.client.mset({key: self._encode(value) for key, value in mapping.items()}))
+            with self.pipeline() as pipe:
+                for key, value in mapping.items():
+                    pipe.set(key, self._encode(value), ex=ex)
+                return all(pipe.execute())
+        except Exception as e:
+            logger.error(f"Error setting {len(mapping)} keys in Redis: {e}")
+            return False
+
+    @contextmanager
+    def pipeline(self, transaction=False):
+        """
+        Yields a pipeline whose queued commands are sent in a single round trip.
+        Commands still queued when the block exits normally are executed then; call
+        pipe.execute() inside the block to get the replies.
+        """
+        if not self.client:
+            raise redis.ConnectionError("Redis client not connected.")
+        pipe = self.client.pipeline(transaction=transaction)
+        try:
+            yield pipe
+            if len(pipe):
+                pipe.execute()
+        finally:
+            pipe.reset()
+
+    def transaction(self):
+        """Like pipeline(), but the queued commands are wrapped in MULTI/EXEC and applied atomically."""
+        return self.pipeline(transaction=True)
+
+    def delete_data(self, *keys):
+        """
+        Deletes one or more keys from Redis
+        """
+        if not self.client:
+            logger.error("Redis client not connected.")
+            return 0
+        try:
+            return self.client.delete(*keys)
+        except Exception as e:
+            logger.error(f"Error deleting keys {keys} from Redis: {e}")
+            return 0
+
+    def incr(self, key, amount=1):
+        """
+        Atomically increments an integer key and returns the new value
+        """
+        if not self.client:
+            logger.error("Redis client not connected.")
+            return None
+        try:
+            return self.client.incr(key, amount)
+        except Exception as e:
+            logger.error(f"Error incrementing key '{key}' in Redis: {e}")
+            return None
+
     def close(self):
-        """Closes the Redis connection"""
-        if self.redis_client:
-            self.redis_client = None
+        """Disconnects the pool's connections"""
+        if self.pool:
+            self.pool.disconnect()
+            self.pool = None
+        if self.client:
+            self.client = None
             logger.info("Redis client reference cleared.")
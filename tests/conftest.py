@@ -0,0 +1,35 @@
+import atexit
+
+import fakeredis
+import pytest
+
+from benchmarks.fake_kafka import FakeKafkaConnection
+from src import create_app, db
+from src.config import TestingConfig
+from src.redis.redis_connection import RedisConnection
+
+
+@pytest.fixture
+def redis_server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def redis_conn(redis_server):
+    """A RedisConnection backed by a fresh in-memory fakeredis server."""
+    conn = RedisConnection(client=fakeredis.FakeStrictRedis(server=redis_server, decode_responses=True))
+    assert conn.connect()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def app(redis_conn):
+    """The Flask app on an in-memory database, with in-process Kafka and fakeredis."""
+    app = create_app(TestingConfig, kafka_connection=FakeKafkaConnection(), redis_connection=redis_conn)
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.drop_all()
+    atexit.unregister(app.kafka_connection.close_producer)
+    app.kafka_connection.close_producer(app.kafka_producer)
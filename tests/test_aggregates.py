@@ -0,0 +1,98 @@
+from datetime import datetime
+
+import pytest
+import redis
+
+from src.analytics.aggregates import AnalyticsAggregates
+
+CREATED_AT = datetime(2026, 3, 1, 12, 30)
+
+
+def _event(order_id, product_id='p1', quantity=2, total_price=10.0):
+    return {'order_id': order_id, 'product_id': product_id, 'quantity': quantity,
+            'total_price': total_price, 'created_at': CREATED_AT, 'product_name': 'Widget'}
+
+
+def test_record_orders_counts_each_order_once(redis_conn):
+    aggregates = AnalyticsAggregates(redis_conn)
+
+    assert aggregates.record_orders([_event(1), _event(2, quantity=1, total_price=5.0), _event(1)]) == 2
+    assert aggregates.record_orders([_event(1), _event(2)]) == 0
+
+    assert aggregates.all_time_totals() == {'orders': 2, 'units': 3, 'revenue': 15.0}
+    assert aggregates.totals('hour', CREATED_AT, CREATED_AT) == [
+        {'bucket': '2026030112', 'orders': 2, 'units': 3, 'revenue': 15.0}
+    ]
+    assert 0 < redis_conn.client.ttl(f"{AnalyticsAggregates.SEEN_KEY_PREFIX}1") <= aggregates.seen_ttl
+
+
+def test_record_orders_writes_markers_and_counts_together(redis_conn, monkeypatch):
+    aggregates = AnalyticsAggregates(redis_conn)
+
+    def crash(pipe, events):
+        raise RuntimeError("consumer died")
+    monkeypatch.setattr(aggregates, '_queue_increments', crash)
+    with pytest.raises(RuntimeError):
+        aggregates.record_orders([_event(1)])
+    monkeypatch.undo()
+
+    # Nothing was marked, so the redelivered event is still counted
+    assert redis_conn.client.exists(f"{AnalyticsAggregates.SEEN_KEY_PREFIX}1") == 0
+    assert aggregates.record_orders([_event(1)]) == 1
+    assert aggregates.all_time_totals()['orders'] == 1
+
+
+def test_record_orders_rechecks_when_another_consumer_marks_an_order(redis_conn, monkeypatch):
+    aggregates = AnalyticsAggregates(redis_conn)
+    queue_increments = aggregates._queue_increments
+    rounds = []
+
+    def concurrent_writer(pipe, events):
+        rounds.append([event['order_id'] for event in events])
+        if len(rounds) == 1:
+            redis_conn.client.set(f"{AnalyticsAggregates.SEEN_KEY_PREFIX}1", 1)
+        queue_increments(pipe, events)
+    monkeypatch.setattr(aggregates, '_queue_increments', concurrent_writer)
+
+    assert aggregates.record_orders([_event(1), _event(2)]) == 1
+    assert rounds == [[1, 2], [2]]
+    assert aggregates.all_time_totals()['orders'] == 1
+
+
+def test_record_orders_gives_up_when_markers_keep_changing(redis_conn, monkeypatch):
+    aggregates = AnalyticsAggregates(redis_conn)
+
+    def always_conflicting(pipe, events):
+        raise redis.WatchError("conflict")
+    monkeypatch.setattr(aggregates, '_queue_increments', always_conflicting)
+
+    with pytest.raises(redis.WatchError):
+        aggregates.record_orders([_event(1)])
+    assert aggregates.all_time_totals() == {'orders': 0, 'units': 0, 'revenue': 0}
+
+
+@pytest.fixture
+def analytics_client(app):
+    app.analytics_aggregates.record_orders([_event(1)])
+    return app.test_client()
+
+
+@pytest.mark.parametrize('start, end', [
+    ('2026-03-01T12:00:00Z', '2026-03-01T12:59:00Z'),
+    ('2026-03-01T12:00:00%2B00:00', '2026-03-01T12:59:00%2B00:00'),
+    ('2026-03-01T14:00:00%2B02:00', '2026-03-01T12:59:00'),
+])
+def test_summary_accepts_naive_and_offset_timestamps(analytics_client, start, end):
+    response = analytics_client.get(f'/shop/analytics/summary?granularity=hour&start={start}&end={end}')
+
+    assert response.status_code == 200
+    assert response.get_json()['series'] == [{'bucket': '2026030112', 'orders': 1, 'units': 2, 'revenue': 10.0}]
+
+
+@pytest.mark.parametrize('query', [
+    'start=2026-03-01T13:00:00Z&end=2026-03-01T12:00:00Z',
+    'start=yesterday',
+    'granularity=week',
+])
+def test_invalid_range_is_a_bad_request(analytics_client, query):
+    assert analytics_client.get(f'/shop/analytics/summary?{query}').status_code == 400
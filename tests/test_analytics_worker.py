@@ -0,0 +1,75 @@
+import threading
+import time
+
+import fakeredis
+import pytest
+
+import analytics_worker
+from benchmarks.fake_kafka import FakeKafkaConnection
+from src.analytics import analytics_consumer
+from src.analytics.aggregates import AnalyticsAggregates
+from src.config import TestingConfig
+from src.redis.redis_connection import RedisConnection
+
+
+@pytest.fixture
+def kafka_conn(monkeypatch):
+    conn = FakeKafkaConnection()
+    monkeypatch.setattr(analytics_worker, 'KafkaConnection', lambda: conn)
+    return conn
+
+
+@pytest.fixture
+def redis_conn(redis_server, monkeypatch):
+    """Every worker opens its own connection to the same fakeredis server."""
+    def connect():
+        return RedisConnection(client=fakeredis.FakeStrictRedis(server=redis_server, decode_responses=True))
+    monkeypatch.setattr(analytics_consumer, 'RedisConnection', connect)
+    conn = connect()
+    assert conn.connect()
+    return conn
+
+
+@pytest.fixture
+def config():
+    config = analytics_worker.load_config(TestingConfig)
+    config.update(COMMAND_TOPIC_PARTITIONS=2, ANALYTICS_BATCH_LINGER_MS=10)
+    return config
+
+
+def _order_created(kafka_conn, count):
+    producer = kafka_conn.create_producer(start_poller=False)
+    for i in range(count):
+        kafka_conn.produce_message(producer, analytics_worker.ANALYTICS_TOPIC, {
+            'event_type': 'OrderCreated', 'order_id': f"o{i}", 'quantity': 1, 'total_price': 10.0,
+            'order_created_at': '2026-03-01T12:00:00Z', 'product_details': {'product_id': 'p1', 'name': 'Widget'},
+        }, key=f"o{i}")
+    kafka_conn.close_producer(producer)
+
+
+def test_config_is_loaded_like_flask_loads_it(config):
+    assert config['TESTING'] is True
+    assert config['ANALYTICS_CONSUMER_WORKERS'] == TestingConfig.ANALYTICS_CONSUMER_WORKERS
+    assert not any(key.startswith('_') or not key.isupper() for key in config)
+
+
+def test_workers_share_the_analytics_group_and_commit_before_stopping(kafka_conn, redis_conn, config):
+    stop = threading.Event()
+    result = []
+    runner = threading.Thread(target=lambda: result.append(
+        analytics_worker.run_analytics_workers(2, config, stop, shutdown_timeout=5)))
+    runner.start()
+    _order_created(kafka_conn, 6)
+
+    aggregates = AnalyticsAggregates(redis_conn)
+    deadline = time.monotonic() + 5
+    while aggregates.all_time_totals()['orders'] < 6 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    stop.set()
+    runner.join(10)
+
+    assert result == [True]
+    assert aggregates.all_time_totals() == {'orders': 6, 'units': 6, 'revenue': 60.0}
+    group = kafka_conn.get_group_id('analytics')
+    committed = [kafka_conn.broker.committed(group, analytics_worker.ANALYTICS_TOPIC, p) for p in range(2)]
+    assert sum(committed) == 6
@@ -0,0 +1,69 @@
+from datetime import datetime
+from io import BytesIO
+
+import pytest
+
+from src import db
+from src.Shop.command_status import FAILED, PENDING
+from src.Shop import views
+from src.Shop.model import Inventory, Products
+
+NOW = datetime(2026, 3, 1, 12, 0)
+JSON = {'Accept': 'application/json'}
+
+
+@pytest.fixture
+def client(app):
+    db.session.add(Products(id='p1', name='Widget', price=10, description="Test product",
+                            image_url="uploads/p1.png", created_at=NOW, updated_at=NOW))
+    db.session.add(Inventory(product_id='p1', quantity=5))
+    db.session.commit()
+    return app.test_client()
+
+
+def _fail_produce(app, monkeypatch):
+    monkeypatch.setattr(app.kafka_connection, 'produce_message', lambda *args, **kwargs: False)
+
+
+def test_accepted_order_is_pending(app, client):
+    response = client.post('/shop/product/create-order/p1/10', data={'quantity': 2}, headers=JSON)
+
+    assert response.status_code == 202
+    body = response.get_json()
+    assert body['status'] == PENDING
+    assert app.command_status.get_status(body['command_id'])['status'] == PENDING
+
+
+def test_order_that_cannot_be_produced_is_marked_failed(app, client, monkeypatch):
+    _fail_produce(app, monkeypatch)
+
+    response = client.post('/shop/product/create-order/p1/10', data={'quantity': 2}, headers=JSON)
+
+    assert response.status_code == 503
+    body = response.get_json()
+    assert body['status'] == FAILED
+    entry = app.command_status.get_status(body['command_id'])
+    assert entry['status'] == FAILED and entry['error'] == body['error']
+
+
+def test_order_form_that_cannot_be_produced_shows_an_error(app, client, monkeypatch):
+    _fail_produce(app, monkeypatch)
+
+    response = client.post('/shop/product/create-order/p1/10', data={'quantity': 2})
+
+    assert response.status_code == 503
+    assert b'could not be sent' in response.data
+
+
+def test_product_that_cannot_be_produced_is_marked_failed_and_its_image_removed(app, client, monkeypatch, tmp_path):
+    monkeypatch.setattr(views, 'UPLOAD_FOLDER', str(tmp_path))
+    _fail_produce(app, monkeypatch)
+
+    response = client.post('/shop/products/create', headers=JSON, data={
+        'name': 'Gadget', 'price': '5', 'description': 'A small gadget', 'stock_quantity': '3',
+        'image': (BytesIO(b'png'), 'gadget.png'),
+    })
+
+    assert response.status_code == 503
+    assert app.command_status.get_status(response.get_json()['command_id'])['status'] == FAILED
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,61 @@
+import threading
+
+import pytest
+
+from src.redis.redis_connection import RedisConnection
+from src.Shop.command_status import APPLIED, FAILED, PENDING, REJECTED, CommandStatusStore
+
+
+@pytest.fixture
+def store(redis_conn):
+    return CommandStatusStore(redis_conn, ttl=60, poll_interval=0.01)
+
+
+def test_command_moves_from_pending_to_applied(store, redis_conn):
+    assert store.set_status('c1', PENDING, 'CreateOrderCommand', order_id='o1')
+    assert store.get_status('c1')['status'] == PENDING
+
+    store.set_status('c1', APPLIED, 'CreateOrderCommand')
+
+    entry = store.get_status('c1')
+    assert (entry['status'], entry['command_type']) == (APPLIED, 'CreateOrderCommand')
+    assert 0 < redis_conn.client.ttl(store._key('c1')) <= 60
+
+
+def test_failed_command_keeps_its_error(store):
+    store.set_status('c1', PENDING, 'CreateOrderCommand')
+    store.set_status('c1', FAILED, 'CreateOrderCommand', error="database unavailable")
+
+    assert store.get_status('c1')['error'] == "database unavailable"
+
+
+@pytest.mark.parametrize('final_status', [APPLIED, REJECTED])
+def test_wait_returns_once_the_command_leaves_pending(store, final_status):
+    store.set_status('c1', PENDING)
+    threading.Timer(0.05, store.set_status, args=('c1', final_status)).start()
+
+    assert store.wait_for('c1', timeout=2)['status'] == final_status
+
+
+def test_wait_gives_up_at_the_timeout(store):
+    store.set_status('c1', PENDING)
+
+    assert store.wait_for('c1', timeout=0.05)['status'] == PENDING
+    assert store.wait_for('unknown', timeout=0.05) is None
+
+
+def test_store_without_redis_tracks_nothing():
+    store = CommandStatusStore(RedisConnection(client=None))
+
+    assert not store.set_status('c1', PENDING)
+    assert store.get_status('c1') is None
+
+
+def test_status_endpoint_reports_known_and_unknown_commands(app):
+    client = app.test_client()
+    app.command_status.set_status('c1', REJECTED, 'CreateOrderCommand', error="Insufficient stock")
+
+    response = client.get('/shop/commands/c1')
+    assert response.status_code == 200
+    assert response.get_json()['status'] == REJECTED
+    assert client.get('/shop/commands/c2').status_code == 404
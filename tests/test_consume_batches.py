@@ -0,0 +1,92 @@
+import threading
+
+import pytest
+from confluent_kafka import TopicPartition
+
+from benchmarks.fake_kafka import FakeConsumer, FakeKafkaConnection
+from src.kafka import connection
+
+TOPIC = 'events'
+
+
+@pytest.fixture
+def kafka_conn(monkeypatch):
+    monkeypatch.setattr(connection, 'REDELIVERY_BACKOFF', 0)
+    conn = FakeKafkaConnection()
+    conn.broker.create_topic(TOPIC, 1)
+    return conn
+
+
+def _consumer(kafka_conn, values):
+    for value in values:
+        kafka_conn.broker.append(TOPIC, 0, None, value.encode(), None)
+    consumer = FakeConsumer(kafka_conn.broker, {'group.id': 'test', 'enable.auto.commit': False})
+    consumer.assign([TopicPartition(TOPIC, 0, 0)])
+    return consumer
+
+
+def _run(kafka_conn, consumer, handler, last, **kwargs):
+    """Consumes until the message with value last has been handled successfully."""
+    stop = threading.Event()
+    handled = []
+
+    def batch_handler(msgs):
+        values = handler(msgs)
+        handled.extend(values)
+        if last in values:
+            stop.set()
+
+    kafka_conn.consume_batches(consumer, batch_handler, batch_size=10, linger_ms=10, stop_event=stop, **kwargs)
+    return handled
+
+
+def _fail_on_poison(attempts):
+    def handler(msgs):
+        attempts.append([msg.value().decode() for msg in msgs])
+        if any(msg.value() == b'poison' for msg in msgs):
+            raise ValueError("poison")
+        return [msg.value().decode() for msg in msgs]
+    return handler
+
+
+def test_poison_message_is_routed_after_the_retry_cap(kafka_conn, monkeypatch):
+    monkeypatch.setenv('KAFKA_BATCH_MAX_ATTEMPTS', '2')
+    consumer = _consumer(kafka_conn, ['a', 'poison', 'b'])
+    attempts, routed = [], []
+
+    handled = _run(kafka_conn, consumer, _fail_on_poison(attempts), last='b',
+                   on_failure=lambda msg, error: routed.append((msg.value(), str(error))))
+
+    # Two attempts of the whole batch, then one message at a time
+    assert attempts == [['a', 'poison', 'b'], ['a', 'poison', 'b'], ['a'], ['poison'], ['b']]
+    assert handled == ['a', 'b']
+    assert routed == [(b'poison', 'poison')]
+    assert kafka_conn.broker.committed('test', TOPIC, 0) == 3
+
+
+def test_poison_message_without_a_failure_handler_is_skipped(kafka_conn, monkeypatch):
+    monkeypatch.setenv('KAFKA_BATCH_MAX_ATTEMPTS', '1')
+    consumer = _consumer(kafka_conn, ['poison', 'a'])
+
+    handled = _run(kafka_conn, consumer, _fail_on_poison([]), last='a')
+
+    assert handled == ['a']
+    assert kafka_conn.broker.committed('test', TOPIC, 0) == 2
+
+
+def test_transient_failure_is_retried_as_a_batch(kafka_conn, monkeypatch):
+    monkeypatch.setenv('KAFKA_BATCH_MAX_ATTEMPTS', '3')
+    consumer = _consumer(kafka_conn, ['a', 'b'])
+    attempts, routed = [], []
+
+    def flaky(msgs):
+        attempts.append(len(msgs))
+        if len(attempts) < 3:
+            raise ConnectionError("unavailable")
+        return [msg.value().decode() for msg in msgs]
+
+    handled = _run(kafka_conn, consumer, flaky, last='b', on_failure=lambda msg, error: routed.append(msg))
+
+    assert attempts == [2, 2, 2]
+    assert handled == ['a', 'b']
+    assert routed == []
@@ -0,0 +1,67 @@
+import threading
+
+import pytest
+from confluent_kafka import TopicPartition
+
+from benchmarks.fake_kafka import FakeKafkaConnection
+from src.kafka import connection
+
+TOPIC = 'events'
+
+
+@pytest.fixture
+def kafka_conn(monkeypatch):
+    monkeypatch.setattr(connection, 'REDELIVERY_BACKOFF', 0)
+    conn = FakeKafkaConnection()
+    conn.broker.create_topic(TOPIC, 1)
+    for value in ('a', 'b', 'c'):
+        conn.broker.append(TOPIC, 0, None, value.encode(), None)
+    return conn
+
+
+def _consume(kafka_conn, handler):
+    consumer = kafka_conn.create_consumer(role='test')
+    consumer.assign([TopicPartition(TOPIC, 0, 0)])
+    stop = threading.Event()
+    handled = []
+
+    def message_handler(msg):
+        value = msg.value().decode()
+        handled.append(value)
+        handler(value, stop)
+
+    kafka_conn.consume_messages(consumer, message_handler, timeout=0.01, stop_event=stop)
+    consumer.close()
+    return handled
+
+
+@pytest.mark.parametrize('strategy', ['message', 'batch', 'interval'])
+def test_failed_message_is_redelivered_before_its_offset_is_committed(kafka_conn, monkeypatch, strategy):
+    monkeypatch.setenv('KAFKA_COMMIT_STRATEGY', strategy)
+    failures = []
+
+    def handler(value, stop):
+        if value == 'b' and len(failures) < 2:
+            failures.append(value)
+            raise RuntimeError("database unavailable")
+        if value == 'c':
+            stop.set()
+
+    assert _consume(kafka_conn, handler) == ['a', 'b', 'b', 'b', 'c']
+    assert kafka_conn.broker.committed(kafka_conn.get_group_id('test'), TOPIC, 0) == 3
+
+
+@pytest.mark.parametrize('strategy', ['message', 'batch', 'interval'])
+def test_offset_of_a_message_that_keeps_failing_is_not_committed(kafka_conn, monkeypatch, strategy):
+    monkeypatch.setenv('KAFKA_COMMIT_STRATEGY', strategy)
+    attempts = []
+
+    def handler(value, stop):
+        if value == 'b':
+            attempts.append(value)
+            if len(attempts) == 3:
+                stop.set()
+            raise RuntimeError("database unavailable")
+
+    assert _consume(kafka_conn, handler) == ['a', 'b', 'b', 'b']
+    assert kafka_conn.broker.committed(kafka_conn.get_group_id('test'), TOPIC, 0) == 1
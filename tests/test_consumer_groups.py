@@ -0,0 +1,67 @@
+import pytest
+
+from benchmarks.fake_kafka import FakeKafkaConnection
+
+TOPIC = 'order_commands'
+
+
+@pytest.fixture
+def kafka_conn(monkeypatch):
+    monkeypatch.setenv('KAFKA_GROUP_ID', 'shop')
+    conn = FakeKafkaConnection()
+    conn.broker.create_topic(TOPIC, 2)
+    return conn
+
+
+def test_each_role_gets_its_own_group(kafka_conn, monkeypatch):
+    monkeypatch.setenv('KAFKA_GROUP_ID_ORDER_RETRY', 'legacy-group')
+
+    assert kafka_conn.get_group_id() == 'shop'
+    assert kafka_conn.get_group_id('order') == 'shop.order'
+    assert kafka_conn.get_group_id('analytics') == 'shop.analytics'
+    assert kafka_conn.get_group_id('order-retry') == 'legacy-group'
+    assert kafka_conn.get_config('consumer', role='product')['group.id'] == 'shop.product'
+
+
+@pytest.mark.parametrize('strategy, expected', [('cooperative-sticky', 'cooperative-sticky'), ('sticky-ish', None)])
+def test_partition_assignment_strategy_is_opt_in(kafka_conn, monkeypatch, strategy, expected):
+    monkeypatch.setenv('KAFKA_PARTITION_ASSIGNMENT_STRATEGY', strategy)
+
+    assert kafka_conn.get_config('consumer').get('partition.assignment.strategy') == expected
+
+
+def test_processed_offsets_are_committed_before_partitions_are_revoked(kafka_conn, monkeypatch):
+    monkeypatch.setenv('KAFKA_COMMIT_STRATEGY', 'interval')
+    monkeypatch.setenv('KAFKA_COMMIT_INTERVAL_MS', '600000')
+    for partition in (0, 1):
+        for value in (b'a', b'b'):
+            kafka_conn.broker.append(TOPIC, partition, None, value, None)
+    first = kafka_conn.create_consumer(role='order')
+    flushed = []
+    kafka_conn.subscibe_to_topic(first, TOPIC, on_flush=lambda partitions: flushed.extend(p.partition for p in partitions))
+    for msg in first.consume(4, timeout=1):
+        first.store_offsets(msg)
+
+    # A second worker joins: the first one gives up a partition on its next poll
+    second = kafka_conn.create_consumer(role='order')
+    kafka_conn.subscibe_to_topic(second, TOPIC)
+    first.poll(0)
+
+    group = kafka_conn.get_group_id('order')
+    assert len(flushed) == 1
+    assert [kafka_conn.broker.committed(group, TOPIC, p) for p in (0, 1)] == [2, 2]
+    assert second.poll(0.05) is None
+    first.close()
+    second.close()
+
+
+def test_roles_commit_to_separate_groups(kafka_conn, monkeypatch):
+    monkeypatch.setenv('KAFKA_COMMIT_STRATEGY', 'message')
+    kafka_conn.broker.append(TOPIC, 0, None, b'a', None)
+    orders = kafka_conn.create_consumer(role='order')
+    kafka_conn.subscibe_to_topic(orders, TOPIC)
+    orders.commit(orders.poll(1), asynchronous=False)
+
+    assert kafka_conn.broker.committed(kafka_conn.get_group_id('order'), TOPIC, 0) == 1
+    assert kafka_conn.broker.committed(kafka_conn.get_group_id('order-retry'), TOPIC, 0) < 0
+    orders.close()
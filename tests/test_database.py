@@ -0,0 +1,68 @@
+import logging
+
+from flask import Flask
+from sqlalchemy import create_engine, text
+
+from src import database
+from src.database import apply_sqlite_pragmas, configure_engine, engine_options
+
+
+def _app(uri, **config):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=uri, **config)
+    return app
+
+
+def test_server_database_gets_a_sized_pre_pinged_pool():
+    options = engine_options({'SQLALCHEMY_DATABASE_URI': 'postgresql://shop:secret@db:5432/shop',
+                              'DB_POOL_SIZE': 4, 'DB_MAX_OVERFLOW': 2, 'DB_POOL_TIMEOUT': 5, 'DB_POOL_RECYCLE': 60})
+
+    assert options == {'pool_size': 4, 'max_overflow': 2, 'pool_timeout': 5, 'pool_recycle': 60, 'pool_pre_ping': True}
+
+
+def test_server_database_gets_no_sqlite_pragmas(monkeypatch):
+    listened = []
+    monkeypatch.setattr(database.event, 'listen', lambda *args: listened.append(args))
+    app = _app('postgres://shop:secret@db:5432/shop')
+
+    configure_engine(app)
+    apply_sqlite_pragmas(app, object())
+
+    assert app.config['SQLALCHEMY_DATABASE_URI'] == 'postgresql://shop:secret@db:5432/shop'
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS']['pool_pre_ping'] is True
+    assert listened == []
+
+
+def test_database_password_is_masked_in_the_log(caplog):
+    with caplog.at_level(logging.DEBUG, logger=database.__name__):
+        configure_engine(_app('postgresql://shop:secret@db:5432/shop'))
+
+    assert 'postgresql://shop:***@db:5432/shop' in caplog.text
+    assert 'secret' not in caplog.text
+
+
+def test_sqlite_keeps_the_default_pool_and_gets_its_pragmas(tmp_path):
+    app = _app(f"sqlite:///{tmp_path / 'shop.db'}", SQLITE_BUSY_TIMEOUT_MS=1234, SQLITE_SYNCHRONOUS='full')
+    configure_engine(app)
+    engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'])
+
+    apply_sqlite_pragmas(app, engine)
+    with engine.connect() as conn:
+        pragmas = {name: conn.execute(text(f"PRAGMA {name}")).scalar()
+                   for name in ('journal_mode', 'busy_timeout', 'synchronous')}
+    engine.dispose()
+
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS'] == {}
+    assert pragmas == {'journal_mode': 'wal', 'busy_timeout': 1234, 'synchronous': 2}
+
+
+def test_in_memory_sqlite_skips_the_write_ahead_log():
+    app = _app('sqlite://', SQLITE_JOURNAL_MODE='WAL')
+    engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'])
+
+    apply_sqlite_pragmas(app, engine)
+    with engine.connect() as conn:
+        journal_mode = conn.execute(text("PRAGMA journal_mode")).scalar()
+    engine.dispose()
+
+    assert journal_mode == 'memory'
@@ -0,0 +1,79 @@
+import threading
+
+import pytest
+from confluent_kafka import OFFSET_INVALID, TopicPartition
+
+from benchmarks.fake_kafka import FakeKafkaConnection
+from src.kafka import connection
+from src.kafka.retry import FailureRouter, dead_letter_topic, retry_topic
+
+TOPIC = 'events'
+
+
+@pytest.fixture
+def kafka_conn(monkeypatch):
+    monkeypatch.setattr(connection, 'REDELIVERY_BACKOFF', 0)
+    monkeypatch.setenv('KAFKA_COMMIT_STRATEGY', 'message')
+    conn = FakeKafkaConnection()
+    for topic in (TOPIC, retry_topic(TOPIC, 1), dead_letter_topic(TOPIC)):
+        conn.broker.create_topic(topic, 1)
+    return conn
+
+
+def _failing_handler(router, route, stop, attempts, max_attempts):
+    """A handler whose processing always fails and that routes the message like the consumers do."""
+    def handler(msg):
+        attempts.append(msg.offset())
+        if len(attempts) == max_attempts:
+            stop.set()
+        route(router, msg, ValueError("bad payload"))
+    return handler
+
+
+def _run(kafka_conn, topic, loop, route, max_attempts, forward_ok):
+    kafka_conn.forward_message = lambda *args, **kwargs: forward_ok
+    kafka_conn.broker.append(topic, 0, None, b'{}', None)
+    consumer = kafka_conn.create_consumer(role='test')
+    consumer.assign([TopicPartition(topic, 0, 0)])
+    router = FailureRouter(kafka_conn, kafka_conn.create_producer(start_poller=False), (1,))
+    stop = threading.Event()
+    attempts = []
+    # Ends the loop even if the message is (wrongly) never delivered again
+    deadline = threading.Timer(2, stop.set)
+    deadline.start()
+
+    loop(consumer, _failing_handler(router, route, stop, attempts, max_attempts), timeout=0.01, stop_event=stop)
+    deadline.cancel()
+    consumer.close()
+    return attempts, kafka_conn.broker.committed(kafka_conn.get_group_id('test'), topic, 0)
+
+
+def _retry(router, msg, error):
+    router.retry(msg, error)
+
+
+def _dead_letter(router, msg, error):
+    router.dead_letter(msg, error)
+
+
+def test_message_is_not_committed_when_it_cannot_be_routed_to_a_retry_topic(kafka_conn):
+    attempts, committed = _run(kafka_conn, TOPIC, kafka_conn.consume_messages, _retry, 3, forward_ok=False)
+
+    assert attempts == [0, 0, 0]
+    assert committed == OFFSET_INVALID
+
+
+def test_message_is_committed_once_it_was_routed(kafka_conn):
+    attempts, committed = _run(kafka_conn, TOPIC, kafka_conn.consume_messages, _retry, 1, forward_ok=True)
+
+    assert attempts == [0]
+    assert committed == 1
+
+
+def test_retried_message_is_not_committed_when_it_cannot_be_dead_lettered(kafka_conn):
+    topic = retry_topic(TOPIC, 1)
+
+    attempts, committed = _run(kafka_conn, topic, kafka_conn.consume_delayed, _dead_letter, 3, forward_ok=False)
+
+    assert attempts == [0, 0, 0]
+    assert committed == OFFSET_INVALID
@@ -0,0 +1,76 @@
+from datetime import datetime
+
+import pytest
+
+from src import db
+from src.Shop.inventory import rejection_reason, reserve_stock, reserve_stock_bulk, stock_levels
+from src.Shop.model import Inventory, Products
+
+NOW = datetime(2026, 3, 1, 12, 0)
+
+
+@pytest.fixture
+def stock(app):
+    for product_id, quantity in (('p1', 5), ('p2', 1)):
+        db.session.add(Products(id=product_id, name=product_id, price=10, created_at=NOW, updated_at=NOW))
+        db.session.add(Inventory(product_id=product_id, quantity=quantity))
+    db.session.commit()
+
+
+def _quantity(product_id):
+    return db.session.query(Inventory.quantity).filter_by(product_id=product_id).scalar()
+
+
+def test_reservation_takes_stock_down_to_zero_but_never_below(stock):
+    assert reserve_stock('p1', 3, NOW)
+    assert not reserve_stock('p1', 3, NOW)
+    assert reserve_stock('p1', 2, NOW)
+    assert not reserve_stock('p1', 1, NOW)
+    db.session.commit()
+
+    assert _quantity('p1') == 0
+
+
+@pytest.mark.parametrize('quantity', [6, 0, -1])
+def test_invalid_or_oversized_reservation_changes_nothing(stock, quantity):
+    assert not reserve_stock('p1', quantity, NOW)
+    assert not reserve_stock('missing', 1, NOW)
+    db.session.commit()
+
+    assert stock_levels(['p1', 'missing']) == {'p1': 5}
+
+
+def test_reservation_decided_on_a_stale_read_is_refused(stock):
+    # Another consumer takes the stock after this one read it
+    available = stock_levels(['p1'])['p1']
+    Inventory.query.filter_by(product_id='p1').update({'quantity': 1})
+    db.session.commit()
+
+    assert available == 5
+    assert not reserve_stock('p1', available, NOW)
+    assert _quantity('p1') == 1
+
+
+@pytest.fixture(params=[True, False], ids=['executemany', 'per-row'])
+def multi_rowcount(request, monkeypatch, app):
+    monkeypatch.setattr(db.engine.dialect, 'supports_sane_multi_rowcount', request.param)
+    return request.param
+
+
+def test_bulk_reservation_applies_every_decrement(stock, multi_rowcount):
+    assert reserve_stock_bulk({'p1': (4, NOW), 'p2': (1, NOW)})
+    db.session.commit()
+
+    assert stock_levels(['p1', 'p2']) == {'p1': 1, 'p2': 0}
+
+
+def test_bulk_reservation_reports_a_product_it_cannot_cover(stock, multi_rowcount):
+    assert not reserve_stock_bulk({'p1': (4, NOW), 'p2': (2, NOW)})
+    db.session.rollback()
+
+    assert stock_levels(['p1', 'p2']) == {'p1': 5, 'p2': 1}
+
+
+def test_rejection_reason_names_the_missing_stock():
+    assert rejection_reason('p1', 7, 5) == "Insufficient stock for product p1: requested 7, available 5"
+    assert rejection_reason('p9', 1, None) == "Product p9 not found"
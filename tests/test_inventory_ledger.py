@@ -0,0 +1,47 @@
+from datetime import datetime
+
+import pytest
+
+from src import db
+from src.Shop.inventory_ledger import InventoryLedger
+from src.Shop.model import Inventory, Orders, Products
+
+NOW = datetime(2026, 3, 1, 12, 0)
+
+
+@pytest.fixture
+def stock(app):
+    for product_id, quantity in (('p1', 5), ('p2', 1)):
+        db.session.add(Products(id=product_id, name=product_id, price=10, created_at=NOW, updated_at=NOW))
+        db.session.add(Inventory(product_id=product_id, quantity=quantity))
+    db.session.commit()
+
+
+def _order(order_id, product_id, quantity):
+    return Orders(id=order_id, product_id=product_id, quantity=quantity, total_price=10 * quantity,
+                  created_at=NOW, updated_at=NOW)
+
+
+def _set_stock(product_id, quantity):
+    Inventory.query.filter_by(product_id=product_id).update({'quantity': quantity})
+    db.session.commit()
+
+
+def test_flush_forgets_products_with_orders_and_with_rejections(stock):
+    ledger = InventoryLedger()
+    ledger.load(0, ['p1', 'p2'])
+    assert ledger.reserve(0, 'p1', 2)
+    ledger.add_order('c1', _order('o1', 'p1', 2))
+    assert not ledger.reserve(0, 'p2', 3)
+    ledger.add_rejection('c2', _order('o2', 'p2', 3), 'short')
+
+    batch = ledger.pending_batch()
+    ledger.write(batch)
+    db.session.commit()
+    ledger.flushed(batch)
+
+    # A restock of the rejected product is seen on its next order
+    _set_stock('p2', 10)
+    ledger.load(0, ['p1', 'p2'])
+    assert ledger.available(0, 'p1') == 3
+    assert ledger.available(0, 'p2') == 10
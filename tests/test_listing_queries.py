@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src import db
+from src.database import assert_max_queries
+from src.Shop.model import Inventory, Orders, Products
+
+START = datetime(2026, 3, 1, 12, 0)
+
+
+@pytest.fixture
+def client(app):
+    for i in range(30):
+        created_at = START + timedelta(minutes=i)
+        product_id = f"p{i:02d}"
+        db.session.add(Products(id=product_id, name=f"Product {i:02d}", price=100 + i,
+                                description="Test product", image_url=f"uploads/{product_id}.png",
+                                created_at=created_at, updated_at=created_at))
+        db.session.add(Inventory(product_id=product_id, quantity=i))
+        db.session.add(Orders(id=f"o{i:02d}", product_id=product_id, quantity=1, total_price=100 + i,
+                              created_at=created_at, updated_at=created_at))
+    db.session.commit()
+    db.session.remove()
+    return app.test_client()
+
+
+def test_order_listing_loads_orders_and_products_in_one_query(client):
+    with assert_max_queries(db.engine, 1):
+        response = client.get('/shop/orders?per_page=25')
+
+    assert response.status_code == 200
+    assert b'Product 29' in response.data and b'Product 05' in response.data
+
+
+def test_order_listing_next_page_stays_within_budget(client):
+    first = client.get('/shop/orders?per_page=25')
+    cursor = first.data.split(b'cursor=')[1].split(b'&')[0].split(b'"')[0].decode()
+
+    with assert_max_queries(db.engine, 1):
+        response = client.get(f'/shop/orders?per_page=25&cursor={cursor}')
+
+    assert response.status_code == 200
+    assert b'Product 04' in response.data and b'Product 05' not in response.data
+
+
+def test_product_listing_loads_stock_in_the_same_query(client):
+    with assert_max_queries(db.engine, 1):
+        response = client.get('/shop/products?per_page=25')
+
+    assert response.status_code == 200
+    assert b'Product 29' in response.data
+
+
+def test_filtered_product_listing_stays_within_budget(client):
+    with assert_max_queries(db.engine, 1):
+        response = client.get('/shop/products?name=Product%201&min_price=112&max_price=118')
+
+    assert response.status_code == 200
+    assert b'Product 12' in response.data and b'Product 18' in response.data
+    assert b'Product 11' not in response.data and b'Product 19' not in response.data
+
+
+def test_cached_product_listing_runs_no_queries(client):
+    client.get('/shop/products')
+
+    with assert_max_queries(db.engine, 0):
+        response = client.get('/shop/products')
+
+    assert response.status_code == 200
@@ -0,0 +1,89 @@
+import io
+import json
+import logging
+
+import pytest
+
+from src import logging_config
+from src.logging_config import MessageSampler, configure_logging, message_logger
+
+
+@pytest.fixture
+def configure():
+    """Configures logging into a buffer and restores the root logger afterwards."""
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    stream = io.StringIO()
+
+    def _configure(**config):
+        configure_logging(dict({'LOG_FORMAT': 'json', 'LOG_ASYNC': False, 'LOG_LEVEL': 'DEBUG'}, **config), stream=stream)
+        return stream
+
+    yield _configure
+    logging_config._stop_listener()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+    logging_config._sampler.configure()
+
+
+def _records(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_sampler_keeps_every_nth_record_per_logger_and_counts_the_rest():
+    sampler = MessageSampler(sample_every=3)
+
+    assert [sampler.admit('orders') for _ in range(7)] == [0, None, None, 2, None, None, 2]
+    assert sampler.admit('products') == 0
+
+
+def test_sampler_rate_limits_per_second(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(logging_config.time, 'monotonic', lambda: now[0])
+    sampler = MessageSampler(max_per_second=2)
+
+    first_second = [sampler.admit('orders') for _ in range(4)]
+    now[0] += 1.0
+    next_second = sampler.admit('orders')
+
+    assert first_second == [0, 0, None, None]
+    assert next_second == 2
+
+
+def test_sampled_logger_drops_debug_and_info_but_never_warnings(configure):
+    stream = configure(LOG_MESSAGE_SAMPLE_EVERY=2)
+    log = message_logger('tests.orders')
+
+    for i in range(4):
+        log.info("order %d", i)
+    log.warning("order %d failed", 4)
+
+    records = _records(stream)
+    assert [record['message'] for record in records] == ['order 0', 'order 2', 'order 4 failed']
+    assert [record.get('suppressed') for record in records] == [None, 1, None]
+    assert {record['logger'] for record in records} == {'tests.orders.messages'}
+
+
+def test_async_handler_renders_the_message_and_traceback_when_called(configure):
+    stream = configure(LOG_ASYNC=True)
+    payload = {'status': 'pending'}
+    try:
+        raise ValueError("bad payload")
+    except ValueError:
+        logging.getLogger('tests.async').error("payload %s", payload, exc_info=True)
+    payload['status'] = 'changed'
+
+    # Stopping the listener drains the queue
+    logging_config._stop_listener()
+
+    [record] = _records(stream)
+    assert record['message'] == "payload {'status': 'pending'}"
+    assert 'ValueError: bad payload' in record['exc_info']
+
+
+def test_unknown_log_format_is_rejected(configure):
+    with pytest.raises(ValueError):
+        configure(LOG_FORMAT='xml')
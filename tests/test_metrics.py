@@ -0,0 +1,107 @@
+import urllib.request
+
+import pytest
+
+from src.kafka.supervisor import ConsumerSupervisor
+from src.metrics import MetricsRegistry, start_metrics_server
+
+
+@pytest.fixture
+def registry():
+    return MetricsRegistry()
+
+
+def test_counter_renders_help_type_and_one_line_per_label_set(registry):
+    consumed = registry.counter('messages_total', 'Messages handled.', ('topic', 'partition'))
+    consumed.inc(topic='orders', partition=0)
+    consumed.inc(2, topic='orders', partition=0)
+    consumed.inc(topic='products', partition=1)
+
+    assert registry.render() == (
+        '# HELP messages_total Messages handled.\n'
+        '# TYPE messages_total counter\n'
+        'messages_total{topic="orders",partition="0"} 3\n'
+        'messages_total{topic="products",partition="1"} 1\n'
+    )
+
+
+def test_histogram_buckets_are_cumulative_with_sum_and_count(registry):
+    duration = registry.histogram('handler_seconds', 'Handler time.', ('kind',), buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        duration.observe(value, kind='batch')
+
+    assert registry.render().splitlines()[2:] == [
+        'handler_seconds_bucket{kind="batch",le="0.1"} 2',
+        'handler_seconds_bucket{kind="batch",le="1"} 3',
+        'handler_seconds_bucket{kind="batch",le="+Inf"} 4',
+        'handler_seconds_sum{kind="batch"} 3.65',
+        'handler_seconds_count{kind="batch"} 4',
+    ]
+
+
+def test_timer_observes_a_block_that_raises(registry):
+    duration = registry.histogram('commit_seconds', 'Commit time.')
+
+    with pytest.raises(RuntimeError):
+        with duration.time():
+            raise RuntimeError("database is locked")
+
+    assert 'commit_seconds_count 1' in registry.render()
+
+
+def test_label_values_and_help_are_escaped(registry):
+    registry.gauge('lag', 'Lag\nper "partition".', ('topic',)).set(1.5, topic='a"b\\c')
+
+    assert registry.render().splitlines() == [
+        '# HELP lag Lag\\nper "partition".',
+        '# TYPE lag gauge',
+        'lag{topic="a\\"b\\\\c"} 1.5',
+    ]
+
+
+def test_metric_needs_every_label_and_a_consistent_registration(registry):
+    counter = registry.counter('errors_total', 'Errors.', ('topic',))
+
+    with pytest.raises(ValueError):
+        counter.inc()
+    with pytest.raises(ValueError):
+        registry.gauge('errors_total', 'Errors.', ('topic',))
+    assert registry.counter('errors_total', 'Errors.', ('topic',)) is counter
+
+
+def test_worker_families_are_merged_under_the_supervisors_names(app, registry):
+    supervisor = ConsumerSupervisor(app)
+    worker_metrics = registry.counter('messages_total', 'Messages handled.', ('topic',))
+    worker_metrics.inc(topic='orders')
+    supervisor.status_table['orders-0'] = {'lag': {'orders[2]': 7}, 'metrics': registry.collect(include_collectors=False)}
+    supervisor.status_table['orders-1'] = {'lag': {}, 'metrics': registry.collect(include_collectors=False)}
+    scraped = MetricsRegistry()
+    scraped.add_collector(supervisor.metric_families)
+
+    lines = scraped.render().splitlines()
+
+    assert lines.count('# TYPE messages_total counter') == 1
+    assert 'messages_total{topic="orders",worker="orders-0"} 1' in lines
+    assert 'messages_total{topic="orders",worker="orders-1"} 1' in lines
+    assert 'kafka_consumer_lag{worker="orders-0",topic="orders",partition="2"} 7' in lines
+
+
+def test_failing_collector_does_not_break_the_scrape(registry):
+    registry.counter('up_total', 'Up.').inc()
+    registry.add_collector(lambda: 1 / 0)
+
+    assert 'up_total 1' in registry.render()
+
+
+def test_metrics_server_serves_the_registry(registry):
+    registry.counter('up_total', 'Up.').inc()
+    server = start_metrics_server(0, host='127.0.0.1', registry=registry)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics", timeout=5) as response:
+            body = response.read().decode('utf-8')
+            content_type = response.headers['Content-Type']
+    finally:
+        server.shutdown()
+
+    assert content_type.startswith('text/plain; version=0.0.4')
+    assert 'up_total 1' in body
@@ -0,0 +1,171 @@
+from datetime import datetime
+
+import pytest
+
+from src import db
+from src.Shop import order_consumer
+from src.Shop.command_status import APPLIED, REJECTED
+from src.Shop.model import Inventory, Orders, Products
+from src.Shop.order_consumer import OrderConsumer
+
+NOW = datetime(2026, 3, 1, 12, 0)
+
+
+@pytest.fixture
+def stock(app):
+    db.session.add(Products(id='p1', name='Widget', price=10, created_at=NOW, updated_at=NOW))
+    db.session.add(Inventory(product_id='p1', quantity=5))
+    db.session.commit()
+
+
+def _consumer(app, **config):
+    app.config.update(config)
+    consumer = OrderConsumer()
+    assert consumer.initialize()
+    return consumer
+
+
+def _order(order_id, quantity=1):
+    return Orders(id=order_id, product_id='p1', quantity=quantity, total_price=10 * quantity,
+                  created_at=NOW, updated_at=NOW)
+
+
+def _create_order_messages(app, *quantities):
+    """Produces a CreateOrderCommand per quantity for p1 and returns the messages as a consumer gets them."""
+    kafka_conn = app.kafka_connection
+    for i, quantity in enumerate(quantities):
+        kafka_conn.produce_message(app.kafka_producer, 'order_commands', {
+            'command_id': f"c{i}",
+            'command_type': 'CreateOrderCommand',
+            'payload': {
+                'order_id': f"o{i}", 'product_id': 'p1', 'quantity': quantity, 'unit_price': 10.0,
+                'total_price': 10 * quantity, 'created_at': '2026-03-01T12:00:00Z', 'updated_at': '2026-03-01T12:00:00Z',
+            },
+        }, key='p1')
+    app.kafka_producer.flush()
+    return kafka_conn.broker.messages('order_commands')
+
+
+@pytest.mark.parametrize('event_mode', ['full', 'lean'])
+def test_order_batch_applies_orders_and_publishes_analytics_events(app, stock, event_mode):
+    consumer = _consumer(app, ORDER_BATCH_SIZE=10, ANALYTICS_EVENT_MODE=event_mode)
+    msgs = _create_order_messages(app, 2, 1, 9)
+
+    consumer.handle_order_batch(msgs)
+    consumer.producer.flush()
+
+    assert sorted(order.id for order in Orders.query) == ['o0', 'o1']
+    assert Inventory.query.filter_by(product_id='p1').one().quantity == 2
+    events = [app.kafka_connection.decode_message(msg) for msg in app.kafka_connection.broker.messages('analytics_events')]
+    assert sorted(event['order_id'] for event in events) == ['o0', 'o1']
+    if event_mode == 'lean':
+        assert {event['price'] for event in events} == {10.0}
+    else:
+        assert {event['product_details']['name'] for event in events} == {'Widget'}
+    consumer.shutdown()
+
+
+def _rejections(app):
+    events = [app.kafka_connection.decode_message(msg) for msg in app.kafka_connection.broker.messages('order_events')]
+    return [(event['order_id'], event['reason']) for event in events if event['event_type'] == 'OrderRejected']
+
+
+def test_oversized_order_is_rejected_with_its_reason(app, stock):
+    consumer = _consumer(app)
+    msgs = _create_order_messages(app, 3, 3)
+
+    for msg in msgs:
+        consumer.handle_order_message(msg)
+    consumer.producer.flush()
+
+    reason = "Insufficient stock for product p1: requested 3, available 2"
+    assert app.command_status.get_status('c0')['status'] == APPLIED
+    assert app.command_status.get_status('c1')['status'] == REJECTED
+    assert app.command_status.get_status('c1')['error'] == reason
+    assert _rejections(app) == [('o1', reason)]
+    assert Inventory.query.filter_by(product_id='p1').one().quantity == 2
+    consumer.shutdown()
+
+
+def test_batch_rejects_the_orders_its_stock_cannot_cover(app, stock):
+    consumer = _consumer(app, ORDER_BATCH_SIZE=10)
+    msgs = _create_order_messages(app, 4, 2, 1)
+
+    consumer.handle_order_batch(msgs)
+    consumer.producer.flush()
+
+    reason = "Insufficient stock for product p1: requested 2, available 1"
+    assert [app.command_status.get_status(f"c{i}")['status'] for i in range(3)] == [APPLIED, REJECTED, APPLIED]
+    assert app.command_status.get_status('c1')['error'] == reason
+    assert _rejections(app) == [('o1', reason)]
+    assert Inventory.query.filter_by(product_id='p1').one().quantity == 0
+    consumer.shutdown()
+
+
+def test_batch_planned_on_stale_stock_never_oversells(app, stock, monkeypatch):
+    consumer = _consumer(app, ORDER_BATCH_SIZE=10)
+    msgs = _create_order_messages(app, 3, 2)
+    # Another consumer takes stock after this batch read it: the bulk decrement fails and the
+    # orders are replayed one by one against the real stock
+    monkeypatch.setattr(order_consumer, 'stock_levels', lambda product_ids: {'p1': 5})
+    Inventory.query.filter_by(product_id='p1').update({'quantity': 4})
+    db.session.commit()
+
+    consumer.handle_order_batch(msgs)
+    consumer.producer.flush()
+
+    assert app.command_status.get_status('c0')['status'] == APPLIED
+    assert app.command_status.get_status('c1')['status'] == REJECTED
+    assert [order.id for order in Orders.query] == ['o0']
+    assert Inventory.query.filter_by(product_id='p1').one().quantity == 1
+    consumer.shutdown()
+
+
+def _break_ledger_writes(consumer, monkeypatch):
+    def broken_write(batch):
+        raise RuntimeError("database is locked")
+    monkeypatch.setattr(consumer.ledger, 'write', broken_write)
+
+
+def test_failing_ledger_flush_backs_off_then_stops_the_consumer(app, stock, monkeypatch):
+    consumer = _consumer(app, ORDER_INVENTORY_MODE='ledger', INVENTORY_FLUSH_MAX_ATTEMPTS=3)
+    waits = []
+    monkeypatch.setattr(consumer.stop_event, 'wait', waits.append)
+    _break_ledger_writes(consumer, monkeypatch)
+
+    for attempt in range(3):
+        consumer.ledger.add_order('c1', _order('o1'))
+        consumer.flush_ledger()
+
+    assert waits == [0.2, 0.4]
+    assert consumer.stop_event.is_set()
+    assert consumer.ledger.pending_count() == 0
+    monkeypatch.undo()
+    consumer.shutdown()
+    assert Orders.query.count() == 0
+
+
+def test_successful_ledger_flush_resets_the_failure_count(app, stock, monkeypatch):
+    consumer = _consumer(app, ORDER_INVENTORY_MODE='ledger', INVENTORY_FLUSH_MAX_ATTEMPTS=2)
+    monkeypatch.setattr(consumer.stop_event, 'wait', lambda timeout: None)
+    write = consumer.ledger.write
+
+    _break_ledger_writes(consumer, monkeypatch)
+    consumer.ledger.add_order('c1', _order('o1'))
+    consumer.flush_ledger()
+
+    monkeypatch.setattr(consumer.ledger, 'write', write)
+    consumer.ledger.load(0, ['p1'])
+    assert consumer.ledger.reserve(0, 'p1', 2)
+    consumer.ledger.add_order('c1', _order('o1', quantity=2))
+    consumer.flush_ledger()
+
+    _break_ledger_writes(consumer, monkeypatch)
+    consumer.ledger.add_order('c2', _order('o2'))
+    consumer.flush_ledger()
+
+    assert not consumer.stop_event.is_set()
+    assert Orders.query.count() == 1
+    assert Inventory.query.filter_by(product_id='p1').one().quantity == 3
+    monkeypatch.undo()
+    consumer.shutdown()
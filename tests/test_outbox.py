@@ -0,0 +1,74 @@
+import pytest
+from confluent_kafka import KafkaError
+
+from benchmarks.fake_kafka import FakeProducer
+from src import db
+from src.Shop.model import OutboxMessages
+from src.Shop.outbox import OutboxRelay, enqueue_message
+
+TOPIC = 'order_events'
+
+
+class FlakyProducer(FakeProducer):
+    """Fails the delivery of messages whose key is in failing."""
+    def __init__(self, broker, failing=()):
+        super().__init__(broker)
+        self.failing = set(failing)
+
+    def produce(self, topic, value=None, key=None, callback=None, **kwargs):
+        def deliver(err, msg):
+            if key and key.decode() in self.failing:
+                err = KafkaError(KafkaError._MSG_TIMED_OUT)
+            callback(err, msg)
+        super().produce(topic, value=value, key=key, callback=deliver, **kwargs)
+
+
+@pytest.fixture
+def relay(app):
+    relay = OutboxRelay(app, app.kafka_connection, max_attempts=2)
+    relay.producer = FlakyProducer(app.kafka_connection.broker)
+    for key in ('a', 'b', 'c'):
+        enqueue_message(TOPIC, {'key': key}, key=key)
+    db.session.commit()
+    return relay
+
+
+def _rows():
+    return {row.message_key: row for row in OutboxMessages.query.order_by(OutboxMessages.id)}
+
+
+def test_relay_marks_acknowledged_rows_sent(relay):
+    assert relay.relay_batch() == 3
+
+    assert all(row.sent_at is not None for row in _rows().values())
+    assert relay.relay_batch() == 0
+
+
+def test_relay_stops_marking_at_the_first_failed_row(relay):
+    relay.producer.failing = {'b'}
+
+    assert relay.relay_batch() == 1
+
+    rows = _rows()
+    assert rows['a'].sent_at is not None
+    # c was acknowledged, but is published again after b to keep the order
+    assert rows['b'].sent_at is None and rows['b'].attempts == 1 and rows['b'].last_error
+    assert rows['c'].sent_at is None and rows['c'].attempts == 0
+
+    relay.producer.failing = set()
+    assert relay.relay_batch() == 2
+    assert all(row.sent_at is not None for row in _rows().values())
+
+
+def test_relay_parks_a_row_after_max_attempts(relay):
+    relay.producer.failing = {'b'}
+
+    assert relay.relay_batch() == 1
+    assert relay.relay_batch() == 0
+
+    rows = _rows()
+    assert rows['b'].attempts == 2 and rows['b'].dead_lettered_at is not None
+    # The parked row no longer holds back the rows after it
+    assert relay.relay_batch() == 1
+    assert _rows()['c'].sent_at is not None
+    assert _rows()['b'].sent_at is None
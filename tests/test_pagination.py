@@ -0,0 +1,68 @@
+import base64
+from datetime import datetime, timedelta
+
+import pytest
+
+from src import db
+from src.Shop.model import Orders, Products
+from src.Shop.pagination import MAX_PER_PAGE, decode_cursor, encode_cursor, keyset_page, page_size
+
+START = datetime(2026, 3, 1, 12, 0)
+
+
+def _b64(raw):
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def test_cursor_round_trips_its_position():
+    created_at = datetime(2026, 3, 1, 12, 0, 0, 123456)
+
+    assert decode_cursor(encode_cursor(created_at, 'o|1')) == (created_at, 'o|1')
+
+
+@pytest.mark.parametrize('cursor', [
+    'not base64!',
+    'äöü',
+    _b64(b'2026-03-01T12:00:00'),
+    _b64(b'yesterday|o1'),
+    _b64(b'\xff\xfe|o1'),
+])
+def test_malformed_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError, match='Invalid cursor'):
+        decode_cursor(cursor)
+
+
+@pytest.mark.parametrize('requested, expected', [(None, 25), (0, 25), (-5, 1), (10, 10), (1000, MAX_PER_PAGE)])
+def test_page_size_is_clamped(requested, expected):
+    assert page_size(requested, 25) == expected
+
+
+@pytest.fixture
+def orders(app):
+    db.session.add(Products(id='p1', name='Widget', price=10, description="Test product",
+                            image_url="uploads/p1.png", created_at=START, updated_at=START))
+    # o3 and o4 share a timestamp, so the id has to break the tie
+    for i, minutes in enumerate((0, 1, 2, 3, 3)):
+        created_at = START + timedelta(minutes=minutes)
+        db.session.add(Orders(id=f"o{i}", product_id='p1', quantity=1, total_price=10,
+                              created_at=created_at, updated_at=created_at))
+    db.session.commit()
+
+
+def test_keyset_pages_cover_every_row_once_newest_first(orders):
+    pages, cursor = [], None
+    while True:
+        rows, cursor = keyset_page(Orders.query, Orders.created_at, Orders.id, cursor, 2,
+                                   lambda order: (order.created_at, order.id))
+        pages.append([order.id for order in rows])
+        if cursor is None:
+            break
+
+    assert pages == [['o4', 'o3'], ['o2', 'o1'], ['o0']]
+
+
+def test_listing_with_a_malformed_cursor_redirects_to_the_first_page(app, orders):
+    response = app.test_client().get('/shop/orders?per_page=2&cursor=garbage')
+
+    assert response.status_code == 302
+    assert response.headers['Location'] == '/shop/orders?per_page=2'
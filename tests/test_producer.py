@@ -0,0 +1,78 @@
+import time
+
+import pytest
+
+from benchmarks.fake_kafka import FakeKafkaConnection
+from src.kafka.delivery import DeliveryStats
+
+TOPIC = 'events'
+
+
+@pytest.fixture
+def kafka_conn():
+    conn = FakeKafkaConnection()
+    conn.broker.create_topic(TOPIC, 1)
+    return conn
+
+
+def test_throughput_profile_is_the_default(kafka_conn, monkeypatch):
+    monkeypatch.delenv('KAFKA_PRODUCER_PROFILE', raising=False)
+
+    config = kafka_conn.get_config('producer')
+
+    assert (config['linger.ms'], config['batch.size'], config['compression.type'], config['enable.idempotence']) == \
+        (20, 262144, 'lz4', True)
+
+
+def test_latency_profile_with_single_overrides(kafka_conn, monkeypatch):
+    monkeypatch.setenv('KAFKA_PRODUCER_PROFILE', 'latency')
+    monkeypatch.setenv('KAFKA_PRODUCER_BATCH_SIZE', '32768')
+    monkeypatch.setenv('KAFKA_PRODUCER_IDEMPOTENCE', 'false')
+
+    config = kafka_conn.get_config('producer')
+
+    assert (config['linger.ms'], config['batch.size'], config['compression.type'], config['enable.idempotence']) == \
+        (0, 32768, 'none', False)
+
+
+def test_unknown_profile_falls_back_to_throughput(kafka_conn, monkeypatch):
+    monkeypatch.setenv('KAFKA_PRODUCER_PROFILE', 'fastest')
+
+    assert kafka_conn.get_config('producer')['linger.ms'] == 20
+
+
+def test_poller_serves_delivery_callbacks_until_the_producer_is_closed(kafka_conn):
+    producer = kafka_conn.create_producer()
+    delivered = []
+
+    assert kafka_conn.produce_message(producer, TOPIC, {'n': 1}, key='k1', on_delivery=lambda err, msg: delivered.append(err))
+    deadline = time.monotonic() + 2
+    while not delivered and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert delivered == [None]
+    assert kafka_conn.delivery_stats.snapshot()['delivered'] == {TOPIC: 1}
+    assert kafka_conn.close_producer(producer) == 0
+    assert not kafka_conn._pollers
+
+
+def test_close_producer_flushes_messages_of_a_producer_without_poller(kafka_conn):
+    producer = kafka_conn.create_producer(start_poller=False)
+    producer.produce(TOPIC, value=b'{}', callback=kafka_conn.delivery_report)
+
+    assert len(producer) == 1
+    assert kafka_conn.close_producer(producer) == 0
+    assert kafka_conn.delivery_stats.snapshot()['delivered'] == {TOPIC: 1}
+
+
+def test_delivery_stats_bucket_latencies_and_count_failures():
+    stats = DeliveryStats()
+    for latency in (0.0005, 0.003, 0.003, 20):
+        stats.record(TOPIC, latency_seconds=latency)
+    stats.record(TOPIC, error='timed out')
+
+    snapshot = stats.snapshot()
+
+    assert snapshot['delivered'] == {TOPIC: 4} and snapshot['failed'] == {TOPIC: 1}
+    assert (snapshot['latency_ms_buckets']['1'], snapshot['latency_ms_buckets']['5'], snapshot['latency_ms_buckets']['+Inf']) == (1, 2, 1)
+    assert snapshot['latency_ms_avg'] == round((0.5 + 3 + 3 + 20000) / 4, 3)
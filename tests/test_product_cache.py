@@ -0,0 +1,69 @@
+from datetime import datetime
+
+import pytest
+
+from src.redis.redis_connection import RedisConnection
+from src.Shop.cache import ProductCache
+
+NOW = datetime(2026, 3, 1, 12, 0)
+
+
+class Loader:
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+@pytest.fixture
+def cache(redis_conn):
+    return ProductCache(redis_conn)
+
+
+def test_listing_is_loaded_once_and_keeps_its_datetimes(cache):
+    loader = Loader([{'id': 'p1', 'created_at': NOW}])
+
+    assert cache.get_product_list(loader, variant='page1') == [{'id': 'p1', 'created_at': NOW}]
+    assert cache.get_product_list(loader, variant='page1') == [{'id': 'p1', 'created_at': NOW}]
+    assert loader.calls == 1
+    assert cache.stats()['list_hit_ratio'] == 0.5
+
+
+def test_invalidating_a_product_drops_every_listing_page_and_its_details(cache, redis_conn):
+    pages = {variant: Loader([variant]) for variant in ('page1', 'page2')}
+    details = Loader({'id': 'p1'})
+    for variant, loader in pages.items():
+        cache.get_product_list(loader, variant=variant)
+    cache.get_product('p1', details)
+
+    cache.invalidate_product('p1')
+    for variant, loader in pages.items():
+        cache.get_product_list(loader, variant=variant)
+    cache.get_product('p1', details)
+
+    assert [loader.calls for loader in pages.values()] == [2, 2]
+    assert details.calls == 2
+    assert redis_conn.get_data(ProductCache.VERSION_KEY) == 1
+
+
+def test_missing_product_is_not_cached(cache):
+    loader = Loader(None)
+
+    cache.get_product('p9', loader)
+    cache.get_product('p9', loader)
+
+    assert loader.calls == 2
+
+
+def test_reads_fall_through_without_redis():
+    cache = ProductCache(RedisConnection(client=None))
+    loader = Loader(['p1'])
+
+    cache.get_product_list(loader)
+    cache.get_product_list(loader)
+    cache.invalidate_product('p1')
+
+    assert loader.calls == 2
@@ -0,0 +1,81 @@
+import time
+
+import pytest
+
+from benchmarks.fake_kafka import FakeKafkaConnection
+from src.analytics.analytics_consumer import Analytics
+from src.analytics.product_table import ProductTable
+
+
+@pytest.fixture
+def kafka_conn():
+    conn = FakeKafkaConnection()
+    for topic, partitions in (('product_events', 2), ('analytics_events', 1)):
+        conn.broker.create_topic(topic, partitions)
+    return conn
+
+
+@pytest.fixture
+def producer(kafka_conn):
+    return kafka_conn.create_producer(start_poller=False)
+
+
+def _upsert(kafka_conn, producer, product_id, name):
+    kafka_conn.produce_message(producer, 'product_events', {
+        'event_type': 'ProductUpserted', 'product_id': product_id, 'name': name, 'price': 10.0, 'image_url': None,
+    }, key=product_id)
+
+
+@pytest.fixture
+def table(kafka_conn):
+    table = ProductTable(kafka_conn, poll_timeout=0.01)
+    yield table
+    table.stop()
+
+
+def _wait_until(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_table_loads_the_latest_state_of_every_product(kafka_conn, producer, table):
+    for product_id, name in (('p1', 'Widget'), ('p2', 'Gadget'), ('p1', 'Widget v2'), ('p3', 'Gizmo')):
+        _upsert(kafka_conn, producer, product_id, name)
+    kafka_conn.produce_tombstone(producer, 'product_events', 'p3')
+
+    assert table.start()
+    assert table.wait_until_loaded(timeout=2)
+
+    assert {product_id: product['name'] for product_id, product in table.products.items()} == \
+        {'p1': 'Widget v2', 'p2': 'Gadget'}
+
+
+def test_table_keeps_following_the_topic_after_loading(kafka_conn, producer, table):
+    assert table.start()
+    assert table.wait_until_loaded(timeout=2)
+
+    _upsert(kafka_conn, producer, 'p1', 'Widget')
+
+    assert _wait_until(lambda: table.get('p1') is not None)
+    assert table.get('p1')['name'] == 'Widget'
+
+
+def test_lean_events_are_joined_against_the_product_table(kafka_conn, producer, table, redis_conn):
+    _upsert(kafka_conn, producer, 'p1', 'Widget')
+    assert table.start()
+    analytics = Analytics(kafka_conn=kafka_conn, config={}, product_table=table, redis_conn=redis_conn)
+    assert analytics.initialize()
+    for order_id, product_id in (('o1', 'p1'), ('o2', 'p9')):
+        kafka_conn.produce_message(producer, 'analytics_events', {
+            'event_type': 'OrderCreated', 'order_id': order_id, 'product_id': product_id, 'price': 10.0,
+            'quantity': 2, 'total_price': 20.0, 'order_created_at': '2026-03-01T12:00:00Z',
+        }, key=order_id)
+
+    analytics.handle_analytics_batch(kafka_conn.broker.messages('analytics_events'))
+
+    # A product missing from the table is still counted, just without its name
+    top = {product['product_id']: product['name'] for product in analytics.aggregates.top_products()}
+    assert top == {'p1': 'Widget', 'p9': None}
+    analytics.shutdown()
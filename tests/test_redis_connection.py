@@ -0,0 +1,115 @@
+import functools
+
+import fakeredis
+import pytest
+import redis
+
+from src.metrics import REDIS_CALL_DURATION
+from src.redis.redis_connection import RedisConnection, TimedRedis
+
+
+def _call_count(command):
+    for name, labels, value in REDIS_CALL_DURATION.collect()[3]:
+        if name.endswith('_count') and labels == {'command': command}:
+            return value
+    return 0
+
+
+def test_mset_and_mget_round_trip_json_values(redis_conn):
+    assert redis_conn.mset_data({'a': {'n': 1}, 'b': 'plain', 'c': [1, 2]})
+
+    assert redis_conn.mget_data(['a', 'missing', 'b', 'c']) == [{'n': 1}, None, 'plain', [1, 2]]
+
+
+def test_mset_with_expiry_sets_a_ttl_on_every_key(redis_conn):
+    assert redis_conn.mset_data({'a': 1, 'b': 2}, ex=60)
+
+    assert 0 < redis_conn.client.ttl('a') <= 60
+    assert 0 < redis_conn.client.ttl('b') <= 60
+
+
+def test_bulk_helpers_handle_empty_input(redis_conn):
+    assert redis_conn.mget_data([]) == []
+    assert redis_conn.mset_data({}) is True
+
+
+def test_bulk_helpers_without_a_client_fail_softly():
+    conn = RedisConnection()
+
+    assert conn.mget_data(['a', 'b']) == [None, None]
+    assert conn.mset_data({'a': 1}) is False
+
+
+def test_pipeline_executes_queued_commands_when_the_block_exits(redis_conn):
+    with redis_conn.pipeline() as pipe:
+        pipe.set('a', '1')
+        pipe.incr('counter', 5)
+
+    assert redis_conn.client.get('a') == '1'
+    assert redis_conn.client.get('counter') == '5'
+
+
+def test_pipeline_returns_replies_of_an_explicit_execute(redis_conn):
+    redis_conn.client.set('a', 'x')
+    with redis_conn.pipeline() as pipe:
+        pipe.get('a')
+        pipe.exists('missing')
+        assert pipe.execute() == ['x', 0]
+
+
+def test_pipeline_discards_queued_commands_when_the_block_raises(redis_conn):
+    with pytest.raises(RuntimeError):
+        with redis_conn.pipeline() as pipe:
+            pipe.set('a', '1')
+            raise RuntimeError("abort")
+
+    assert redis_conn.client.get('a') is None
+
+
+def test_transaction_applies_commands_atomically(redis_conn):
+    with redis_conn.transaction() as pipe:
+        pipe.incr('counter')
+        pipe.incr('counter')
+        assert pipe.execute() == [1, 2]
+
+
+def test_pipeline_without_a_client_raises():
+    with pytest.raises(redis.ConnectionError):
+        with RedisConnection().pipeline():
+            pass
+
+
+def test_timed_redis_records_commands_and_pipelines(redis_server):
+    pool = redis.ConnectionPool(connection_class=fakeredis.FakeRedisConnection, server=redis_server, decode_responses=True)
+    client = TimedRedis(connection_pool=pool)
+    sets, gets, multis, pipelines = _call_count('SET'), _call_count('GET'), _call_count('MULTI'), _call_count('PIPELINE')
+
+    client.set('a', '1')
+    assert client.get('a') == '1'
+    with client.pipeline(transaction=True) as pipe:
+        pipe.incr('b').incr('b')
+        assert pipe.execute() == [1, 2]
+    with client.pipeline(transaction=False) as pipe:
+        pipe.get('b')
+        assert pipe.execute() == ['2']
+
+    assert _call_count('SET') == sets + 1
+    assert _call_count('GET') == gets + 1
+    assert _call_count('MULTI') == multis + 1
+    assert _call_count('PIPELINE') == pipelines + 1
+
+
+def test_connect_builds_a_pooled_timed_client(monkeypatch, redis_server):
+    monkeypatch.setenv('REDIS_MAX_CONNECTIONS', '7')
+    monkeypatch.setattr(redis, 'ConnectionPool', functools.partial(
+        redis.ConnectionPool, connection_class=fakeredis.FakeRedisConnection, server=redis_server
+    ))
+    conn = RedisConnection()
+
+    assert conn.connect()
+    assert isinstance(conn.client, TimedRedis)
+    assert conn.pool.max_connections == 7
+    assert conn.set_data('a', {'n': 1}) and conn.get_data('a') == {'n': 1}
+
+    conn.close()
+    assert conn.client is None and conn.pool is None
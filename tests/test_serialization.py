@@ -0,0 +1,61 @@
+import pytest
+
+from benchmarks.fake_kafka import FakeMessage
+from src.kafka.serialization import CONTENT_TYPE_HEADER, MessageDecodeError, TopicCodecs
+
+msgpack = pytest.importorskip('msgpack')
+
+COMMAND = {'command_id': 'c1', 'payload': {'quantity': 2, 'unit_price': 9.5, 'note': 'häkeln', 'tags': ['a', None]}}
+
+
+def _consumed(value, headers):
+    return FakeMessage('order_commands', 0, 0, value=value, headers=headers)
+
+
+@pytest.mark.parametrize('codec, content_type', [('json', b'application/json'), ('msgpack', b'application/x-msgpack')])
+def test_message_round_trips_through_its_topic_codec(codec, content_type):
+    codecs = TopicCodecs(overrides={'order_commands': codec})
+
+    value, headers = codecs.encode('order_commands', COMMAND)
+
+    assert headers == [(CONTENT_TYPE_HEADER, content_type)]
+    assert codecs.decode(_consumed(value, headers)) == COMMAND
+
+
+def test_topic_overrides_come_from_the_environment(monkeypatch):
+    monkeypatch.setenv('KAFKA_DEFAULT_CODEC', 'json')
+    monkeypatch.setenv('KAFKA_TOPIC_CODECS', ' analytics_events = msgpack ,order_commands=msgpack,broken')
+
+    codecs = TopicCodecs()
+
+    assert codecs.for_topic('analytics_events').name == 'msgpack'
+    assert codecs.for_topic('order_commands').name == 'msgpack'
+    assert codecs.for_topic('product_commands').name == 'json'
+
+
+def test_unknown_codec_falls_back_to_json():
+    assert TopicCodecs(default='avro', overrides={'events': 'protobuf'}).for_topic('events').name == 'json'
+
+
+def test_consumer_reads_either_format_whatever_its_own_topic_codec():
+    json_value, json_headers = TopicCodecs(default='json').encode('order_commands', COMMAND)
+    packed_value, packed_headers = TopicCodecs(default='msgpack').encode('order_commands', COMMAND)
+    reader = TopicCodecs(default='json')
+
+    assert reader.decode(_consumed(json_value, json_headers)) == COMMAND
+    assert reader.decode(_consumed(packed_value, packed_headers)) == COMMAND
+
+
+def test_message_without_content_type_is_read_as_json():
+    assert TopicCodecs().decode(_consumed(b'{"command_id":"c1"}', [('x-retry-attempt', b'1')])) == {'command_id': 'c1'}
+
+
+@pytest.mark.parametrize('value, headers', [
+    (None, None),
+    (b'{not json', None),
+    (b'\xc1', [(CONTENT_TYPE_HEADER, b'application/x-msgpack')]),
+    (b'{}', [(CONTENT_TYPE_HEADER, b'application/avro')]),
+])
+def test_undecodable_message_raises_decode_error(value, headers):
+    with pytest.raises(MessageDecodeError):
+        TopicCodecs().decode(_consumed(value, headers))
@@ -0,0 +1,161 @@
+import threading
+import time
+
+from datetime import datetime
+
+import pytest
+from confluent_kafka import TopicPartition
+
+from src import db
+from src.kafka.supervisor import ConsumerSupervisor, WorkerReporter
+from src.Shop.model import Inventory, Orders, Products
+from src.Shop.order_consumer import OrderConsumer
+
+
+class BlockingConsumer:
+    """Consumes until stop() is called, like the real consumers."""
+    def __init__(self):
+        self.stop_event = threading.Event()
+
+    def start_consuming(self, topic_name, reporter):
+        reporter.on_assign(None, [TopicPartition(topic_name, 0)])
+        self.stop_event.wait()
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class ExitingConsumer:
+    """Returns at once, as a consumer does when it crashes."""
+    starts = []
+
+    def start_consuming(self, topic_name, reporter):
+        ExitingConsumer.starts.append(reporter.worker_name)
+
+    def stop(self):
+        pass
+
+
+class StubbornConsumer(BlockingConsumer):
+    """Ignores stop(), like a worker stuck in a handler."""
+    release = threading.Event()
+
+    def start_consuming(self, topic_name, reporter):
+        StubbornConsumer.release.wait()
+
+
+def _wait_until(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture
+def supervisor(app):
+    supervisor = ConsumerSupervisor(app)
+    yield supervisor
+    supervisor.shutdown(timeout=1)
+
+
+def test_pool_starts_one_worker_per_slot(supervisor):
+    supervisor.add_pool('order_commands', BlockingConsumer, 2)
+    supervisor.add_pool('product_commands', BlockingConsumer, 1)
+
+    supervisor.start()
+
+    assert sorted(supervisor.workers) == ['order_commands-0', 'order_commands-1', 'product_commands-0']
+    assert _wait_until(lambda: all(entry['partitions'] for entry in supervisor.worker_status().values()))
+    assert supervisor.worker_status()['product_commands-0']['partitions'] == ['product_commands[0]']
+
+
+def test_pool_needs_a_worker(supervisor):
+    with pytest.raises(ValueError):
+        supervisor.add_pool('order_commands', BlockingConsumer, 0)
+
+
+def test_exited_worker_is_restarted_after_the_backoff(supervisor):
+    ExitingConsumer.starts = []
+    supervisor.RESTART_BACKOFF_SECONDS = 0.2
+    supervisor.add_pool('order_commands', ExitingConsumer, 1)
+    supervisor.start()
+    worker = supervisor.workers['order_commands-0'][0]
+    assert _wait_until(lambda: not worker.is_alive())
+
+    supervisor.check_workers()
+    assert supervisor.workers['order_commands-0'][0] is worker
+
+    time.sleep(0.2)
+    supervisor.check_workers()
+    assert supervisor.workers['order_commands-0'][0] is not worker
+    assert _wait_until(lambda: ExitingConsumer.starts == ['order_commands-0', 'order_commands-0'])
+
+
+def test_reporter_tracks_assignments_revocations_and_lag():
+    table = {}
+    reporter = WorkerReporter('orders-0', table, lag_interval=0)
+    reporter.on_assign(None, [TopicPartition('orders', 0), TopicPartition('orders', 1)])
+    reporter.report_lag({'orders[0]': 3, 'orders[1]': 4})
+
+    reporter.on_revoke(None, [TopicPartition('orders', 1)])
+
+    assert table['orders-0']['partitions'] == ['orders[0]']
+    assert table['orders-0']['lag'] == {'orders[0]': 3}
+    assert reporter.lag_due()
+
+
+def test_shutdown_stops_every_worker_and_ends_the_restarts(supervisor):
+    supervisor.RESTART_BACKOFF_SECONDS = 0
+    supervisor.add_pool('order_commands', BlockingConsumer, 2)
+    supervisor.start()
+
+    supervisor.shutdown(timeout=2)
+    supervisor.check_workers()
+
+    assert all(consumer.stop_event.is_set() for _, _, _, consumer in supervisor.workers.values())
+    assert not any(worker.is_alive() for worker, _, _, _ in supervisor.workers.values())
+
+
+def test_shutdown_gives_up_on_a_hung_worker_at_the_deadline(supervisor):
+    StubbornConsumer.release.clear()
+    supervisor.add_pool('order_commands', StubbornConsumer, 2)
+    supervisor.add_pool('product_commands', BlockingConsumer, 1)
+    supervisor.start()
+
+    started = time.monotonic()
+    supervisor.shutdown(timeout=0.3)
+    elapsed = time.monotonic() - started
+    StubbornConsumer.release.set()
+
+    # One deadline for all workers, not one per worker
+    assert 0.3 <= elapsed < 0.6
+    assert not supervisor.workers['product_commands-0'][0].is_alive()
+
+
+def test_stopped_order_consumer_writes_its_ledger_and_commits_before_leaving(app, supervisor):
+    now = datetime(2026, 3, 1, 12, 0)
+    db.session.add(Products(id='p1', name='Widget', price=10, created_at=now, updated_at=now))
+    db.session.add(Inventory(product_id='p1', quantity=5))
+    db.session.commit()
+    # Reservations stay in memory until the consumer is stopped
+    app.config.update(ORDER_INVENTORY_MODE='ledger', INVENTORY_FLUSH_INTERVAL_MS=600000, ORDER_BATCH_LINGER_MS=10)
+    kafka_conn = app.kafka_connection
+    for i in range(2):
+        kafka_conn.produce_message(app.kafka_producer, 'order_commands', {
+            'command_id': f"c{i}", 'command_type': 'CreateOrderCommand',
+            'payload': {'order_id': f"o{i}", 'product_id': 'p1', 'quantity': 2, 'unit_price': 10.0, 'total_price': 20,
+                        'created_at': '2026-03-01T12:00:00Z', 'updated_at': '2026-03-01T12:00:00Z'},
+        }, key='p1')
+    app.kafka_producer.flush()
+    supervisor.add_pool('order_commands', OrderConsumer, 1)
+    supervisor.start()
+    consumer = supervisor.workers['order_commands-0'][3]
+    assert _wait_until(lambda: consumer.ledger is not None and consumer.ledger.pending_count() == 2)
+
+    supervisor.shutdown(timeout=5)
+
+    db.session.remove()
+    assert sorted(order.id for order in Orders.query) == ['o0', 'o1']
+    assert Inventory.query.filter_by(product_id='p1').one().quantity == 1
+    partition = kafka_conn.broker.messages('order_commands')[0].partition()
+    assert kafka_conn.broker.committed(kafka_conn.get_group_id('order'), 'order_commands', partition) == 2
@@ -0,0 +1,58 @@
+from benchmarks.fake_kafka import FakeKafkaConnection
+from src.kafka.traffic import TrafficStats
+
+
+def test_skew_counts_registered_partitions_without_traffic():
+    stats = TrafficStats()
+    stats.add_partitions('orders', range(3))
+    for _ in range(6):
+        stats.record('orders', 0, b'hot')
+
+    snapshot = stats.snapshot()['orders']
+    assert snapshot['partition_skew'] == 3.0
+    assert {p: s['messages'] for p, s in snapshot['partitions'].items()} == {0: 6, 1: 0, 2: 0}
+
+
+def test_skew_without_registered_partitions_uses_the_seen_ones():
+    stats = TrafficStats()
+    stats.record('orders', 0)
+    stats.record('orders', 1)
+
+    assert stats.snapshot()['orders']['partition_skew'] == 1.0
+
+
+def test_removed_partitions_no_longer_count():
+    stats = TrafficStats()
+    stats.add_partitions('orders', [0, 1, 2])
+    stats.remove_partitions('orders', [1, 2])
+    stats.record('orders', 0)
+
+    assert stats.snapshot()['orders']['partition_skew'] == 1.0
+
+
+def test_produced_traffic_covers_every_partition_of_the_topic():
+    conn = FakeKafkaConnection()
+    conn.broker.create_topic('orders', 3)
+    producer = conn.create_producer(start_poller=False)
+
+    for _ in range(4):
+        assert conn.produce_message(producer, 'orders', {'n': 1}, key='hot')
+    producer.flush()
+
+    assert conn.produced_traffic.snapshot()['orders']['partition_skew'] == 3.0
+
+
+def test_consumed_traffic_covers_the_assigned_partitions():
+    conn = FakeKafkaConnection()
+    conn.broker.create_topic('orders', 3)
+    conn.broker.append('orders', 2, b'hot', b'{}', None)
+    consumer = conn.create_consumer(role='test')
+    conn.subscibe_to_topic(consumer, 'orders')
+
+    msgs = consumer.consume(num_messages=10, timeout=1)
+    for msg in msgs:
+        conn.consumed_traffic.record(msg.topic(), msg.partition(), msg.key())
+
+    assert len(msgs) == 1
+    assert conn.consumed_traffic.snapshot()['orders']['partition_skew'] == 3.0
+    consumer.close()